@@ -0,0 +1,136 @@
+import hashlib
+import importlib.util
+import os
+import py_compile
+import sys
+import tempfile
+
+from emulator import read_image, sext
+from jit import JitEmulator, BlockTranslator, BLOCK_ARGS, MAX_BLOCK, BR, JSR, TRAP, JMP, RTI, RESERVED
+from objfile import is_object
+
+# bump whenever the generated code changes
+AOT_VERSION = 5
+
+DEFAULT_CACHE = os.path.join(tempfile.gettempdir(), f'aphid-aot-{os.getuid()}')
+
+# loads and stores are translated for the page flags at the time, so they are part of the key
+def image_key(data: bytes, flags): 
+    h = hashlib.sha256()
+    h.update(f'aot:{AOT_VERSION}:{MAX_BLOCK}:'.encode())
+    h.update(bytes(flags))
+    h.update(data)
+    return h.hexdigest()
+
+# addresses a block can continue at, where they are known statically
+def successors(translator): 
+    last = translator.words[-1]
+    opcode = last >> 12
+    pc = translator.end & 0xFFFF
+    if opcode == BR: 
+        nzp = (last >> 9) & 7
+        targets = [(pc + sext(last, 9)) & 0xFFFF] if nzp else []
+        return targets + ([pc] if nzp != 7 else [])
+    if opcode == JSR: 
+        # the call returns to pc
+        return [(pc + sext(last, 11)) & 0xFFFF, pc] if last & 0x800 else [pc]
+    if opcode == TRAP: 
+        return [pc]
+    if opcode in (JMP, RTI, RESERVED): 
+        return []
+    return [pc]
+
+# translators for every block reachable from orig through direct control flow, confined to the
+# image's words. Indirect jumps (JMP, JSRR, RET) land on these blocks through the dispatch dict
+# when their target is one of them, and in the interpreter otherwise.
+def reachable_blocks(memory, flags, orig, end): 
+    blocks = {}
+    pending = [orig]
+    while pending: 
+        start = pending.pop()
+        if start in blocks or not orig <= start < end: 
+            continue
+        translator = BlockTranslator(memory, flags, start, end=end)
+        translator.translate()
+        blocks[start] = translator
+        pending.extend(successors(translator))
+    return dict(sorted(blocks.items()))
+
+def generate_module(memory, flags, orig, end, key): 
+    blocks = reachable_blocks(memory, flags, orig, end)
+    lines = [
+        '# translated from an LC-3 image by aot.py, do not edit', 
+        f'IMAGE_KEY = {key!r}', 
+        f'ORIG = {hex(orig)}', 
+        '', 
+        f'def bind({", ".join(BLOCK_ARGS)}): ', 
+    ]
+    for translator in blocks.values(): 
+        lines.extend(f'    {line}' for line in translator.source().splitlines())
+        lines.append('')
+    lines.append('    # block start -> (function, end)')
+    lines.append('    return {')
+    for start, translator in blocks.items(): 
+        lines.append(f'        {hex(start)}: (block_{start:04x}, {hex(translator.end)}), ')
+    lines.append('    }')
+    return '\n'.join(lines) + '\n'
+
+# imports the translation of an image from cache_dir, generating it first if needed. The module
+# is byte-compiled when it is written (even if bytecode writing is turned off) and imported from
+# its file, so later runs only unmarshal the .pyc in __pycache__.
+def load_module(memory, flags, orig, end, data, cache_dir=DEFAULT_CACHE): 
+    key = image_key(data, flags)
+    name = f'lc3_{key[:32]}'
+    path = os.path.join(cache_dir, name + '.py')
+    if not os.path.exists(path): 
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f: 
+            f.write(generate_module(memory, flags, orig, end, key))
+        os.replace(tmp, path)
+        py_compile.compile(path, doraise=True)
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# JitEmulator whose images come with all their statically reachable blocks compiled ahead of time;
+# they are installed like JIT blocks, so stores into them drop them the same way. Blocks that
+# span a breakpoint are left out, to be compiled split at it by the JIT.
+class AotEmulator(JitEmulator): 
+    def __init__(self, verbose=True, cache_dir=DEFAULT_CACHE, **options): 
+        super().__init__(verbose, **options)
+        self.cache_dir = cache_dir
+
+    # objects can have several segments; they are left to the JIT
+    def load_image(self, filename): 
+        if is_object(filename): 
+            return super().load_image(filename)
+        words = read_image(filename)
+        orig = words[0]
+        self.load(words[1:], orig)
+        self.pc = orig
+
+        module = load_module(self.memory, self.page_flags, orig, orig + len(words) - 1, words.tobytes(), self.cache_dir)
+        blocks = module.bind(*self.block_env())
+        for start, (block, block_end) in blocks.items(): 
+            if not any(self.breakpoints[start:block_end]): 
+                self.install(start, block_end, block)
+        self.log(f'[ INFO ] Loaded {len(blocks)} precompiled blocks for {filename}')
+        return orig
+
+def main(): 
+    if len(sys.argv) < 2 or '-h' in sys.argv or '--help' in sys.argv: 
+        print('$ python aot.py {program.lc3} [cache dir]')
+        sys.exit(1)
+
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CACHE
+    words = read_image(sys.argv[1])
+    emulator = JitEmulator(verbose=False)
+    emulator.load(words[1:], words[0])
+    module = load_module(emulator.memory, emulator.page_flags, words[0], words[0] + len(words) - 1, words.tobytes(), cache_dir)
+    print(module.__file__)
+
+if __name__ == '__main__': 
+    main()
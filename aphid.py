@@ -0,0 +1,29 @@
+import sys
+
+COMMANDS = {
+    'assemble': ('assembler', 'assemble one file'), 
+    'batch': ('batch', 'assemble many files in a worker pool'), 
+    'link': ('linker', 'link assembled modules into one image'), 
+    'dis': ('disassembler', 'list or diff an image or object'), 
+    'run': ('emulator', 'run an assembled .lc3 image'), 
+    'debug': ('debugger', 'run an image under the debugger'), 
+    'serve': ('server', 'keep a warm assembler running on a Unix socket'), 
+    'bench': ('bench', 'benchmark the assembler and emulator'), 
+}
+
+def usage(): 
+    print('$ python aphid.py {command} [args]')
+    for name, (_, description) in COMMANDS.items(): 
+        print(f'  {name:<10} {description}')
+
+def main(): 
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS: 
+        usage()
+        sys.exit(1)
+
+    module = __import__(COMMANDS[sys.argv[1]][0])
+    sys.argv = [f'{sys.argv[0]} {sys.argv[1]}', *sys.argv[2:]]
+    module.main()
+
+if __name__ == '__main__': 
+    main()
@@ -1,63 +1,80 @@
 import sys 
-import math 
-
-from instruction import (
-    opcode_str_to_int, hex_str_to_int, Instruction, AddInstruction, AndInstruction, NotInstruction, LdrInstruction, 
-    JmpInstruction, RtiInstruction, StrInstruction, TrapInstruction, OrigInstruction, FillInstruction, 
-    JsrInstruction, JsrrInstruction, LdInstruction, LdiInstruction, LeaInstruction, 
-    StInstruction, StiInstruction, BrInstruction
-)
-
-def validate_register(value):
-    return isinstance(value, str) and len(value) == 2 and value[0] == 'r' and int(value[1]) < 8
-
-def validate_decimal(value, bits): 
-    if not isinstance(value, str) or len(value) > 4 or value[0] != '#': 
-        return False 
-    
-    idx = 1
-    sign = 1
-    if value[idx] == '-': 
-        sign = -1 
-        idx += 1
-    num = sign * int(value[idx:])
-    return -2**(bits-1) <= num <= 2**(bits-1)-1
-
-def validate_hex(value, bits): 
-    if not isinstance(value, str) or value[0] != 'x' or len(value[1:]) > math.ceil(bits / 4): 
-        return False 
-    
-    try: 
-        _ = int(value[1:], base=16)
-    except Exception as ex: 
-        print(f'[ ERROR ] Failed to parse value as hex: {ex}') 
-        return False 
-    return True 
-
-def parse_register(value): 
-    return int(value[1])
 
-def parse_decimal(value): 
-    return int(value[1:])
+from instruction import SPECS, Instruction, OperandKind, spec_table
+from ir import InstructionStore
+from encoder import encode_regions, place_regions, materialize, region_length, write_image
+from errors import AssemblerError
+from lexer import tokenize, Token, TokenKind
+
+# token kinds accepted for each kind of operand in the spec table
+OPERAND_TOKENS = {
+    OperandKind.REGISTER: { TokenKind.REGISTER }, 
+    OperandKind.IMMEDIATE: { TokenKind.DECIMAL, TokenKind.HEX }, 
+    OperandKind.OFFSET: { TokenKind.LABEL, TokenKind.DECIMAL, TokenKind.HEX }, 
+    OperandKind.VECTOR: { TokenKind.HEX, TokenKind.DECIMAL }, 
+    OperandKind.VALUE: { TokenKind.DECIMAL, TokenKind.HEX }, 
+    OperandKind.COUNT: { TokenKind.DECIMAL, TokenKind.HEX }, 
+    OperandKind.STRING: { TokenKind.STRING }, 
+}
+
+def parse_number(token: Token): 
+    if token.kind == TokenKind.DECIMAL: 
+        return int(token.value[1:])
+    return int(token.value[1:], base=16)
+
+# (mnemonic, token kinds) -> matching spec form, or None if the operands fit no form
+form_cache = {}
+
+def match_form(forms, tokens): 
+    signature = (tokens[0].value, *[token.kind for token in tokens[1:]])
+    if signature in form_cache: 
+        return form_cache[signature]
+
+    spec = None
+    operands = tokens[1::2]
+    commas = tokens[2::2]
+    if all(comma.kind == TokenKind.COMMA for comma in commas): 
+        for form in forms: 
+            if len(operands) != len(form.fields): 
+                continue 
+            if all(token.kind in OPERAND_TOKENS[field.kind] for field, token in zip(form.fields, operands)): 
+                spec = form
+                break
 
-def parse_hex(value): 
-    return hex_str_to_int(value[1:])
+    form_cache[signature] = spec
+    return spec 
 
 class Assembler: 
-    def __init__(self, filename): 
+    def __init__(self, filename, verbose=True, source=None, module=False): 
         self.filename = filename 
-        self.lines = []
+        self.verbose = verbose
         self.symbol_table = {}
+        # with module set, labels declared .external, and (pc, bits, label, line) for each use of one
+        self.module = module
+        self.externals = set()
+        self.relocations = []
+        # address of the first .orig; pc counts words from it
+        self.origin = None
         self.pc = 0 
-        with open(filename, 'r') as f: 
-            self.contents = f.read()
+        if source is not None: 
+            self.contents = source
+        else: 
+            with open(filename, 'r') as f: 
+                self.contents = f.read()
 
-        print(f'[ INFO ] Input file: {filename}')
+        self.log(f'[ INFO ] Input file: {filename}')
+
+    def log(self, *args): 
+        if self.verbose: 
+            print(*args)
 
     def parse(self): 
         self.first_pass()
         self.second_pass()
 
+        if not self.verbose: 
+            return 
+
         # print('[ DEBUG ] Parsed Lines: ')
         # for line in self.lines: 
         #     print(line)
@@ -69,406 +86,247 @@ class Assembler:
         print()
 
         print('[ DEBUG ] Instructions:')
-        for i, t in enumerate(self.instructions):
+        for i, t in enumerate(self.instructions): 
             print(f'{i} - {t.__repr__()}')
         print()
 
     def encode(self): 
         output_fn = self.filename[:-2] + '.lc3'
+        self.image = materialize(self.encode_regions())
         with open(output_fn, 'wb') as f: 
-            for instruction in self.instructions:
-                try: 
-                    f.write(instruction.encode())
-                except NotImplementedError: 
-                    pass 
-
-        print(f'Successfully wrote bytes to {output_fn}')
-
+            write_image(f, self.image)
+
+        self.log(f'Successfully wrote bytes to {output_fn}')
+
+    # the program's memory regions in address order; see encoder.encode_regions
+    def encode_regions(self): 
+        if self.origin is None: 
+            return []
+        self.regions = place_regions(encode_regions(self.instructions, self.origin)[0])
+        return self.regions
+
+    # write a relocatable module for the linker instead of an image
+    def encode_object(self): 
+        from objfile import ObjectModule, write_object
+
+        store = self.instructions
+        if len(store) == 0 or SPECS[store.spec[0]].mnemonic != '.orig': 
+            raise AssemblerError('a module must start with .orig')
+        regions = self.encode_regions()
+        if max((region.addr + region_length(region) for region in regions), default=0) > 0x10000: 
+            raise AssemblerError('module runs past the end of memory')
+        output_fn = self.filename[:-2] + '.obj'
+        write_object(output_fn, ObjectModule.build(self.filename, regions, self.origin, self.symbol_table, self.relocations, store.line))
+        self.log(f'Successfully wrote module to {output_fn}')
+
+    # tokenize and parse every line into the instruction store, deferring label operands until
+    # the symbol table is complete
     def first_pass(self): 
-        lines = self.contents.split('\n')
+        store = self.instructions = InstructionStore()
+        for spec, values, refs, line_no in self.parse_lines(tokenize(self.contents)): 
+            store.append(spec, values, refs, line_no)
+
+    # generator over (spec, values, refs, line) records for each instruction line, recording label
+    # definitions in the symbol table along the way
+    def parse_lines(self, token_lines): 
+        self.ended = False
         pc = 0 
-        for idx, line in enumerate(lines): 
-            pc_inc = 1
-            processed = line.split(';')[0].lower().strip()
-
+        for line_no, tokens in token_lines: 
             # check for label
-            colon_idx = processed.find(':')
-            if colon_idx >= 0: 
-                symbol = processed[:colon_idx]
-                if symbol not in self.symbol_table: 
-                    self.symbol_table[symbol] = pc
-                else: 
-                    print(f'[ ERROR ] Found duplicate label definition during first pass: {symbol}')
-                    sys.exit(3)
-
-                # remove symbol from start of line and strip any leading whitespace 
-                processed = processed[colon_idx+1:].strip()
-
-            # skip any lines that only have whitespace/comments
-            if len(processed) == 0: 
+            if tokens[0].kind == TokenKind.LABEL_DEF: 
+                # a label on an .orig line names the address the .orig moves to
+                if len(tokens) > 1 and tokens[1].value == '.orig': 
+                    spec, values, refs = self.parse_operands(tokens[1:])
+                    pc = self.advance(spec, values, pc)
+                self.define_label(tokens[0], pc)
+
+                # remove symbol from start of line 
+                tokens = tokens[1:]
+
+            # skip any lines that only have a label
+            if len(tokens) == 0: 
                 continue 
 
-            if processed.startswith('.orig'): 
-                pc_inc = 0 
-
-            if processed.startswith('.end'): 
+            if tokens[0].value == '.end': 
+                self.ended = True
                 break 
 
-            if processed.startswith('.blkw'): 
-                pc_inc = 1 # add pc with operand
-
-            # push processed line and inc PC if line is a valid instruction
-            self.lines.append(processed + ' ')
-            pc += pc_inc
-
+            if tokens[0].value == '.external': 
+                self.declare_externals(tokens)
+                continue
+
+            spec, values, refs = self.parse_operands(tokens)
+            if self.origin is None and spec.mnemonic != '.orig': 
+                self.missing_origin(tokens[0])
+            yield spec, values, refs, line_no
+
+            pc = pc + 1 if spec.size == 1 else self.advance(spec, values, pc)
+
+    # a line with words before any .orig, which has nowhere to go
+    def missing_origin(self, token): 
+        raise AssemblerError('no .orig before the first instruction', token.line, token.col)
+
+    # .external NAME[, NAME ...] declares labels defined in other modules; uses of them are left
+    # for the linker to fill in
+    def declare_externals(self, tokens): 
+        if not self.module: 
+            raise AssemblerError('.external is only allowed when assembling a module (--module)', tokens[0].line, tokens[0].col)
+        names = tokens[1::2]
+        if not names or any(token.kind != TokenKind.LABEL for token in names) or any(token.kind != TokenKind.COMMA for token in tokens[2::2]): 
+            raise AssemblerError(f'.external: expected label names: {[t.value for t in tokens[1:]]}', tokens[0].line, tokens[0].col)
+        self.externals.update(token.value for token in names)
+
+    # pc after a line. pc counts words from the first .orig, so a later .orig sets it to the
+    # distance from that one, and .blkw/.stringz move it past the words they reserve.
+    def advance(self, spec, values, pc): 
+        if spec.mnemonic != '.orig': 
+            return pc + spec.words(values)
+        if self.origin is None: 
+            self.origin = values[0]
+        return values[0] - self.origin
+
+    def define_label(self, token, pc): 
+        if token.value in self.symbol_table: 
+            raise AssemblerError(f'Found duplicate label definition during first pass: {token.value}', token.line, token.col, code=3)
+        self.symbol_table[token.value] = pc
+
+    # resolve the PC-relative label operands left behind by the first pass
     def second_pass(self):
-        self.instructions = []
-        for line in self.lines:
-            tokens = []
-            curr_word_start_idx = 0 
-            for idx in range(len(line)): 
-                if line[idx] in {' ', '/t', ','}: 
-                    if curr_word_start_idx == idx: 
-                        curr_word_start_idx = idx + 1
-                        continue 
-
-                    tokens.append(line[curr_word_start_idx:idx])
-                    curr_word_start_idx = idx + 1
-
-                    if line[idx] == ',': 
-                        tokens.append(line[idx])
-
-            # print('[ DEBUG ] Tokens:')
-            # for i, t in enumerate(tokens):
-            #     print(f'{i} - {t}')
-            # print()
-            if tokens[0] == '.end': 
-                break 
-
-            new_instruction = self.parse_instruction(tokens)
-            self.instructions.append(new_instruction)
+        self.pc = 0 
+        self.resolve(self.instructions)
 
-            # increment pc based on instruction
-            if new_instruction.__class__ not in { OrigInstruction }: 
-                self.pc += 1 
+    # resolve label operands in a store whose first instruction sits at self.pc
+    def resolve(self, store): 
+        spec_ids, refs, lines = store.spec, store.refs, store.line
+        for idx in range(len(store)): 
+            spec = SPECS[spec_ids[idx]]
+            if refs[idx]: 
+                for slot, field in enumerate(spec.fields): 
+                    if refs[idx] & (1 << slot): 
+                        label = store.labels[store.operands[slot][idx]]
+                        store.set_operand(idx, slot, self.resolve_label(spec, field, label, self.pc, lines[idx]))
 
-            if len(self.instructions) == 1 and self.instructions[0]: 
-                pass
+            self.pc = self.pc + 1 if spec.size == 1 else self.advance(spec, store.values(idx), self.pc)
 
     def parse_instruction(self, tokens) -> Instruction:  
-        # directives 
-        if tokens[0] == '.orig': 
-            return self.parse_orig(tokens)
-        elif tokens[0] == '.fill': 
-            return self.parse_fill(tokens)
-        elif tokens[0] == '.blkw': 
-            pass 
-        elif tokens[0] == '.external': 
-            pass
-        elif tokens[0] == '.stringz': 
-            pass 
-
-        # instruction
-        elif tokens[0] == 'add': 
-            return self.parse_add(tokens)
-        elif tokens[0] == 'and': 
-            return self.parse_and(tokens) 
-        elif tokens[0].startswith('br'): 
-            return self.parse_br(tokens) 
-        elif tokens[0] in { 'jmp', 'ret' }: 
-            return self.parse_jmp_ret(tokens) 
-        elif tokens[0] == 'jsr': 
-            return self.parse_jsr(tokens) 
-        elif tokens[0] == 'jsrr': 
-            return self.parse_jsrr(tokens) 
-        elif tokens[0] == 'ld': 
-            return self.parse_ld(tokens)  
-        elif tokens[0] == 'ldi': 
-            return self.parse_ldi(tokens) 
-        elif tokens[0] == 'ldr': 
-            return self.parse_ldr(tokens) 
-        elif tokens[0] == 'lea': 
-            return self.parse_lea(tokens) 
-        elif tokens[0] == 'not': 
-            return self.parse_not(tokens) 
-        elif tokens[0] == 'rti': 
-            return RtiInstruction(opcode_str_to_int['rti']) 
-        elif tokens[0] == 'st': 
-            return self.parse_st(tokens) 
-        elif tokens[0] == 'sti': 
-            return self.parse_sti(tokens) 
-        elif tokens[0] == 'str': 
-            return self.parse_str(tokens) 
-        elif tokens[0] == 'trap': 
-            return self.parse_trap(tokens) 
-        
-
-        print(f'[ ERROR ] Unknown opcode encountered when parsing tokens: {tokens}')
-        sys.exit(2)
-
-    def parse_nzp(suffix): 
-        if suffix[0] == 'n': 
-            N = True
-        elif suffix[0] == 'z': 
-            Z = True 
-            if len(suffix) > 1 and suffix[1] == 'p': 
-                P = True
-        elif suffix[0] == 'p': 
-            P = True
-
-    def parse_br(self, tokens) -> Instruction: 
-        nzp_list = [False, False, False]
-        if len(tokens[0]) > 2: 
-            suffix = tokens[0][2:]
-            last_idx = -1
-            for i in range(len(suffix)):
-                encountered_idx = -1
-                match suffix[i]:
-                    case 'n': encountered_idx = 0
-                    case 'z': encountered_idx = 1
-                    case 'p': encountered_idx = 2
-                if encountered_idx <= last_idx: 
-                    print(f'[ ERROR ] BrInstruction: failed to parse nzp: {tokens}')
-                    sys.exit(2)
-                nzp_list[encountered_idx] = True
-
-        if not any(nzp_list): 
-            nzp_list = [ True, True, True ]
-
-        return BrInstruction(
-            opcode=opcode_str_to_int['br'], 
-            n = 1 if nzp_list[0] else 0, 
-            z = 1 if nzp_list[1] else 0, 
-            p = 1 if nzp_list[2] else 0,
-            offset=self.symbol_table[tokens[1]] - (self.pc + 1)
-        )
-
-    def parse_orig(self, tokens) -> Instruction: 
-        is_decimal = validate_decimal(tokens[1], 16)
-        if not is_decimal and not validate_hex(tokens[1], 16): 
-            print(f'[ ERROR ] OrigInstruction: failed to parse addr operand: {tokens[1]}')
-
-        return OrigInstruction(
-            opcode_str_to_int['directive'], 
-            addr = parse_decimal(tokens[1]) if is_decimal else parse_hex(tokens[1])
-        )
-
-    def parse_fill(self, tokens) -> Instruction: 
-        if not validate_hex(tokens[1], 16): 
-            print(f'[ ERROR ] FillInstruction: failed to parse operand: {tokens[1]}')
-            sys.exit(2) 
-
-        return FillInstruction(
-            opcode_str_to_int['directive'], 
-            value = int(tokens[1][1:], base=16)
-        )
-
-    def parse_add(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or not validate_register(tokens[3]):
-            print(f'[ ERROR ] AddInstruction: failed to parse dr or sr1: {tokens[1], tokens[3]}')
-            sys.exit(2)
-        
-        if tokens[2] != ',' or tokens[4] != ',': 
-            print(f'[ ERROR ] AddInstruction: failed to parse commas: {tokens[2], tokens[4]}')
-            sys.exit(2) 
-
-        is_sr2 = validate_register(tokens[5]) 
-        if not is_sr2 and not validate_decimal(tokens[5], 5): 
-            print(f'[ ERROR ] AddInstruction: failed to parse sr2 or imm5: {tokens[5]}')
-            sys.exit(2)
-
-        return AddInstruction(
-            opcode_str_to_int['add'], 
-            dr = parse_register(tokens[1]), 
-            sr1 = parse_register(tokens[3]), 
-            sr2 = parse_register(tokens[5]) if is_sr2 else None, 
-            imm = parse_decimal(tokens[5]) if not is_sr2 else None
-        )
-
-    def parse_and(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or not validate_register(tokens[3]):
-            print(f'[ ERROR ] AndInstruction: failed to parse dr or sr1: {tokens[1], tokens[3]}')
-            sys.exit(2)
-        
-        if tokens[2] != ',' or tokens[4] != ',': 
-            print(f'[ ERROR ] AndInstruction: failed to parse commas: {tokens[2], tokens[4]}')
-            sys.exit(2) 
-
-        is_sr2 = validate_register(tokens[5]) 
-        if not is_sr2 and not validate_decimal(tokens[5], 5): 
-            print(f'[ ERROR ] AndInstruction: failed to parse sr2 or imm5: {tokens[5]}')
-            sys.exit(2)
-
-        return AndInstruction(
-            opcode_str_to_int['and'], 
-            dr = parse_register(tokens[1]), 
-            sr1 = parse_register(tokens[3]), 
-            sr2 = parse_register(tokens[5]) if is_sr2 else None, 
-            imm = parse_decimal(tokens[5]) if not is_sr2 else None
-        )
-
-    def parse_jmp_ret(self, tokens) -> Instruction: 
-        if tokens[0] == 'ret': 
-            tokens.append('r7')
-
-        if not validate_register(tokens[1]):
-            print(f'[ ERROR ] JmpInstruction: failed to parse base register: {tokens[1]}')
-            sys.exit(2)
-
-        return JmpInstruction(
-            opcode_str_to_int['jmp'], 
-            base_reg = parse_register(tokens[1])
-        )
-
-    def parse_jsr(self, tokens) -> Instruction:
-        if tokens[1] not in self.symbol_table: 
-            print(f'[ ERROR ] JsrInstruction: Invalid label provided: {tokens[1]}')
-            sys.exit(2)
-
-        return JsrInstruction(
-            opcode=opcode_str_to_int['jsr'], 
-            offset=self.symbol_table[tokens[1]] - (self.pc + 1) 
-        )
-    
-    def parse_jsrr(self, tokens) -> Instruction:
-        if not validate_register(tokens[1]): 
-            print(f'[ ERROR ] JsrInstruction: failed to parse base register: {tokens[1]}')
-            sys.exit(1)
-            
-        return JsrrInstruction(
-            opcode=opcode_str_to_int['jsrr'], 
-            base_reg=parse_register(tokens[1])
-        )
-
-    def parse_ld(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or tokens[2] != ',' or tokens[3] not in self.symbol_table: 
-            print(f'[ ERROR ] LdInstruction: Invalid tokens provided: {tokens[1:]}')
-            sys.exit(2)
-
-        return LdInstruction(
-            opcode=opcode_str_to_int['ld'], 
-            dr=parse_register(tokens[1]), 
-            offset=self.symbol_table[tokens[3]] - (self.pc + 1) 
-        ) 
-
-    def parse_ldi(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or tokens[2] != ',' or tokens[3] not in self.symbol_table: 
-            print(f'[ ERROR ] LdiInstruction: Invalid tokens provided: {tokens[1:]}')
-            sys.exit(2)
-
-        return LdiInstruction(
-            opcode=opcode_str_to_int['ldi'], 
-            dr=parse_register(tokens[1]), 
-            offset=self.symbol_table[tokens[3]] - (self.pc + 1) 
-        ) 
-
-    def parse_lea(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or tokens[2] != ',' or tokens[3] not in self.symbol_table: 
-            print(f'[ ERROR ] LeaInstruction: Invalid tokens provided: {tokens[1:]}')
-            sys.exit(2)
-
-        return LeaInstruction(
-            opcode=opcode_str_to_int['lea'], 
-            dr=parse_register(tokens[1]), 
-            offset=self.symbol_table[tokens[3]] - (self.pc + 1) 
-        ) 
-
-    # LDR R4, R2, #-5
-    def parse_ldr(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or not validate_register(tokens[3]) or not validate_decimal(tokens[5], 6):
-            print(f'[ ERROR ] LdrInstruction: failed to parse dr, base_reg, or offset6: {tokens[1], tokens[3]}')
-            sys.exit(2)
-        
-        if tokens[2] != ',' or tokens[4] != ',': 
-            print(f'[ ERROR ] LdrInstruction: failed to parse commas: {tokens[2], tokens[4]}')
-            sys.exit(2) 
-
-        return LdrInstruction(
-            opcode_str_to_int['ldr'], 
-            dr = parse_register(tokens[1]), 
-            base_reg = parse_register(tokens[3]), 
-            offset = parse_decimal(tokens[5])
-        )
+        spec, values, refs = self.parse_operands(tokens)
+        for slot, field in enumerate(spec.fields): 
+            if refs & (1 << slot): 
+                values[slot] = self.resolve_label(spec, field, values[slot], self.pc, tokens[0].line)
+        return spec.build(values)
+
+    def resolve_label(self, spec, field, label, pc, line) -> int: 
+        if label not in self.symbol_table and label in self.externals: 
+            self.relocations.append((pc, field.bits, label, line))
+            return 0
+        if label not in self.symbol_table: 
+            raise AssemblerError(f'{spec.cls.__name__}: Invalid label provided: {label}', line)
+
+        offset = self.symbol_table[label] - (pc + 1)
+        if not field.min <= offset <= field.max: 
+            raise AssemblerError(f'{spec.cls.__name__}: {label} is out of range of a {field.bits}-bit offset: {offset}', line)
+        return offset
+
+    # one dict lookup picks the forms for a mnemonic, then operands are validated and parsed in one go.
+    # Label operands are returned by name with their slot flagged in the `refs` bitmask.
+    def parse_operands(self, tokens): 
+        first = tokens[0]
+        forms = spec_table.get(first.value)
+        if forms is None: 
+            raise AssemblerError(f'Unknown opcode encountered when parsing tokens: {[t.value for t in tokens]}', first.line, first.col)
+
+        spec = match_form(forms, tokens)
+        if spec is None: 
+            raise AssemblerError(f'{forms[0].cls.__name__}: failed to parse operands: {[t.value for t in tokens[1:]]}', first.line, first.col)
+
+        values = []
+        refs = 0
+        for slot, (field, token) in enumerate(zip(spec.fields, tokens[1::2])): 
+            if token.kind == TokenKind.REGISTER: 
+                values.append(int(token.value[1]))
+                continue 
 
-    # NOT R4, R2
-    def parse_not(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or not validate_register(tokens[3]):
-            print(f'[ ERROR ] NotInstruction: failed to parse dr, sr: {tokens[1], tokens[3]}')
-            sys.exit(2)
-        
-        if tokens[2] != ',': 
-            print(f'[ ERROR ] NotInstruction: failed to parse commas: {tokens[2]}')
-            sys.exit(2) 
-
-        return NotInstruction(
-            opcode_str_to_int['not'], 
-            dr = parse_register(tokens[1]), 
-            sr = parse_register(tokens[3])
-        )
+            if token.kind == TokenKind.LABEL: 
+                values.append(token.value)
+                refs |= 1 << slot
+                continue 
 
-    def parse_st(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or tokens[2] != ',' or tokens[3] not in self.symbol_table: 
-            print(f'[ ERROR ] StInstruction: Invalid tokens provided: {tokens[1:]}')
-            sys.exit(2)
-
-        return StInstruction(
-            opcode=opcode_str_to_int['st'], 
-            dr=parse_register(tokens[1]), 
-            offset=self.symbol_table[tokens[3]] - (self.pc + 1) 
-        ) 
-
-    def parse_sti(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or tokens[2] != ',' or tokens[3] not in self.symbol_table: 
-            print(f'[ ERROR ] StiInstruction: Invalid tokens provided: {tokens[1:]}')
-            sys.exit(2)
-
-        return StiInstruction(
-            opcode=opcode_str_to_int['sti'], 
-            dr=parse_register(tokens[1]), 
-            offset=self.symbol_table[tokens[3]] - (self.pc + 1) 
-        )
+            if token.kind == TokenKind.STRING: 
+                values.append(token.value)
+                continue 
 
-    # STR R4, R2, #-5
-    def parse_str(self, tokens) -> Instruction: 
-        if not validate_register(tokens[1]) or not validate_register(tokens[3]) or not validate_decimal(tokens[5], 6):
-            print(f'[ ERROR ] StrInstruction: failed to parse dr, base_reg, or offset6: {tokens[1], tokens[3]}')
-            sys.exit(2)
-        
-        if tokens[2] != ',' or tokens[4] != ',': 
-            print(f'[ ERROR ] StrInstruction: failed to parse commas: {tokens[2], tokens[4]}')
-            sys.exit(2) 
-
-        return StrInstruction(
-            opcode_str_to_int['str'], 
-            dr = parse_register(tokens[1]), 
-            base_reg = parse_register(tokens[3]), 
-            offset = parse_decimal(tokens[5])
-        )
+            value = parse_number(token)
+            if field.kind == OperandKind.COUNT and value == 0: 
+                raise AssemblerError(f'{spec.cls.__name__}: {field.name} must be at least 1', token.line, token.col)
+            if not field.min <= value <= field.max: 
+                raise AssemblerError(f'{spec.cls.__name__}: {field.name} out of range for {field.bits} bits: {token.value}', token.line, token.col)
 
-    # TRAP x23
-    def parse_trap(self, tokens) -> Instruction: 
-        if not validate_hex(tokens[1], 8):
-            print(f'[ ERROR ] TrapInstruction: failed to vector: {tokens[1]}')
-            sys.exit(2)
+            if field.kind == OperandKind.VALUE: 
+                value &= field.mask
+            values.append(value)
 
-        return TrapInstruction(
-            opcode_str_to_int['trap'], 
-            vector = parse_hex(tokens[1])
-        )
+        return spec, values, refs
 
 def usage(): 
     print('$ python assembler.py {filename}')
     print('  -o | --output [filename]')
+    print('  -s | --stream       assemble in constant memory')
+    print('  -1 | --one-pass     encode in a single pass, backpatching forward references')
+    print('  -c | --cache [dir]  reuse results from previous runs stored in dir')
+    print('  -j | --jobs [n]     parse and encode in n worker processes')
+    print('  -m | --module       write a relocatable module (.obj) for linker.py')
+    print('  --cache-size [MB]   evict least recently used cache records past this size (default 64)')
     print('  -h | --help')
 
+def create_assembler(filename, stream=False, one_pass=False, cache_dir=None, cache_size=64, jobs=None, module=False, verbose=True) -> Assembler: 
+    if module: 
+        return Assembler(filename, verbose, module=True)
+    if cache_dir is not None: 
+        from cache import open_cache, CachedAssembler
+        return CachedAssembler(filename, open_cache(cache_dir, cache_size << 20), verbose=verbose)
+    if jobs is not None: 
+        from parallel import ParallelAssembler
+        return ParallelAssembler(filename, jobs, verbose=verbose)
+    if one_pass: 
+        from onepass import OnePassAssembler
+        return OnePassAssembler(filename, verbose=verbose)
+    if stream: 
+        from stream import StreamingAssembler
+        return StreamingAssembler(filename, verbose=verbose)
+    return Assembler(filename, verbose)
+
+def option(*names, default=None): 
+    for name in names: 
+        if name in sys.argv: 
+            idx = sys.argv.index(name)
+            if idx + 1 < len(sys.argv): 
+                return sys.argv[idx + 1]
+    return default
+
 def main(): 
     if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2: 
         usage()
         sys.exit(1)
 
-    assembler = Assembler(sys.argv[1])
-    assembler.parse()
-    assembler.encode()
+    module = '-m' in sys.argv or '--module' in sys.argv
+    try: 
+        assembler = create_assembler(
+            sys.argv[1], 
+            stream='-s' in sys.argv or '--stream' in sys.argv, 
+            one_pass='-1' in sys.argv or '--one-pass' in sys.argv, 
+            cache_dir=option('-c', '--cache'), 
+            cache_size=int(option('--cache-size', default='64')), 
+            jobs=int(option('-j', '--jobs', default='0')) or None, 
+            module=module, 
+        )
+        assembler.parse()
+        if module: 
+            assembler.encode_object()
+        else: 
+            assembler.encode()
+    except AssemblerError as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(ex.code)
 
     print('Successfully exited Aphid Assember ... ')
 
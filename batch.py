@@ -0,0 +1,113 @@
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import create_assembler
+from errors import AssemblerError
+
+# files, globs and @manifest files (one path or glob per line, # for comments) -> unique paths
+def expand_inputs(args): 
+    paths = []
+    for arg in args: 
+        if arg.startswith('@'): 
+            with open(arg[1:], 'r') as f: 
+                entries = [line.strip() for line in f]
+            paths.extend(expand_inputs([entry for entry in entries if entry and not entry.startswith('#')]))
+        elif glob.has_magic(arg): 
+            paths.extend(sorted(glob.glob(arg, recursive=True)))
+        else: 
+            paths.append(arg)
+    return list(dict.fromkeys(paths))
+
+# runs in a worker: every outcome becomes a report entry so one bad file can't stop the batch
+def assemble_file(job): 
+    filename, options = job
+    result = { 'file': filename, 'output': filename[:-2] + '.lc3' }
+    start = time.perf_counter()
+    try: 
+        assembler = create_assembler(filename, verbose=False, **options)
+        assembler.parse()
+        assembler.encode()
+        result['status'] = 'ok'
+    except AssemblerError as ex: 
+        result.update(status='error', error=ex.message, line=ex.line, col=ex.col)
+    except Exception as ex: 
+        result.update(status='crash', error=f'{type(ex).__name__}: {ex}')
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+def run_batch(paths, workers=None, **options) -> dict: 
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    jobs = [(path, options) for path in paths]
+    with ProcessPoolExecutor(workers) as pool: 
+        results = list(pool.map(assemble_file, jobs, chunksize=max(1, len(jobs) // (8 * workers))))
+
+    ok = sum(1 for result in results if result['status'] == 'ok')
+    summary = {
+        'files': len(results),
+        'ok': ok,
+        'failed': len(results) - ok,
+        'workers': workers,
+        'seconds': round(time.perf_counter() - start, 6),
+    }
+    return { 'summary': summary, 'results': results }
+
+def usage(): 
+    print('$ python batch.py {files, globs or @manifest ...}')
+    print('  -j | --jobs [n]       worker processes (default: one per CPU)')
+    print('  -r | --report [file]  write the JSON report to file instead of stdout')
+    print('  -s | --stream         assemble each file in constant memory')
+    print('  -1 | --one-pass       encode each file in a single pass')
+    print('  -c | --cache [dir]    reuse results from previous runs stored in dir')
+    print('  --cache-size [MB]     cache size limit (default 64)')
+    print('  -h | --help')
+
+def main(): 
+    args = sys.argv[1:]
+    if '-h' in args or '--help' in args or len(args) == 0: 
+        usage()
+        sys.exit(1)
+
+    names = { '-j': 'jobs', '--jobs': 'jobs', '-r': 'report', '--report': 'report', '-c': 'cache', '--cache': 'cache', '--cache-size': 'cache_size' }
+    values = {}
+    inputs = []
+    options = { 'stream': False, 'one_pass': False }
+    idx = 0
+    while idx < len(args): 
+        arg = args[idx]
+        if arg in names and idx + 1 < len(args): 
+            values[names[arg]] = args[idx + 1]
+            idx += 2
+            continue
+
+        if arg in { '-s', '--stream' }: 
+            options['stream'] = True
+        elif arg in { '-1', '--one-pass' }: 
+            options['one_pass'] = True
+        else: 
+            inputs.append(arg)
+        idx += 1
+
+    if 'cache' in values: 
+        options['cache_dir'] = values['cache']
+    if 'cache_size' in values: 
+        options['cache_size'] = int(values['cache_size'])
+
+    report = run_batch(expand_inputs(inputs), int(values.get('jobs', 0)) or None, **options)
+    output = json.dumps(report, indent=2)
+    if 'report' in values: 
+        with open(values['report'], 'w') as f: 
+            f.write(output + '\n')
+        summary = report['summary']
+        print(f"Assembled {summary['ok']}/{summary['files']} files in {summary['seconds']:.3f}s ({summary['failed']} failed)")
+    else: 
+        print(output)
+
+    sys.exit(0 if report['summary']['failed'] == 0 else 2)
+
+if __name__ == '__main__': 
+    main()
@@ -0,0 +1,351 @@
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from assembler import Assembler, option
+from console import Console
+from emulator import Emulator
+from encoder import materialize
+from errors import AssemblerError, EmulatorError
+from instruction import OperandKind, spec_table
+
+BENCH_VERSION = 1
+
+# relative weight of each mnemonic in generated sources; every mnemonic in the spec table has
+# one, and a mnemonic with several forms (ADD/AND with a register or an imm5) picks one at random
+DEFAULT_MIX = {
+    'add': 12, 'and': 6, 'not': 3,
+    'br': 2, 'brn': 2, 'brz': 3, 'brp': 3, 'brnz': 2, 'brnp': 3, 'brzp': 2, 'brnzp': 1,
+    'ld': 4, 'ldi': 2, 'ldr': 5, 'lea': 3, 'st': 3, 'sti': 2, 'str': 4,
+    'jmp': 1, 'ret': 1, 'jsr': 2, 'jsrr': 1, 'rti': 1, 'trap': 1,
+    '.fill': 2, '.blkw': 1, '.stringz': 1,
+}
+# placed by the generator itself, not drawn from the mix
+FRAMING = { '.orig' }
+
+# a label every LABEL_EVERY lines, and label operands at most WINDOW lines away. The widest line
+# is a .stringz of MAX_STRING characters, so WINDOW lines always fit a 9-bit offset.
+LABEL_EVERY = 8
+WINDOW = 24
+MAX_STRING = 8
+MAX_BLKW = 4
+# share of label operands that point forward, still undefined when the line is parsed
+FORWARD = 0.75
+
+def parse_mix(text) -> dict: 
+    mix = dict(DEFAULT_MIX)
+    for entry in text.split(','): 
+        mnemonic, _, weight = entry.partition('=')
+        mnemonic = mnemonic.strip().lower()
+        if mnemonic not in mix: 
+            raise ValueError(f'unknown mnemonic in mix: {mnemonic!r}')
+        mix[mnemonic] = float(weight)
+    return mix
+
+# Seeded source of about `lines` instruction lines. Labels sit on every LABEL_EVERY-th line (and
+# the last), and PC-relative operands refer to a label within WINDOW lines, mostly ahead, so pass 2
+# has a dense set of forward references to resolve. The same seed and mix give the same source.
+def generate(lines, seed=0, mix=None) -> str: 
+    mix = DEFAULT_MIX if mix is None else mix
+    missing = set(spec_table) - set(mix) - FRAMING
+    if missing: 
+        raise ValueError(f'mix has no weight for {", ".join(sorted(missing))}')
+    rng = random.Random(seed)
+    mnemonics = [mnemonic for mnemonic, weight in mix.items() if weight > 0]
+    weights = [mix[mnemonic] for mnemonic in mnemonics]
+    labels = [idx for idx in range(lines) if idx % LABEL_EVERY == 0 or idx == lines - 1]
+
+    def target(idx): 
+        ahead = labels[bisect_right(labels, idx):bisect_right(labels, idx + WINDOW)]
+        behind = labels[bisect_left(labels, idx - WINDOW):bisect_left(labels, idx)]
+        if ahead and (rng.random() < FORWARD or not behind): 
+            return f'L{rng.choice(ahead)}'
+        if behind: 
+            return f'L{rng.choice(behind)}'
+        return f'L{idx}'
+
+    def operand(field, idx): 
+        kind = field.kind
+        if kind == OperandKind.REGISTER: 
+            return f'R{rng.randrange(8)}'
+        if kind == OperandKind.IMMEDIATE: 
+            return f'#{rng.randint(field.min, field.max)}'
+        if kind == OperandKind.OFFSET: 
+            return target(idx) if rng.random() < 0.9 else f'#{rng.randint(-16, 16)}'
+        if kind == OperandKind.VECTOR: 
+            return f'x{rng.randint(0x20, 0x25):X}'
+        if kind == OperandKind.VALUE: 
+            return f'x{rng.getrandbits(16):04X}' if rng.random() < 0.5 else f'#{rng.randint(-32768, 32767)}'
+        if kind == OperandKind.COUNT: 
+            return f'#{rng.randint(1, MAX_BLKW)}'
+        return '"' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(rng.randint(0, MAX_STRING))) + '"'
+
+    out = [f'; generated by bench.py: {lines} lines, seed {seed}', '.ORIG x3000']
+    for idx, mnemonic in enumerate(rng.choices(mnemonics, weights, k=lines)): 
+        spec = rng.choice(spec_table[mnemonic])
+        text = mnemonic.upper()
+        if spec.fields: 
+            text += ' ' + ', '.join(operand(field, idx) for field in spec.fields)
+        if idx % LABEL_EVERY == 0 or idx == lines - 1: 
+            text = f'L{idx}: {text}'
+        else: 
+            text = '    ' + text
+        if rng.random() < 0.1: 
+            text += '  ; comment'
+        out.append(text)
+    out.append('.END')
+    return '\n'.join(out) + '\n'
+
+# standard kernels for emulator MIPS: a counted loop, a block copy and a recursive Fibonacci. Each
+# ends in TRAP x25 and leaves a result to check.
+KERNELS = {
+    'loop': ('''
+.ORIG x3000
+    AND R0, R0, #0
+    LD R1, OUTER
+OUTER_LOOP: LD R2, INNER
+INNER_LOOP: ADD R0, R0, #1
+    ADD R2, R2, #-1
+    BRp INNER_LOOP
+    ADD R1, R1, #-1
+    BRp OUTER_LOOP
+    ST R0, RESULT
+    TRAP x25
+OUTER: .FILL #200
+INNER: .FILL #1000
+RESULT: .FILL #0
+''', 'result', (200 * 1000) & 0xFFFF),
+    'memcpy': ('''
+.ORIG x3000
+    LD R5, PASSES
+PASS: LD R0, SRC
+    LD R1, DST
+    LD R2, COUNT
+COPY: LDR R3, R0, #0
+    STR R3, R1, #0
+    ADD R0, R0, #1
+    ADD R1, R1, #1
+    ADD R2, R2, #-1
+    BRp COPY
+    ADD R5, R5, #-1
+    BRp PASS
+    LDR R4, R1, #-1
+    ST R4, RESULT
+    TRAP x25
+PASSES: .FILL #16
+SRC: .FILL x3000
+DST: .FILL x5000
+COUNT: .FILL x2000
+RESULT: .FILL #0
+''', 'result', None),
+    'recursion': ('''
+.ORIG x3000
+    LD R6, STACK
+    LD R0, N
+    JSR FIB
+    ST R1, RESULT
+    TRAP x25
+FIB: ADD R6, R6, #-1
+    STR R7, R6, #0
+    ADD R2, R0, #-2
+    BRzp RECURSE
+    ADD R1, R0, #0
+    BR DONE
+RECURSE: ADD R6, R6, #-1
+    STR R0, R6, #0
+    ADD R0, R0, #-1
+    JSR FIB
+    LDR R0, R6, #0
+    STR R1, R6, #0
+    ADD R0, R0, #-2
+    JSR FIB
+    LDR R2, R6, #0
+    ADD R6, R6, #1
+    ADD R1, R1, R2
+DONE: LDR R7, R6, #0
+    ADD R6, R6, #1
+    RET
+STACK: .FILL xF000
+N: .FILL #20
+RESULT: .FILL #0
+''', 'result', 6765),
+}
+
+def peak_rss_kb(): 
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def best_of(repeats, run): 
+    return min(run() for _ in range(repeats))
+
+# runs in a fresh worker process so peak RSS belongs to this one case. Each pass is timed on its
+# own (best of repeats) with a new Assembler; encode writes the image to a temporary directory.
+def bench_assembler(case): 
+    lines, seed, mix, repeats = case
+    source = generate(lines, seed, mix)
+    times = { 'first_pass': [], 'second_pass': [], 'encode': [] }
+    with tempfile.TemporaryDirectory() as directory: 
+        filename = os.path.join(directory, f'bench{lines}.s')
+        for _ in range(repeats): 
+            assembler = Assembler(filename, verbose=False, source=source)
+            start = time.perf_counter()
+            assembler.first_pass()
+            times['first_pass'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            assembler.second_pass()
+            times['second_pass'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            assembler.encode()
+            times['encode'].append(time.perf_counter() - start)
+
+    result = { 'lines': lines, 'words': len(assembler.image) - 1 }
+    for phase, seconds in times.items(): 
+        result[phase] = { 'seconds': round(min(seconds), 6), 'lines_per_second': round(lines / min(seconds)) }
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+def bench_kernel(name, repeats, emulator_class=Emulator): 
+    source, label, expected = KERNELS[name]
+    assembler = Assembler(f'{name}.s', verbose=False, source=source)
+    assembler.first_pass()
+    assembler.second_pass()
+    image = materialize(assembler.encode_regions())
+    result_addr = image[0] + assembler.symbol_table[label]
+
+    def run(): 
+        emulator = emulator_class(verbose=False, console=Console.from_bytes(b'', output=io.BytesIO()))
+        emulator.load(image[1:], image[0])
+        emulator.pc = image[0]
+        emulator.run()
+        if not emulator.halted: 
+            raise EmulatorError(f'kernel {name} did not halt', emulator.pc)
+        if expected is not None and emulator.memory[result_addr] != expected: 
+            raise EmulatorError(f'kernel {name} left {emulator.memory[result_addr]} instead of {expected}', emulator.pc)
+        return emulator.seconds, emulator.steps
+
+    seconds, steps = best_of(repeats, run)
+    return { 'kernel': name, 'steps': steps, 'seconds': round(seconds, 6), 'mips': round(steps / seconds / 1e6, 4) }
+
+def run_benchmarks(sizes, seed=0, mix=None, repeats=5, jit=False) -> dict: 
+    results = {
+        'version': BENCH_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'mix': mix or DEFAULT_MIX,
+        'repeats': repeats,
+        'assembler': [],
+        'emulator': [],
+    }
+    for lines in sizes: 
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool: 
+            results['assembler'].append(pool.submit(bench_assembler, (lines, seed, mix, repeats)).result())
+
+    modes = [('interpreter', Emulator)]
+    if jit: 
+        from jit import JitEmulator
+        modes.append(('jit', JitEmulator))
+    for mode, emulator_class in modes: 
+        for name in KERNELS: 
+            result = bench_kernel(name, repeats, emulator_class)
+            result['mode'] = mode
+            results['emulator'].append(result)
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+# (name, value, higher is better) for every metric of a run, keyed so runs with different sizes
+# or kernels only compare what they share
+def metrics(results): 
+    for case in results['assembler']: 
+        for phase in ('first_pass', 'second_pass', 'encode'): 
+            yield f"{phase}@{case['lines']}", case[phase]['lines_per_second'], True
+        yield f"peak_rss_kb@{case['lines']}", case['peak_rss_kb'], False
+    for case in results['emulator']: 
+        yield f"mips:{case['kernel']}@{case.get('mode', 'interpreter')}", case['mips'], True
+
+# metrics that got worse than baseline by more than threshold (a fraction), as (name, old, new,
+# change) with change signed so that negative is worse
+def compare(results, baseline, threshold=0.1) -> list: 
+    old = { name: (value, higher) for name, value, higher in metrics(baseline) }
+    rows = []
+    for name, value, higher in metrics(results): 
+        if name not in old or not old[name][0]: 
+            continue
+        change = (value - old[name][0]) / old[name][0]
+        if not higher: 
+            change = -change
+        rows.append((name, old[name][0], value, change, change < -threshold))
+    return rows
+
+def usage(): 
+    print('$ python bench.py [-o results.json] [-c baseline.json]')
+    print('  -l | --lines [n,n,...]     sizes of the generated sources (default 1000,10000,100000)')
+    print('  -s | --seed [n]            generator seed (default 0)')
+    print('  -m | --mix [op=w,...]      change the weight of mnemonics, e.g. br=10,.stringz=0')
+    print('  -r | --repeats [n]         runs per measurement, best is kept (default 5)')
+    print('  -j | --jit                 also run the kernels with the JIT')
+    print('  -o | --output [file]       write the JSON results to file instead of stdout')
+    print('  -c | --compare [file]      flag metrics that regressed against an earlier run')
+    print('  -t | --threshold [pct]     allowed slowdown before a metric is flagged (default 10)')
+    print('  -g | --generate [n]        print a generated source of n lines and exit')
+    print('  -h | --help')
+
+def main(): 
+    if '-h' in sys.argv or '--help' in sys.argv: 
+        usage()
+        sys.exit(1)
+
+    try: 
+        seed = int(option('-s', '--seed', default='0'))
+        mix_text = option('-m', '--mix')
+        mix = parse_mix(mix_text) if mix_text is not None else None
+        generate_lines = option('-g', '--generate')
+        if generate_lines is not None: 
+            sys.stdout.write(generate(int(generate_lines), seed, mix))
+            return
+
+        sizes = [int(size) for size in option('-l', '--lines', default='1000,10000,100000').split(',')]
+        repeats = int(option('-r', '--repeats', default='5'))
+        threshold = float(option('-t', '--threshold', default='10')) / 100
+        baseline = None
+        baseline_fn = option('-c', '--compare')
+        if baseline_fn is not None: 
+            with open(baseline_fn, 'r') as f: 
+                baseline = json.load(f)
+        results = run_benchmarks(sizes, seed, mix, repeats, jit='-j' in sys.argv or '--jit' in sys.argv)
+    except (AssemblerError, EmulatorError, OSError, ValueError) as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(getattr(ex, 'code', 1))
+
+    output = json.dumps(results, indent=2)
+    output_fn = option('-o', '--output')
+    if output_fn is not None: 
+        with open(output_fn, 'w') as f: 
+            f.write(output + '\n')
+        for case in results['assembler']: 
+            print(f"{case['lines']:>8} lines: first pass {case['first_pass']['lines_per_second']:>9} lines/s, second pass {case['second_pass']['lines_per_second']:>9} lines/s, encode {case['encode']['lines_per_second']:>10} lines/s, peak RSS {case['peak_rss_kb']} KB")
+        for case in results['emulator']: 
+            print(f"{case['kernel']:>9} ({case['mode']}): {case['steps']} steps, {case['mips']:.2f} MIPS")
+    elif baseline is None: 
+        print(output)
+
+    if baseline is None: 
+        return
+    regressions = 0
+    for name, old, new, change, regressed in compare(results, baseline, threshold): 
+        regressions += regressed
+        print(f"{'[ REGRESSION ]' if regressed else '[ OK ]':<14} {name:<28} {old:>12} -> {new:<12} {change:+.1%}")
+    sys.exit(2 if regressions else 0)
+
+if __name__ == '__main__': 
+    main()
@@ -0,0 +1,154 @@
+import functools
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from array import array
+
+from assembler import Assembler
+from chunks import parse_chunk, split_chunks, define_chunk_labels, patch_chunk
+from encoder import write_image
+from errors import AssemblerError
+
+# bump whenever parsing or encoding changes what a cached record means
+CACHE_VERSION = 3
+
+def content_key(kind, text: str): 
+    h = hashlib.sha256()
+    # records hold native-order arrays and marshal data, so both are part of the key
+    h.update(f'{kind}:{CACHE_VERSION}:{sys.byteorder}:{sys.version_info[:2]}:'.encode())
+    h.update(text.encode())
+    return h.hexdigest()
+
+# directory of marshalled records named by content key, trimmed to max_bytes by evicting the
+# least recently used records (hits bump the record's mtime)
+class AssemblyCache: 
+    def __init__(self, directory, max_bytes=64 << 20): 
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.sizes = {}
+        for entry in os.scandir(directory): 
+            if entry.name.endswith('.rec'): 
+                self.sizes[entry.name[:-4]] = entry.stat().st_size
+        self.total = sum(self.sizes.values())
+
+    def path(self, key): 
+        return os.path.join(self.directory, key + '.rec')
+
+    def get(self, key): 
+        path = self.path(key)
+        try: 
+            with open(path, 'rb') as f: 
+                record = marshal.loads(f.read())
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError): 
+            return None
+        return record
+
+    def put(self, key, record): 
+        data = marshal.dumps(record)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f: 
+            f.write(data)
+        os.replace(tmp, self.path(key))
+
+        self.total += len(data) - self.sizes.get(key, 0)
+        self.sizes[key] = len(data)
+        self.evict()
+
+    def evict(self): 
+        if self.total <= self.max_bytes: 
+            return
+
+        def mtime(key): 
+            try: 
+                return os.stat(self.path(key)).st_mtime
+            except OSError: 
+                return 0
+
+        for key in sorted(self.sizes, key=mtime): 
+            if self.total <= self.max_bytes: 
+                break
+            try: 
+                os.remove(self.path(key))
+            except OSError: 
+                pass
+            self.total -= self.sizes.pop(key)
+
+# one AssemblyCache per directory and process, so batch workers don't rescan the directory per file
+@functools.lru_cache(maxsize=None)
+def open_cache(directory, max_bytes=64 << 20) -> AssemblyCache: 
+    return AssemblyCache(directory, max_bytes)
+
+# Assembler backed by an AssemblyCache. A whole-file hit skips assembly entirely. Otherwise the
+# source is split into chunks (see chunks.py) whose records are looked up by content hash, so only
+# edited chunks are tokenized and parsed again. Label references keep the offset they were last
+# encoded with, and only those whose offset changed (because the target moved relative to the
+# use) are re-encoded.
+class CachedAssembler(Assembler): 
+    def __init__(self, filename, cache: AssemblyCache, chunk_lines=256, verbose=True): 
+        super().__init__(filename, verbose)
+        self.cache = cache
+        self.chunk_lines = chunk_lines
+        self.hits = 0
+        self.misses = 0
+        self.reencoded = 0
+
+    def parse(self): 
+        file_key = content_key('file', self.contents)
+        image = self.cache.get(file_key)
+        if image is not None: 
+            self.image = array('H')
+            self.image.frombytes(image)
+            self.log('[ INFO ] Cache hit for whole file')
+            return
+
+        self.first_pass()
+        self.second_pass()
+        self.cache.put(file_key, self.image.tobytes())
+        self.log(f'[ INFO ] Cache: {self.hits} chunk hits, {self.misses} misses, {self.reencoded} re-encoded instructions')
+
+    def encode(self): 
+        output_fn = self.filename[:-2] + '.lc3'
+        with open(output_fn, 'wb') as f: 
+            write_image(f, self.image)
+
+        self.log(f'Successfully wrote bytes to {output_fn}')
+
+    def first_pass(self): 
+        lines = self.contents.split('\n')
+        self.chunks = []
+        pc = 0
+        for start, end in split_chunks(lines, self.chunk_lines): 
+            text = '\n'.join(lines[start:end])
+            key = content_key('chunk', text)
+            record = self.cache.get(key)
+            dirty = record is None
+            if dirty: 
+                # records are keyed by content alone, so their lines count from the chunk's start
+                try: 
+                    record = parse_chunk(text)
+                except AssemblerError as ex: 
+                    raise AssemblerError(ex.message, None if ex.line is None else start + ex.line, ex.col, ex.code) from None
+                self.misses += 1
+            else: 
+                self.hits += 1
+
+            define_chunk_labels(self, record, pc, start)
+            self.chunks.append((key, record, pc, start, dirty))
+            pc += record[0]
+            if record[1]: 
+                break
+
+    def second_pass(self): 
+        self.image = array('H')
+        for key, record, base_pc, start, dirty in self.chunks: 
+            words, offsets, reencoded = patch_chunk(self, record, base_pc, start)
+            if dirty or reencoded: 
+                self.cache.put(key, (*record[:4], words.tobytes(), record[5], offsets.tobytes(), *record[7:]))
+            if not dirty: 
+                self.reencoded += reencoded
+            self.image.extend(words)
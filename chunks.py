@@ -0,0 +1,156 @@
+import zlib
+from array import array
+
+from assembler import Assembler
+from encoder import encode_image, string_words, BOUNDARIES
+from errors import AssemblerError
+from instruction import SPECS
+from ir import InstructionStore
+from lexer import tokenize, Token, TokenKind
+
+# A chunk is a run of source lines assembled on its own, with PCs relative to the chunk. Its
+# record is a tuple of plain values (so it can be marshalled or sent to another process):
+#   (pc count, ended at .end, label names, label defs, words, ref rows, ref offsets, .origs,
+#    (line, col) of the first word before any .orig or ())
+# Label operands are encoded as 0 and described by one ref row each, to be patched once the
+# chunk's base PC and the full symbol table are known. Words are the chunk's memory in order, with
+# .blkw and .stringz expanded; .origs are (line, address) pairs, since a chunk on its own can't
+# place an .orig after the first one. Words ahead of the chunk's .orig are only an error in the
+# chunk that holds the program's first words, so its position is kept for define_chunk_labels.
+
+# ints per ref row: word idx, spec id, 3 operands, ref mask, pc and line within the chunk
+REF_ROW = 8
+
+# parses one chunk with PCs relative to the chunk, collecting its label definitions
+class ChunkParser(Assembler): 
+    def __init__(self): 
+        self.symbol_table = {}
+        self.module = False
+        self.externals = set()
+        self.relocations = []
+        self.origin = None
+        self.pc = 0
+        self.defs = []
+        self.first_word = ()
+
+    def define_label(self, token, pc): 
+        super().define_label(token, pc)
+        self.defs.append((token.value, pc, token.line, token.col))
+
+    # the origin is only known once the chunks are put together; any value stops the check for
+    # the rest of the chunk
+    def missing_origin(self, token): 
+        self.first_word = (token.line, token.col)
+        self.origin = 0
+
+def parse_chunk(text, first_line=1): 
+    parser = ChunkParser()
+    store = InstructionStore()
+    for spec, values, refs, line_no in parser.parse_lines(tokenize(text, first_line)): 
+        store.append(spec, values, refs, line_no)
+
+    rows = array('i')
+    origs = []
+    pc = 0
+    # position in words, which has the .orig's word and .blkw/.stringz expanded
+    pos = 0
+    for idx in range(len(store)): 
+        spec = SPECS[store.spec[idx]]
+        refs = store.refs[idx]
+        if refs: 
+            rows.extend((pos, spec.id, *store.values(idx), *[0] * (3 - len(spec.fields)), refs, pc, store.line[idx]))
+            for slot in range(len(spec.fields)): 
+                if refs & (1 << slot): 
+                    store.set_operand(idx, slot, 0)
+        if spec.size == 1: 
+            pc += 1
+            pos += 1
+        elif spec.mnemonic == '.orig': 
+            origs.append((store.line[idx], store.operands[0][idx]))
+            pos += 1
+        else: 
+            size = spec.words(store.values(idx))
+            pc += size
+            pos += size
+
+    offsets = array('i', bytes(4 * 3 * (len(rows) // REF_ROW)))
+    words = expand_words(store, encode_image(store))
+    return (pc, parser.ended, store.labels, parser.defs, words.tobytes(), rows.tobytes(), offsets.tobytes(), origs, parser.first_word)
+
+# the store's words with .blkw and .stringz expanded in place
+def expand_words(store, words): 
+    flags = store.spec.tobytes().translate(BOUNDARIES)
+    idx = flags.find(1)
+    if idx == -1 or flags.count(1) == 1 and SPECS[store.spec[idx]].mnemonic == '.orig': 
+        return words
+    expanded = array('H')
+    start = 0
+    while idx != -1: 
+        expanded.extend(words[start:idx])
+        spec = SPECS[store.spec[idx]]
+        if spec.mnemonic == '.orig': 
+            expanded.append(words[idx])
+        elif spec.mnemonic == '.blkw': 
+            expanded.frombytes(bytes(2 * store.operands[0][idx]))
+        else: 
+            expanded.extend(string_words(store.strings[store.operands[0][idx]]))
+        start = idx + 1
+        idx = flags.find(1, start)
+    expanded.extend(words[start:])
+    return expanded
+
+# content-defined chunk boundaries: a chunk ends after a line whose hash has its low bits clear,
+# so inserting or deleting lines only changes the chunk around the edit instead of shifting every
+# boundary after it. chunk_lines must be a power of two.
+def split_chunks(lines, chunk_lines): 
+    mask = chunk_lines - 1
+    start = 0
+    for idx, line in enumerate(lines): 
+        size = idx + 1 - start
+        if size >= chunk_lines // 4 and (zlib.crc32(line.encode()) & mask == 0 or size >= 4 * chunk_lines): 
+            yield start, idx + 1
+            start = idx + 1
+    if start < len(lines): 
+        yield start, len(lines)
+
+# add the chunk's label definitions to the assembler's symbol table
+def define_chunk_labels(assembler, record, base_pc, line_base=0): 
+    if assembler.origin is None and record[8]: 
+        line, col = record[8]
+        raise AssemblerError('no .orig before the first instruction', line_base + line, col)
+    for line, addr in record[7]: 
+        if assembler.origin is not None: 
+            raise AssemblerError('more than one .orig block needs the plain assembler (no --jobs or --cache)', line_base + line)
+        assembler.origin = addr
+    for name, rel_pc, rel_line, col in record[3]: 
+        assembler.define_label(Token(TokenKind.LABEL_DEF, name, line_base + rel_line, col), base_pc + rel_pc)
+
+# patch the chunk's label operands for its base PC, returning (words, offsets, re-encoded count).
+# Only references whose offset differs from the one recorded in the chunk are re-encoded.
+def patch_chunk(assembler, record, base_pc, line_base=0): 
+    labels, word_bytes, row_bytes, offset_bytes = record[2], *record[4:7]
+    words, rows, offsets = array('H'), array('i'), array('i')
+    words.frombytes(word_bytes)
+    rows.frombytes(row_bytes)
+    offsets.frombytes(offset_bytes)
+
+    reencoded = 0
+    for row in range(len(rows) // REF_ROW): 
+        idx, spec_id, v0, v1, v2, refs, rel_pc, rel_line = rows[row * REF_ROW:(row + 1) * REF_ROW]
+        spec = SPECS[spec_id]
+        values = [v0, v1, v2][:len(spec.fields)]
+        moved = False
+        for slot, field in enumerate(spec.fields): 
+            if not refs & (1 << slot): 
+                continue
+            offset = assembler.resolve_label(spec, field, labels[values[slot]], base_pc + rel_pc, line_base + rel_line)
+            if offset != offsets[3 * row + slot]: 
+                offsets[3 * row + slot] = offset
+                moved = True
+            values[slot] = offset
+
+        if moved: 
+            words[idx] = spec.encode(values)
+            reencoded += 1
+
+    return words, offsets, reencoded
@@ -0,0 +1,50 @@
+import sys
+
+# Buffered console for the emulator's native TRAP services. Output collects in memory and is
+# written in one call when the buffer fills, before blocking for input, and when the emulator
+# stops. Input is read from the stream in large blocks and handed out a character at a time.
+class Console: 
+    def __init__(self, input=None, output=None, block_size=1 << 16): 
+        self.input = input if input is not None else sys.stdin.buffer
+        self.output = output if output is not None else sys.stdout.buffer
+        self.block_size = block_size
+        self.pending = bytearray()
+        self.buffered = bytearray()
+        self.pos = 0
+        self.eof = False
+
+    @classmethod
+    def from_bytes(cls, data: bytes, output=None): 
+        console = cls(input=None, output=output)
+        console.buffered = bytearray(data)
+        console.eof = True
+        return console
+
+    def write(self, data: bytes): 
+        self.pending += data
+        if len(self.pending) >= self.block_size: 
+            self.flush()
+
+    def flush(self): 
+        if not self.pending: 
+            return
+        self.output.write(self.pending)
+        self.output.flush()
+        self.pending.clear()
+
+    # next input character, or None at end of input
+    def read(self): 
+        if self.pos == len(self.buffered): 
+            if self.eof: 
+                return None
+            self.flush()
+            data = self.input.read1(self.block_size) if hasattr(self.input, 'read1') else self.input.read(self.block_size)
+            if not data: 
+                self.eof = True
+                return None
+            self.buffered = bytearray(data)
+            self.pos = 0
+
+        char = self.buffered[self.pos]
+        self.pos += 1
+        return char
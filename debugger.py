@@ -0,0 +1,256 @@
+import re
+import sys
+
+from console import Console
+from emulator import create_emulator, option, CC_BITS, COND, MEMORY_SIZE, WATCH_PAGE, WATCH_READ, WATCH_WRITE
+from errors import EmulatorError
+from snapshot import PAGE_SHIFT, PAGE_WORDS
+
+# names a breakpoint condition can use besides Python operators: registers, memory, the
+# condition codes and LC-3 style literals
+CONDITION_NAMES = re.compile(r'\b(?:[rR]([0-7])|mem|([nzp])|[xX]([0-9a-fA-F]+))\b|#(-?\d+)')
+
+WATCH_MODES = { 'r': WATCH_READ, 'w': WATCH_WRITE, 'rw': WATCH_READ | WATCH_WRITE }
+
+CC_FLAGS = { 'n': 4, 'z': 2, 'p': 1 }
+
+# 'r0 == x10 and mem[r6] != #0' -> function(reg, memory), built once when the breakpoint is set
+def compile_condition(text): 
+    def name(match): 
+        register, flag, hex_value, decimal = match.groups()
+        if register is not None: 
+            return f'reg[{register}]'
+        if flag is not None: 
+            return f'bool(cc_bits[reg[{COND}]] & {CC_FLAGS[flag]})'
+        if hex_value is not None: 
+            return f'0x{hex_value}'
+        if decimal is not None: 
+            return f'({decimal})'
+        return 'memory'
+
+    source = CONDITION_NAMES.sub(name, text)
+    try: 
+        return eval(f'lambda reg, memory: {source}', { 'cc_bits': CC_BITS })
+    except SyntaxError as ex: 
+        raise EmulatorError(f'invalid breakpoint condition {text!r}: {ex.msg}')
+
+def parse_address(text): 
+    try: 
+        value = int(text[1:], 16) if text[:1] in 'xX' else int(text, 0)
+    except ValueError: 
+        raise EmulatorError(f'invalid address: {text}')
+    if not 0 <= value < MEMORY_SIZE: 
+        raise EmulatorError(f'address out of range: {text}')
+    return value
+
+# Breakpoints and watchpoints for an emulator of any tier. Breakpoints are a bitmap the decoder
+# checks when it fills the decode cache (and the JIT when it picks block boundaries), so only
+# the words they are on run differently. Watchpoints flag their page, which sends its loads and
+# stores down the same slow path as device registers; every other page keeps its fast path.
+class Debugger: 
+    def __init__(self, emulator): 
+        self.emulator = emulator
+        self.reason = None
+
+    def break_at(self, addr, condition=None): 
+        emulator = self.emulator
+        emulator.breakpoints[addr] = 1
+        if condition: 
+            emulator.conditions[addr] = compile_condition(condition)
+        else: 
+            emulator.conditions.pop(addr, None)
+        emulator.invalidate(addr, addr + 1)
+
+    def clear(self, addr): 
+        emulator = self.emulator
+        emulator.breakpoints[addr] = 0
+        emulator.conditions.pop(addr, None)
+        emulator.invalidate(addr, addr + 1)
+
+    def watch(self, addr, mode=WATCH_READ | WATCH_WRITE): 
+        emulator = self.emulator
+        emulator.watchpoints[addr] |= mode
+        page = addr >> PAGE_SHIFT
+        if not emulator.page_flags[page] & WATCH_PAGE: 
+            emulator.set_page_flags(page, emulator.page_flags[page] | WATCH_PAGE)
+
+    def unwatch(self, addr): 
+        emulator = self.emulator
+        emulator.watchpoints[addr] = 0
+        page = addr >> PAGE_SHIFT
+        start = page << PAGE_SHIFT
+        if not any(emulator.watchpoints[start:start + PAGE_WORDS]): 
+            emulator.set_page_flags(page, emulator.page_flags[page] & ~WATCH_PAGE)
+
+    def breakpoints(self): 
+        breakpoints = self.emulator.breakpoints
+        addr = breakpoints.find(1)
+        while addr != -1: 
+            yield addr
+            addr = breakpoints.find(1, addr + 1)
+
+    # runs until the machine halts, stops at a breakpoint or watchpoint, or max_steps instructions
+    # have run, and returns the number that ran. A breakpoint at the current pc is stepped over
+    # first, so continuing from one moves on.
+    def cont(self, max_steps=None): 
+        emulator = self.emulator
+        pc = emulator.pc
+        executed = 0
+        if emulator.breakpoints[pc] and max_steps != 0: 
+            emulator.breakpoints[pc] = 0
+            emulator.invalidate(pc, pc + 1)
+            try: 
+                executed = emulator.run(1)
+            finally: 
+                emulator.breakpoints[pc] = 1
+                emulator.invalidate(pc, pc + 1)
+            if emulator.halted or emulator.hits: 
+                return self.stopped(executed, False)
+
+        limit = None if max_steps is None else max_steps - executed
+        count = emulator.run(limit)
+        return self.stopped(executed + count, limit is None or count < limit)
+
+    def step(self, count=1): 
+        return self.cont(count)
+
+    # short is set when the last run stopped before its limit
+    def stopped(self, executed, short): 
+        emulator = self.emulator
+        if emulator.halted: 
+            self.reason = 'halted'
+        elif emulator.hits: 
+            self.reason = ', '.join(f'watchpoint x{addr:04X}: {kind} x{value:04X}' for kind, addr, value in emulator.hits)
+        elif short: 
+            self.reason = f'breakpoint x{emulator.pc:04X}'
+        else: 
+            self.reason = 'step'
+        return executed
+
+    # history commands, for emulators that keep it (see reverse.py)
+    def history(self): 
+        if not hasattr(self.emulator, 'reverse_step'): 
+            raise EmulatorError('no history kept; run with --reverse')
+        return self.emulator
+
+    def reverse_step(self, count=1): 
+        emulator = self.history()
+        done = emulator.reverse_step(count)
+        self.reason = 'start of history' if done < count else 'reverse step'
+        return done
+
+    def reverse_cont(self): 
+        emulator = self.history()
+        done = emulator.reverse_cont()
+        if emulator.steps == emulator.first_step: 
+            self.reason = 'start of history'
+        elif emulator.breakpoints[emulator.pc]: 
+            self.reason = f'breakpoint x{emulator.pc:04X}'
+        else: 
+            self.reason = 'watched store'
+        return done
+
+    def goto(self, step): 
+        done = self.history().goto(step)
+        self.reason = f'step {step}'
+        return done
+
+    def registers(self): 
+        emulator = self.emulator
+        reg = emulator.reg
+        cc = { 4: 'n', 2: 'z', 1: 'p' }[CC_BITS[reg[COND]]]
+        return ' '.join(f'R{r}=x{reg[r]:04X}' for r in range(8)) + f' PC=x{emulator.pc:04X} CC={cc}'
+
+def usage(): 
+    print('$ python debugger.py {program.lc3}')
+    print('  -j | --jit            compile hot basic blocks to Python')
+    print('  -r | --reverse        keep history for reverse stepping')
+    print('  -i | --input [file]   read console input from file instead of stdin')
+    print('  -h | --help')
+    print('commands: ')
+    print('  b {addr} [if {condition}]  break at addr, e.g. b x3005 if r0 == #0 and z')
+    print('  d {addr}                   delete the breakpoint at addr')
+    print('  w {addr} [r|w|rw]          stop after instructions that read or write addr')
+    print('  u {addr}                   remove the watchpoint on addr')
+    print('  c [n]                      continue (for at most n instructions)')
+    print('  s [n]                      step n instructions')
+    print('  rs [n]                     step back n instructions (with -r)')
+    print('  rc                         run backwards to the previous breakpoint or watched store (with -r)')
+    print('  g {step}                   go to step (with -r)')
+    print('  r                          show registers')
+    print('  x {addr} [n]               show n words of memory')
+    print('  q                          quit')
+
+def command(debugger, line): 
+    words = line.split()
+    if not words: 
+        return True
+    name, args = words[0], words[1:]
+    emulator = debugger.emulator
+    if name == 'q': 
+        return False
+    if name == 'b': 
+        condition = line.split(' if ', 1)[1] if ' if ' in line else None
+        debugger.break_at(parse_address(args[0]), condition)
+    elif name == 'd': 
+        debugger.clear(parse_address(args[0]))
+    elif name == 'w': 
+        debugger.watch(parse_address(args[0]), WATCH_MODES[args[1] if len(args) > 1 else 'rw'])
+    elif name == 'u': 
+        debugger.unwatch(parse_address(args[0]))
+    elif name in ('c', 's'): 
+        count = int(args[0]) if args else (None if name == 'c' else 1)
+        executed = debugger.cont(count)
+        print(f'[ INFO ] {debugger.reason} at x{emulator.pc:04X} after {executed} instructions')
+    elif name in ('rs', 'rc', 'g'): 
+        if name == 'rs': 
+            executed = debugger.reverse_step(int(args[0]) if args else 1)
+        elif name == 'rc': 
+            executed = debugger.reverse_cont()
+        else: 
+            executed = debugger.goto(int(args[0]))
+        print(f'[ INFO ] {debugger.reason} at x{emulator.pc:04X}, step {emulator.steps} ({executed} instructions)')
+    elif name == 'r': 
+        print(debugger.registers())
+    elif name == 'x': 
+        addr = parse_address(args[0])
+        count = int(args[1]) if len(args) > 1 else 8
+        for row in range(addr, min(addr + count, MEMORY_SIZE), 8): 
+            words = emulator.memory[row:min(row + 8, addr + count)]
+            print(f'x{row:04X}: ' + ' '.join(f'x{word:04X}' for word in words))
+    else: 
+        print(f'[ ERROR ] unknown command: {name}')
+    return True
+
+def main(): 
+    if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2: 
+        usage()
+        sys.exit(1)
+
+    input_fn = option('-i', '--input')
+    try: 
+        emulator = create_emulator(
+            jit='-j' in sys.argv or '--jit' in sys.argv, 
+            reverse='-r' in sys.argv or '--reverse' in sys.argv, 
+            verbose=False, 
+            console=Console(open(input_fn, 'rb')) if input_fn is not None else None, 
+        )
+        emulator.load_image(sys.argv[1])
+    except (EmulatorError, OSError) as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(getattr(ex, 'code', 1))
+
+    debugger = Debugger(emulator)
+    while True: 
+        try: 
+            line = input('(aphid) ')
+        except EOFError: 
+            break
+        try: 
+            if not command(debugger, line): 
+                break
+        except (EmulatorError, IndexError, KeyError, ValueError) as ex: 
+            print(f'[ ERROR ] {ex}')
+
+if __name__ == '__main__': 
+    main()
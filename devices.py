@@ -0,0 +1,241 @@
+import asyncio
+import os
+import sys
+
+KBSR, KBDR, DSR, DDR, MCR = 0xFE00, 0xFE02, 0xFE04, 0xFE06, 0xFFFE
+
+READY = 0x8000
+
+# page flag for pages that hold device registers; loads and stores to them go through the bus
+IO_PAGE = 1
+
+# fixed-capacity byte queue shared by a device and the task that feeds or drains it
+class RingBuffer: 
+    def __init__(self, capacity=1 << 12): 
+        self.data = bytearray(capacity)
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+
+    def __len__(self): 
+        return self.size
+
+    def room(self): 
+        return self.capacity - self.size
+
+    def push(self, data) -> int: 
+        count = min(len(data), self.room())
+        for idx in range(count): 
+            self.data[(self.head + self.size + idx) % self.capacity] = data[idx]
+        self.size += count
+        return count
+
+    def pop(self): 
+        if self.size == 0: 
+            return None
+        value = self.data[self.head]
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
+        return value
+
+    def peek(self) -> bytes: 
+        end = self.head + self.size
+        return bytes(self.data[self.head:min(end, self.capacity)]) + bytes(self.data[:max(0, end - self.capacity)])
+
+    def drain(self) -> bytes: 
+        data = self.peek()
+        self.head = 0
+        self.size = 0
+        return data
+
+# KBSR bit 15 is set while a character is waiting; reading KBDR takes it. Fed by an asyncio
+# stream when one is attached, and from the emulator's console (blocking) otherwise.
+class Keyboard: 
+    registers = (KBSR, KBDR)
+
+    def __init__(self, console, capacity=1 << 12): 
+        self.console = console
+        self.buffer = RingBuffer(capacity)
+        self.status = 0
+        self.data = 0
+        self.streamed = False
+
+    def read(self, addr): 
+        if not self.buffer and not self.streamed: 
+            char = self.console.read()
+            if char is not None: 
+                self.buffer.push(bytes((char,)))
+        if addr == KBSR: 
+            return (READY if self.buffer else 0) | (self.status & 0x4000)
+        char = self.buffer.pop()
+        if char is not None: 
+            self.data = char
+        return self.data
+
+    def write(self, addr, value): 
+        if addr == KBSR: 
+            self.status = value
+        else: 
+            self.data = value & 0xFF
+
+    async def pump(self, reader: asyncio.StreamReader): 
+        self.streamed = True
+        while data := await reader.read(self.buffer.capacity): 
+            while data: 
+                data = data[self.buffer.push(data):]
+                if data: 
+                    await asyncio.sleep(0)
+
+# DSR bit 15 is set while there is room for another character; writing DDR queues it. Drained
+# by an asyncio stream when one is attached, and into the emulator's console otherwise.
+class Display: 
+    registers = (DSR, DDR)
+
+    def __init__(self, console, capacity=1 << 12): 
+        self.console = console
+        self.buffer = RingBuffer(capacity)
+        self.data = 0
+        self.streamed = False
+        self.written = None
+
+    def read(self, addr): 
+        if addr == DSR: 
+            return READY if self.buffer.room() else 0
+        return self.data
+
+    def write(self, addr, value): 
+        if addr == DSR: 
+            return
+        self.data = value
+        if not self.streamed: 
+            self.console.write(bytes((value & 0xFF,)))
+            return
+        self.buffer.push(bytes((value & 0xFF,)))
+        self.written.set()
+
+    async def pump(self, writer: asyncio.StreamWriter): 
+        self.streamed = True
+        self.written = asyncio.Event()
+        while True: 
+            await self.written.wait()
+            self.written.clear()
+            await self.flush(writer)
+
+    async def flush(self, writer: asyncio.StreamWriter): 
+        if self.buffer: 
+            writer.write(self.buffer.drain())
+        await writer.drain()
+
+# clearing MCR bit 15 stops the clock
+class MachineControl: 
+    registers = (MCR,)
+
+    def __init__(self, emulator): 
+        self.emulator = emulator
+        self.value = READY
+
+    def read(self, addr): 
+        return self.value
+
+    def write(self, addr, value): 
+        self.value = value
+        if not value & READY: 
+            self.emulator.halted = True
+
+# Maps device register addresses to devices. Emulator flags the pages they are on, and only
+# accesses to flagged pages come here.
+class DeviceBus: 
+    def __init__(self, emulator): 
+        self.registers = {}
+        self.keyboard = self.attach(Keyboard(emulator.console))
+        self.display = self.attach(Display(emulator.console))
+        self.control = self.attach(MachineControl(emulator))
+
+    def attach(self, device): 
+        for addr in device.registers: 
+            self.registers[addr] = device
+        return device
+
+    def pages(self): 
+        return { addr >> 8 for addr in self.registers }
+
+    # None for addresses that are plain memory
+    def read(self, addr): 
+        device = self.registers.get(addr)
+        return None if device is None else device.read(addr)
+
+    def write(self, addr, value) -> bool: 
+        device = self.registers.get(addr)
+        if device is None: 
+            return False
+        device.write(addr, value)
+        return True
+
+    def state(self): 
+        return {
+            'keyboard': self.keyboard.buffer.peek(), 
+            'kbsr': self.keyboard.status, 
+            'kbdr': self.keyboard.data, 
+            'ddr': self.display.data, 
+            'mcr': self.control.value, 
+        }
+
+    def restore(self, state): 
+        if not state: 
+            return
+        self.keyboard.buffer.drain()
+        self.keyboard.buffer.push(state['keyboard'])
+        self.keyboard.status = state['kbsr']
+        self.keyboard.data = state['kbdr']
+        self.display.data = state['ddr']
+        self.control.value = state['mcr']
+
+    # feeds the keyboard from reader and drains the display into writer
+    def connect(self, reader, writer): 
+        return [asyncio.ensure_future(self.keyboard.pump(reader)), asyncio.ensure_future(self.display.pump(writer))]
+
+# stand-ins for asyncio streams over regular files, which can't be watched by the event loop
+class FileReader: 
+    def __init__(self, f): 
+        self.f = f
+
+    async def read(self, n): 
+        return self.f.read(n)
+
+class FileWriter: 
+    def __init__(self, f): 
+        self.f = f
+
+    def write(self, data): 
+        self.f.write(data)
+
+    async def drain(self): 
+        self.f.flush()
+
+# stdin and stdout as asyncio streams, over duplicates of their descriptors so closing the
+# transports leaves sys.stdin and sys.stdout usable
+async def open_stdio(): 
+    loop = asyncio.get_running_loop()
+    try: 
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(os.dup(sys.stdin.fileno()), 'rb'))
+    except ValueError: 
+        reader = FileReader(sys.stdin.buffer)
+    try: 
+        pipe = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, pipe)
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    except ValueError: 
+        writer = FileWriter(sys.stdout.buffer)
+    return reader, writer
+
+# runs emulator with its keyboard and display on stdin and stdout
+async def run_interactive(emulator, max_steps=None): 
+    reader, writer = await open_stdio()
+    tasks = emulator.bus.connect(reader, writer)
+    try: 
+        return await emulator.run_async(max_steps)
+    finally: 
+        for task in tasks: 
+            task.cancel()
+        await emulator.bus.display.flush(writer)
@@ -0,0 +1,191 @@
+import sys
+
+import numpy as np
+
+from assembler import option
+from debugger import parse_address
+from errors import EmulatorError
+from instruction import opcode_str_to_int
+from objfile import is_object, read_object, EXTERNAL
+
+ADD, AND, BR, JMP, JSR, LD, LDI, LDR, LEA, NOT, RTI, ST, STI, STR, TRAP = (
+    opcode_str_to_int[name] for name in ('add', 'and', 'br', 'jmp', 'jsr', 'ld', 'ldi', 'ldr', 'lea', 'not', 'rti', 'st', 'sti', 'str', 'trap')
+)
+
+MNEMONICS = ['BR', 'ADD', 'LD', 'ST', 'JSR', 'AND', 'LDR', 'STR', 'RTI', 'NOT', 'LDI', 'STI', 'JMP', None, 'LEA', 'TRAP']
+
+# bits that must be clear (or, for NOT, set) for a word to be the instruction its opcode says;
+# anything else is shown as .fill so the listing assembles back to the same words
+MUST_BE_CLEAR = { JMP: 0x0E3F, RTI: 0x0FFF, TRAP: 0x0F00 }
+
+def sext(words, bits): 
+    value = (words & ((1 << bits) - 1)).astype(np.int32)
+    return value - ((value >> (bits - 1)) << bits)
+
+def read_words(filename): 
+    if is_object(filename): 
+        module = read_object(filename)
+        # pairs rather than a dict: labels local to different modules can share a name
+        symbols = [(symbol.name, symbol.value) for symbol in module.symbols() if not symbol.flags & EXTERNAL]
+        return [(segment.orig, np.frombuffer(module.segment_words(segment), dtype=np.uint16)) for segment in module.segments()], symbols
+    words = np.fromfile(filename, dtype='>u2').astype(np.uint16)
+    if len(words) == 0: 
+        raise ValueError(f'{filename} is empty')
+    return [(int(words[0]), words[1:])], []
+
+# Decodes a block of words all at once: opcode, register fields, immediates and sign-extended
+# offsets are NumPy arrays over the whole block, PC-relative targets are computed for every word,
+# and a mask marks the words that are valid instructions. Text is only built for the addresses
+# asked for (lines(), __getitem__), so a 64K image costs a handful of array operations until
+# it is read. symbols ({name: address} or (name, address) pairs) label addresses and the targets
+# that land on them.
+class Disassembly: 
+    def __init__(self, words, orig=0, symbols=None): 
+        words = np.asarray(words, dtype=np.uint16)
+        self.words = words
+        self.orig = orig
+        self.labels = {}
+        for name, addr in symbols.items() if isinstance(symbols, dict) else symbols or (): 
+            self.labels.setdefault(addr, name)
+
+        self.opcode = words >> 12
+        self.dr = (words >> 9) & 7
+        self.sr1 = (words >> 6) & 7
+        self.sr2 = words & 7
+        self.immediate = (words >> 5) & 1
+        self.imm5 = sext(words, 5)
+        self.offset6 = sext(words, 6)
+        self.offset = np.where(self.opcode == JSR, sext(words, 11), sext(words, 9))
+        self.target = (orig + np.arange(len(words), dtype=np.int32) + 1 + self.offset) & 0xFFFF
+
+        opcode = self.opcode
+        valid = opcode != 13
+        valid &= (opcode != BR) | (self.dr != 0)
+        valid &= ~np.isin(opcode, (ADD, AND)) | (self.immediate == 1) | ((words & 0x18) == 0)
+        valid &= (opcode != NOT) | ((words & 0x3F) == 0x3F)
+        valid &= (opcode != JSR) | ((words & 0x800) != 0) | ((words & 0x0E3F) == 0)
+        for code, mask in MUST_BE_CLEAR.items(): 
+            valid &= (opcode != code) | ((words & mask) == 0)
+        self.valid = valid
+        # words whose operand is a PC-relative target
+        self.relative = valid & (np.isin(opcode, (BR, LD, LDI, LEA, ST, STI)) | ((opcode == JSR) & ((words & 0x800) != 0)))
+
+    def __len__(self): 
+        return len(self.words)
+
+    def operand(self, idx): 
+        target = int(self.target[idx])
+        label = self.labels.get(target)
+        if label is not None: 
+            return label
+        return f'#{int(self.offset[idx])}'
+
+    # instruction text for the word at index idx (not address)
+    def text(self, idx): 
+        word = int(self.words[idx])
+        if not self.valid[idx]: 
+            return f'.FILL x{word:04X}'
+        opcode, dr, sr1 = int(self.opcode[idx]), int(self.dr[idx]), int(self.sr1[idx])
+        name = MNEMONICS[opcode]
+        if opcode in (ADD, AND): 
+            last = f'#{int(self.imm5[idx])}' if self.immediate[idx] else f'R{int(self.sr2[idx])}'
+            return f'{name} R{dr}, R{sr1}, {last}'
+        if opcode == BR: 
+            flags = ''.join(flag for flag, bit in (('n', 4), ('z', 2), ('p', 1)) if dr & bit)
+            return f'BR{flags if flags != "nzp" else ""} {self.operand(idx)}'
+        if opcode in (LD, LDI, LEA, ST, STI): 
+            return f'{name} R{dr}, {self.operand(idx)}'
+        if opcode in (LDR, STR): 
+            return f'{name} R{dr}, R{sr1}, #{int(self.offset6[idx])}'
+        if opcode == NOT: 
+            return f'NOT R{dr}, R{sr1}'
+        if opcode == JMP: 
+            return 'RET' if sr1 == 7 else f'JMP R{sr1}'
+        if opcode == JSR: 
+            return f'JSR {self.operand(idx)}' if word & 0x800 else f'JSRR R{sr1}'
+        if opcode == TRAP: 
+            return f'TRAP x{word & 0xFF:02X}'
+        return name
+
+    def __getitem__(self, addr): 
+        return self.text(addr - self.orig)
+
+    # listing lines for addresses in [start, end), with absolute targets as comments
+    def lines(self, start=None, end=None): 
+        first = 0 if start is None else max(start - self.orig, 0)
+        last = len(self) if end is None else min(end - self.orig, len(self))
+        for idx in range(first, last): 
+            addr = self.orig + idx
+            label = self.labels.get(addr)
+            if label is not None: 
+                yield f'{label}:'
+            line = f'x{addr:04X}  x{int(self.words[idx]):04X}  {self.text(idx)}'
+            if self.relative[idx]: 
+                line = f'{line:<40}; x{int(self.target[idx]):04X}'
+            yield line
+
+    # addresses where two blocks at the same .orig differ, found with one comparison
+    def diff(self, other: 'Disassembly'): 
+        length = min(len(self), len(other))
+        changed = np.flatnonzero(self.words[:length] != other.words[:length])
+        extra = range(length, max(len(self), len(other)))
+        return [self.orig + int(idx) for idx in changed] + [self.orig + idx for idx in extra]
+
+def disassemble(filename, symbols=None) -> list: 
+    segments, own = read_words(filename)
+    own.extend(symbols.items() if isinstance(symbols, dict) else symbols or ())
+    return [Disassembly(words, orig, own) for orig, words in segments]
+
+def usage(): 
+    print('$ python disassembler.py {program.lc3 | program.obj} [start] [end]')
+    print('  -s | --symbols [file.obj]  label addresses with the symbols of an object')
+    print('  -d | --diff [file]         only show the words that differ from another image')
+    print('  -h | --help')
+
+def main(): 
+    if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2: 
+        usage()
+        sys.exit(1)
+
+    try: 
+        args, skip = [], False
+        for arg in sys.argv[2:]: 
+            if skip: 
+                skip = False
+            elif arg in ('-s', '--symbols', '-d', '--diff'): 
+                skip = True
+            else: 
+                args.append(parse_address(arg))
+        start, end = (args + [None, None])[:2]
+
+        symbols = []
+        symbols_fn = option('-s', '--symbols')
+        if symbols_fn is not None: 
+            symbols = read_words(symbols_fn)[1]
+        blocks = disassemble(sys.argv[1], symbols)
+        other_fn = option('-d', '--diff')
+        others = disassemble(other_fn, symbols) if other_fn is not None else None
+    except (EmulatorError, OSError, ValueError) as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(1)
+
+    if others is None: 
+        for block in blocks: 
+            for line in block.lines(start, end): 
+                print(line)
+        return
+
+    others = { block.orig: block for block in others }
+    for block in blocks: 
+        other = others.get(block.orig)
+        if other is None: 
+            print(f'[ INFO ] x{block.orig:04X}: no segment at this address in {other_fn}')
+            continue
+        for addr in block.diff(other): 
+            if (start is None or addr >= start) and (end is None or addr < end): 
+                mine = block[addr] if addr - block.orig < len(block) else '-'
+                theirs = other[addr] if addr - other.orig < len(other) else '-'
+                print(f'x{addr:04X}  {mine:<28} | {theirs}')
+
+if __name__ == '__main__': 
+    main()
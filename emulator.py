@@ -0,0 +1,691 @@
+import asyncio
+import sys
+import time
+from array import array
+
+from console import Console
+from devices import DeviceBus, IO_PAGE
+from errors import EmulatorError
+from instruction import opcode_str_to_int
+from objfile import is_object, read_object
+from snapshot import Snapshot, PAGES, PAGE_SHIFT, PAGE_BYTES, share_page
+
+MEMORY_SIZE = 1 << 16
+MAX_STEPS = sys.maxsize - 1
+
+# reg[COND] holds the last value written to a general purpose register; N/Z/P are derived from it
+# when a branch needs them, so instructions that set the condition codes only store one value
+COND = 8
+# condition code bit (n=4, z=2, p=1) of every 16 bit value
+CC_BITS = bytes(2 if value == 0 else 4 if value & 0x8000 else 1 for value in range(MEMORY_SIZE))
+# value to put in reg[COND] for a given set of condition code bits
+CC_VALUES = { 4: 0x8000, 2: 0, 1: 1 }
+
+HALT_VECTOR = 0x25
+
+# page flag for pages with watched words; loads and stores to them go through read_io and write_io
+WATCH_PAGE = 2
+# watchpoints[addr] bits
+WATCH_READ = 1
+WATCH_WRITE = 2
+
+def sext(value, bits): 
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+# .lc3 images are big-endian words, the first being the .orig address
+def read_image(filename) -> array: 
+    words = array('H')
+    with open(filename, 'rb') as f: 
+        words.frombytes(f.read())
+    if sys.byteorder == 'little': 
+        words.byteswap()
+    if len(words) == 0: 
+        raise EmulatorError(f'{filename} is empty')
+    return words
+
+# raised by the instruction that stops the machine, after it has set pc: Halt when it halted it,
+# Stop when it hit a watchpoint
+class Stop(Exception): 
+    pass
+
+class Halt(Stop): 
+    pass
+
+# raised by a breakpoint before its instruction runs, after setting pc to it
+class Break(Stop): 
+    pass
+
+# LC-3 emulator. Every memory word is decoded at most once, by the decoder for its opcode, into an
+# entry of the decode cache: the opcode's handler with the instruction's fields (and its address,
+# so PC-relative targets are computed up front) bound as closure variables. Running an
+# instruction is a call to its entry, which returns the next PC. Stores clear the entry of the
+# word they write.
+class Emulator: 
+    def __init__(self, verbose=True, console=None, native_traps=True): 
+        self.verbose = verbose
+        self.memory = array('H', bytes(2 * MEMORY_SIZE))
+        self.reg = [0] * 9
+        self.pc = 0x3000
+        self.user = False
+        self.halted = False
+        self.steps = 0
+        self.seconds = 0.0
+
+        # pages stored to since the last snapshot or restore
+        self.dirty = bytearray(PAGES)
+        self.last_snapshot = None
+        # nonzero for words that belong to compiled code (see jit.py)
+        self.code = bytearray(MEMORY_SIZE)
+
+        # set by debugger.py. Words with a breakpoint are decoded into an entry that checks it,
+        # and watched words are on pages flagged WATCH_PAGE, so nothing else pays for them.
+        self.breakpoints = bytearray(MEMORY_SIZE)
+        self.conditions = {}
+        self.watchpoints = bytearray(MEMORY_SIZE)
+        # (kind, addr, value) for the watchpoints hit by the instruction that stopped the machine
+        self.hits = []
+
+        self.console = console or Console()
+        self.bus = DeviceBus(self)
+        self.page_flags = bytearray(PAGES)
+        for page in self.bus.pages(): 
+            self.page_flags[page] |= IO_PAGE
+
+        self.decoded = [None] * MEMORY_SIZE
+        self.decoders = [self.decode_reserved] * 16
+        for name, opcode in opcode_str_to_int.items(): 
+            if hasattr(self, 'decode_' + name): 
+                self.decoders[opcode] = getattr(self, 'decode_' + name)
+
+        self.services = {
+            0x20: self.trap_getc, 
+            0x21: self.trap_out, 
+            0x22: self.trap_puts, 
+            0x23: self.trap_in, 
+            0x24: self.trap_putsp, 
+        }
+        self._native_traps = native_traps
+
+    def log(self, message): 
+        if self.verbose: 
+            print(message)
+
+    @property
+    def psr(self): 
+        return (0x8000 if self.user else 0) | CC_BITS[self.reg[COND]]
+
+    @psr.setter
+    def psr(self, value): 
+        self.user = bool(value & 0x8000)
+        self.reg[COND] = CC_VALUES.get(value & 7, 0)
+
+    # switching between native services and the routines in memory re-decodes every TRAP
+    @property
+    def native_traps(self): 
+        return self._native_traps
+
+    @native_traps.setter
+    def native_traps(self, value): 
+        self._native_traps = value
+        self.invalidate(0, MEMORY_SIZE)
+
+    @property
+    def mips(self): 
+        return self.steps / self.seconds / 1e6 if self.seconds else 0.0
+
+    def load(self, words, orig): 
+        if orig + len(words) > MEMORY_SIZE: 
+            raise EmulatorError(f'{len(words)} words do not fit in memory at x{orig:04X}')
+        if isinstance(words, memoryview): 
+            memoryview(self.memory)[orig:orig + len(words)] = words
+        else: 
+            self.memory[orig:orig + len(words)] = array('H', words)
+        self.invalidate(orig, orig + len(words))
+        for page in range(orig >> PAGE_SHIFT, (orig + len(words) + PAGE_BYTES // 2 - 1) >> PAGE_SHIFT): 
+            self.dirty[page] = 1
+
+    def load_image(self, filename): 
+        if is_object(filename): 
+            return self.load_object(filename)
+        words = read_image(filename)
+        self.load(words[1:], words[0])
+        self.pc = words[0]
+        return words[0]
+
+    # linked objects (or modules without externals) load segment by segment, straight from the
+    # mapped file; execution starts at the first segment
+    def load_object(self, filename): 
+        try: 
+            module = read_object(filename)
+        except ValueError as ex: 
+            raise EmulatorError(str(ex))
+        if module.relocations(): 
+            raise EmulatorError(f'{filename} has unresolved externals; link it first')
+        segments = module.segments()
+        if not segments: 
+            raise EmulatorError(f'{filename} is empty')
+        for segment in segments: 
+            self.load(module.segment_words(segment), segment.orig)
+        self.pc = segments[0].orig
+        return self.pc
+
+    def invalidate(self, start, end): 
+        self.decoded[start:end] = [None] * (end - start)
+
+    # memory should only be changed by running code, load() and restore() for snapshots to see it
+    def snapshot(self) -> Snapshot: 
+        base = self.last_snapshot
+        memory = memoryview(self.memory).cast('B')
+        if base is None: 
+            pages = [share_page(memory[page * PAGE_BYTES:(page + 1) * PAGE_BYTES]) for page in range(PAGES)]
+        else: 
+            pages = list(base.pages)
+            page = self.dirty.find(1)
+            while page != -1: 
+                pages[page] = share_page(memory[page * PAGE_BYTES:(page + 1) * PAGE_BYTES])
+                page = self.dirty.find(1, page + 1)
+        memory.release()
+
+        self.dirty[:] = bytes(PAGES)
+        self.last_snapshot = Snapshot(tuple(pages), tuple(self.reg[:8]), self.pc, self.psr, self.halted, self.save_devices())
+        return self.last_snapshot
+
+    # copies back only the pages that were stored to since the last snapshot or restore, or that
+    # differ between that snapshot and this one
+    def restore(self, snapshot: Snapshot): 
+        base = self.last_snapshot
+        memory = memoryview(self.memory).cast('B')
+        for page in range(PAGES): 
+            if base is None or self.dirty[page] or base.pages[page] is not snapshot.pages[page]: 
+                memory[page * PAGE_BYTES:(page + 1) * PAGE_BYTES] = snapshot.pages[page]
+                self.invalidate(page << PAGE_SHIFT, (page + 1) << PAGE_SHIFT)
+        memory.release()
+
+        self.dirty[:] = bytes(PAGES)
+        self.last_snapshot = snapshot
+        self.reg[:8] = snapshot.reg
+        self.pc = snapshot.pc
+        self.psr = snapshot.psr
+        self.halted = snapshot.halted
+        self.restore_devices(snapshot.devices)
+
+    def save_devices(self): 
+        return self.bus.state()
+
+    def restore_devices(self, state): 
+        self.bus.restore(state)
+
+    # slow path for loads and stores to pages with flags set
+    def read_io(self, addr): 
+        value = self.bus.read(addr)
+        if value is None: 
+            value = self.memory[addr]
+        if self.watchpoints[addr] & WATCH_READ: 
+            self.hits.append(('read', addr, value))
+        return value
+
+    # pc is the address after the load, where the machine stops if the load hit a watchpoint
+    def after_io(self, pc): 
+        if self.hits: 
+            self.pc = pc
+            raise Stop
+        return pc
+
+    # pc is the address after the store, where the machine stops if the store halted it or hit a
+    # watchpoint
+    def write_io(self, addr, value, pc): 
+        self.write_device(addr, value)
+        if self.halted: 
+            self.pc = pc
+            raise Halt
+        self.after_io(pc)
+
+    def write_device(self, addr, value): 
+        if self.watchpoints[addr] & WATCH_WRITE: 
+            self.hits.append(('write', addr, value))
+        if not self.bus.write(addr, value): 
+            self.store(addr, value)
+
+    # loads and stores are specialized on page flags when they are decoded, so changing them
+    # re-decodes everything
+    def set_page_flags(self, page, flags): 
+        self.page_flags[page] = flags
+        self.invalidate(0, MEMORY_SIZE)
+
+    def store(self, addr, value): 
+        self.memory[addr] = value
+        self.decoded[addr] = None
+        self.dirty[addr >> PAGE_SHIFT] = 1
+        if self.code[addr]: 
+            self.invalidate_code(addr)
+
+    def invalidate_code(self, addr): 
+        pass
+
+    def decode(self, addr): 
+        word = self.memory[addr]
+        op = self.decoders[word >> 12](word, (addr + 1) & 0xFFFF)
+        if self.breakpoints[addr]: 
+            op = self.decode_breakpoint(addr, op)
+        self.decoded[addr] = op
+        return op
+
+    # the entry for a word with a breakpoint stops the machine before running the word's own
+    # entry, when the breakpoint's condition (compiled once, see debugger.py) holds
+    def decode_breakpoint(self, addr, op): 
+        reg, memory = self.reg, self.memory
+        condition = self.conditions.get(addr)
+        def breakpoint(): 
+            if condition is None or condition(reg, memory): 
+                self.pc = addr
+                raise Break
+            return op()
+        return breakpoint
+
+    def run(self, max_steps=None): 
+        limit = MAX_STEPS if max_steps is None else max_steps
+        decoded = self.decoded
+        decode = self.decode
+        pc = self.pc
+        executed = 0
+        self.halted = False
+        self.hits.clear()
+        start = time.perf_counter()
+        try: 
+            for executed in range(1, limit + 1): 
+                op = decoded[pc]
+                if op is None: 
+                    op = decode(pc)
+                pc = op()
+        except Break: 
+            executed -= 1
+            pc = self.pc
+        except Stop: 
+            pc = self.pc
+        except EmulatorError: 
+            executed -= 1
+            raise
+        finally: 
+            self.pc = pc
+            self.steps += executed
+            self.seconds += time.perf_counter() - start
+            self.console.flush()
+        return executed
+
+    def step(self): 
+        return self.run(1)
+
+    # runs in slices, yielding to the event loop in between so device streams keep moving. A
+    # slice that comes back short stopped the machine.
+    async def run_async(self, max_steps=None, slice_steps=1 << 14): 
+        executed = 0
+        while max_steps is None or executed < max_steps: 
+            steps = slice_steps if max_steps is None else min(slice_steps, max_steps - executed)
+            count = self.run(steps)
+            executed += count
+            if self.halted or count < steps: 
+                break
+            await asyncio.sleep(0)
+        return executed
+
+    def decode_br(self, word, pc): 
+        reg, cc_bits = self.reg, CC_BITS
+        nzp = (word >> 9) & 7
+        target = (pc + sext(word, 9)) & 0xFFFF
+        if nzp == 7: 
+            def br(): 
+                return target
+        elif nzp == 0: 
+            def br(): 
+                return pc
+        else: 
+            def br(): 
+                return target if cc_bits[reg[COND]] & nzp else pc
+        return br
+
+    def decode_add(self, word, pc): 
+        reg = self.reg
+        dr, sr1 = (word >> 9) & 7, (word >> 6) & 7
+        if word & 0x20: 
+            imm = sext(word, 5) & 0xFFFF
+            def add(): 
+                reg[dr] = reg[COND] = (reg[sr1] + imm) & 0xFFFF
+                return pc
+        else: 
+            sr2 = word & 7
+            def add(): 
+                reg[dr] = reg[COND] = (reg[sr1] + reg[sr2]) & 0xFFFF
+                return pc
+        return add
+
+    def decode_and(self, word, pc): 
+        reg = self.reg
+        dr, sr1 = (word >> 9) & 7, (word >> 6) & 7
+        if word & 0x20: 
+            imm = sext(word, 5) & 0xFFFF
+            def and_(): 
+                reg[dr] = reg[COND] = reg[sr1] & imm
+                return pc
+        else: 
+            sr2 = word & 7
+            def and_(): 
+                reg[dr] = reg[COND] = reg[sr1] & reg[sr2]
+                return pc
+        return and_
+
+    def decode_not(self, word, pc): 
+        reg = self.reg
+        dr, sr = (word >> 9) & 7, (word >> 6) & 7
+        def not_(): 
+            reg[dr] = reg[COND] = reg[sr] ^ 0xFFFF
+            return pc
+        return not_
+
+    def decode_jmp(self, word, pc): 
+        reg = self.reg
+        base = (word >> 6) & 7
+        def jmp(): 
+            return reg[base]
+        return jmp
+
+    # JSR and JSRR share an opcode
+    def decode_jsr(self, word, pc): 
+        reg = self.reg
+        if word & 0x800: 
+            target = (pc + sext(word, 11)) & 0xFFFF
+            def jsr(): 
+                reg[7] = pc
+                return target
+        else: 
+            base = (word >> 6) & 7
+            def jsr(): 
+                target = reg[base]
+                reg[7] = pc
+                return target
+        return jsr
+
+    # LD, LDI's pointer, ST and STI's pointer have addresses known at decode time, so only
+    # instructions that address a device page get the slow path; LDR, STR and the second access
+    # of LDI/STI check the page flags as they run
+    def decode_ld(self, word, pc): 
+        reg, memory = self.reg, self.memory
+        dr = (word >> 9) & 7
+        addr = (pc + sext(word, 9)) & 0xFFFF
+        if self.page_flags[addr >> PAGE_SHIFT]: 
+            read_io, after_io = self.read_io, self.after_io
+            def ld(): 
+                reg[dr] = reg[COND] = read_io(addr)
+                return after_io(pc)
+            return ld
+
+        def ld(): 
+            reg[dr] = reg[COND] = memory[addr]
+            return pc
+        return ld
+
+    def decode_ldi(self, word, pc): 
+        reg, memory, flags, read_io, after_io = self.reg, self.memory, self.page_flags, self.read_io, self.after_io
+        dr = (word >> 9) & 7
+        addr = (pc + sext(word, 9)) & 0xFFFF
+        if flags[addr >> PAGE_SHIFT]: 
+            def ldi(): 
+                target = read_io(addr)
+                reg[dr] = reg[COND] = read_io(target) if flags[target >> PAGE_SHIFT] else memory[target]
+                return after_io(pc)
+            return ldi
+
+        def ldi(): 
+            target = memory[addr]
+            if flags[target >> PAGE_SHIFT]: 
+                reg[dr] = reg[COND] = read_io(target)
+                return after_io(pc)
+            reg[dr] = reg[COND] = memory[target]
+            return pc
+        return ldi
+
+    def decode_ldr(self, word, pc): 
+        reg, memory, flags, read_io, after_io = self.reg, self.memory, self.page_flags, self.read_io, self.after_io
+        dr, base = (word >> 9) & 7, (word >> 6) & 7
+        offset = sext(word, 6)
+        def ldr(): 
+            target = (reg[base] + offset) & 0xFFFF
+            if flags[target >> PAGE_SHIFT]: 
+                reg[dr] = reg[COND] = read_io(target)
+                return after_io(pc)
+            reg[dr] = reg[COND] = memory[target]
+            return pc
+        return ldr
+
+    def decode_lea(self, word, pc): 
+        reg = self.reg
+        dr = (word >> 9) & 7
+        value = (pc + sext(word, 9)) & 0xFFFF
+        def lea(): 
+            reg[dr] = value
+            return pc
+        return lea
+
+    def decode_st(self, word, pc): 
+        reg, memory, decoded, dirty, code = self.reg, self.memory, self.decoded, self.dirty, self.code
+        sr = (word >> 9) & 7
+        addr = (pc + sext(word, 9)) & 0xFFFF
+        if self.page_flags[addr >> PAGE_SHIFT]: 
+            def st(): 
+                self.write_io(addr, reg[sr], pc)
+                return pc
+            return st
+
+        def st(): 
+            memory[addr] = reg[sr]
+            decoded[addr] = None
+            dirty[addr >> PAGE_SHIFT] = 1
+            if code[addr]: 
+                self.invalidate_code(addr)
+            return pc
+        return st
+
+    def decode_sti(self, word, pc): 
+        reg, memory, decoded, dirty, code, flags, read_io = self.reg, self.memory, self.decoded, self.dirty, self.code, self.page_flags, self.read_io
+        sr = (word >> 9) & 7
+        addr = (pc + sext(word, 9)) & 0xFFFF
+        indirect = flags[addr >> PAGE_SHIFT]
+        load = read_io if indirect else memory.__getitem__
+        def sti(): 
+            target = load(addr)
+            if flags[target >> PAGE_SHIFT]: 
+                self.write_io(target, reg[sr], pc)
+                return pc
+            memory[target] = reg[sr]
+            decoded[target] = None
+            dirty[target >> PAGE_SHIFT] = 1
+            if code[target]: 
+                self.invalidate_code(target)
+            # the pointer may have been a watched word
+            return self.after_io(pc) if indirect else pc
+        return sti
+
+    def decode_str(self, word, pc): 
+        reg, memory, decoded, dirty, code, flags = self.reg, self.memory, self.decoded, self.dirty, self.code, self.page_flags
+        sr, base = (word >> 9) & 7, (word >> 6) & 7
+        offset = sext(word, 6)
+        def str_(): 
+            target = (reg[base] + offset) & 0xFFFF
+            if flags[target >> PAGE_SHIFT]: 
+                self.write_io(target, reg[sr], pc)
+                return pc
+            memory[target] = reg[sr]
+            decoded[target] = None
+            dirty[target >> PAGE_SHIFT] = 1
+            if code[target]: 
+                self.invalidate_code(target)
+            return pc
+        return str_
+
+    def decode_rti(self, word, pc): 
+        reg, memory = self.reg, self.memory
+        def rti(): 
+            if self.user: 
+                raise EmulatorError('privilege mode violation: RTI in user mode', pc - 1)
+            sp = reg[6]
+            target = memory[sp]
+            self.psr = memory[(sp + 1) & 0xFFFF]
+            reg[6] = (sp + 2) & 0xFFFF
+            return target
+        return rti
+
+    # Native TRAP services, used instead of the service routines in memory while native_traps
+    # is set. Strings are written with one (buffered) write and input comes from the console's
+    # buffer, instead of a device register poll loop per character.
+    def trap_getc(self): 
+        char = self.console.read()
+        self.reg[0] = 0 if char is None else char
+
+    def trap_out(self): 
+        self.console.write(bytes((self.reg[0] & 0xFF,)))
+
+    def trap_puts(self): 
+        self.console.write(self.read_string(self.reg[0])[0::2])
+
+    def trap_in(self): 
+        self.console.write(b'Input a character> ')
+        char = self.console.read()
+        if char is not None: 
+            self.console.write(bytes((char,)) + b'\n')
+        self.reg[0] = 0 if char is None else char
+
+    def trap_putsp(self): 
+        self.console.write(self.read_string(self.reg[0]).split(b'\0', 1)[0])
+
+    # the words from addr up to the next zero word, as little-endian bytes
+    def read_string(self, addr): 
+        try: 
+            end = self.memory.index(0, addr)
+        except ValueError: 
+            end = MEMORY_SIZE
+        words = self.memory[addr:end]
+        if sys.byteorder == 'big': 
+            words.byteswap()
+        return words.tobytes()
+
+    # service routines are found through the trap vector table; HALT with no routine installed
+    # stops the machine directly
+    def decode_trap(self, word, pc): 
+        reg, memory = self.reg, self.memory
+        vector = word & 0xFF
+        if self.native_traps and vector == HALT_VECTOR: 
+            def trap(): 
+                reg[7] = pc
+                self.console.write(b'\n--- halting the LC-3 ---\n')
+                self.pc = pc
+                self.halted = True
+                raise Halt
+            return trap
+        if self.native_traps and vector in self.services: 
+            service = self.services[vector]
+            def trap(): 
+                reg[7] = pc
+                service()
+                return pc
+            return trap
+
+        def trap(): 
+            target = memory[vector]
+            if target == 0: 
+                if vector == HALT_VECTOR: 
+                    self.pc = pc
+                    self.halted = True
+                    raise Halt
+                raise EmulatorError(f'no service routine for TRAP x{vector:02X}', pc - 1)
+            reg[7] = pc
+            return target
+        return trap
+
+    def decode_reserved(self, word, pc): 
+        def reserved(): 
+            raise EmulatorError(f'illegal opcode in x{word:04X}', pc - 1)
+        return reserved
+
+def usage(): 
+    print('$ python emulator.py {program.lc3}')
+    print('  -n | --max-steps [n]  stop after n instructions')
+    print('  -j | --jit            compile hot basic blocks to Python')
+    print('  -a | --aot            also load blocks translated ahead of time (cached per image)')
+    print('  -i | --input [file]   read console input from file instead of stdin')
+    print('  --os-traps            run TRAPs through the service routines in memory')
+    print('  --async               drive the keyboard and display from stdin/stdout with asyncio')
+    print('  -t | --trace [file]   record every instruction to a trace file (see tracer.py)')
+    print('  --trace-range [x3000-x30FF,...]  only trace instructions in these ranges')
+    print('  -q | --quiet          only print errors')
+    print('  -h | --help')
+
+# tracing and reverse stepping wrap the interpreter's decoded entries, so neither runs compiled
+# code or the other
+def create_emulator(jit=False, aot=False, trace=None, reverse=False, verbose=True, **options) -> Emulator: 
+    wrappers = [name for name, used in (('--trace', trace is not None), ('--reverse', reverse)) if used]
+    compilers = [name for name, used in (('--jit', jit), ('--aot', aot)) if used]
+    if wrappers and compilers or len(wrappers) > 1: 
+        raise EmulatorError(f'{" and ".join(compilers + wrappers)} cannot be combined; {wrappers[0]} runs on the interpreter')
+    if reverse: 
+        from reverse import ReversibleEmulator
+        return ReversibleEmulator(verbose, **options)
+    if trace is not None: 
+        from tracer import TracingEmulator
+        return TracingEmulator(verbose, trace, **options)
+    if aot: 
+        from aot import AotEmulator
+        return AotEmulator(verbose, **options)
+    if jit: 
+        from jit import JitEmulator
+        return JitEmulator(verbose, **options)
+    return Emulator(verbose, **options)
+
+def option(*names, default=None): 
+    for name in names: 
+        if name in sys.argv: 
+            idx = sys.argv.index(name)
+            if idx + 1 < len(sys.argv): 
+                return sys.argv[idx + 1]
+    return default
+
+def main(): 
+    if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2: 
+        usage()
+        sys.exit(1)
+
+    max_steps = option('-n', '--max-steps')
+    input_fn = option('-i', '--input')
+    trace_fn = option('-t', '--trace')
+    trace = None
+    try: 
+        if trace_fn is not None: 
+            from tracer import TraceRecorder, parse_ranges
+            ranges = option('--trace-range')
+            trace = TraceRecorder(trace_fn, ranges=parse_ranges(ranges) if ranges else None)
+        emulator = create_emulator(
+            jit='-j' in sys.argv or '--jit' in sys.argv, 
+            aot='-a' in sys.argv or '--aot' in sys.argv, 
+            trace=trace, 
+            verbose='-q' not in sys.argv and '--quiet' not in sys.argv, 
+            console=Console(open(input_fn, 'rb')) if input_fn is not None else None, 
+            native_traps='--os-traps' not in sys.argv, 
+        )
+        emulator.load_image(sys.argv[1])
+        max_steps = int(max_steps) if max_steps is not None else None
+        if '--async' in sys.argv: 
+            from devices import run_interactive
+            asyncio.run(run_interactive(emulator, max_steps))
+        else: 
+            emulator.run(max_steps)
+    except (EmulatorError, OSError) as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(getattr(ex, 'code', 1))
+    finally: 
+        if trace is not None: 
+            trace.close()
+
+    state = 'halted' if emulator.halted else 'stopped'
+    emulator.log(f'[ INFO ] {state} at x{emulator.pc:04X} after {emulator.steps} instructions ({emulator.seconds:.3f}s, {emulator.mips:.2f} MIPS)')
+
+if __name__ == '__main__': 
+    main()
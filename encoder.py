@@ -0,0 +1,123 @@
+import sys
+from array import array
+from collections import namedtuple
+
+from errors import AssemblerError
+from instruction import SPECS
+
+# (spec id, operands...) -> encoded word, shared by every program encoded in this process
+encoding_cache = {}
+
+# encode every instruction in the store into one preallocated word image. Directives (.orig, .fill)
+# are raw words in the same table, so they land in the same buffer in program order.
+def encode_image(store, cache=encoding_cache) -> array: 
+    words = array('H', bytes(2 * len(store)))
+    a, b, c = store.operands
+    for idx, key in enumerate(zip(store.spec, a, b, c)): 
+        word = cache.get(key)
+        if word is None: 
+            word = cache[key] = SPECS[key[0]].encode(key[1:])
+        words[idx] = word
+    return words
+
+# region kinds: encoded words, zeros reserved by .blkw and a NUL-terminated .stringz
+WORD_RUN, ZERO_RUN, STRING_RUN = 0, 1, 2
+
+# A run of memory at addr. data is an array of words, a count of zeros or the text. index is the
+# store index of the line it starts at, for finding source lines.
+Region = namedtuple('Region', 'addr kind data index')
+
+# 1 for the spec ids that end a run of one-word lines, to find them with bytes.translate/find
+BOUNDARIES = bytes(1 if spec_id < len(SPECS) and SPECS[spec_id].size != 1 else 0 for spec_id in range(256))
+
+# Splits a store into regions: runs of one-word lines become one WORD_RUN each, sliced out of a
+# single encode_image() call, and .blkw/.stringz become a ZERO_RUN/STRING_RUN that records only
+# its length or text. pc counts from origin, the first .orig's address, and a later .orig moves
+# it; addresses are not wrapped, so a block longer than memory stays in one piece. Returns the
+# regions in source order and the pc after the store.
+def encode_regions(store, origin, pc=0, cache=encoding_cache): 
+    words = encode_image(store, cache)
+    spec_ids, values = store.spec, store.operands[0]
+    flags = spec_ids.tobytes().translate(BOUNDARIES)
+    regions = []
+    start = 0
+    while start <= len(store): 
+        idx = flags.find(1, start)
+        end = len(store) if idx == -1 else idx
+        if end > start: 
+            regions.append(Region(origin + pc, WORD_RUN, words[start:end], start))
+            pc += end - start
+        if idx == -1: 
+            break
+
+        spec = SPECS[spec_ids[idx]]
+        addr = origin + pc
+        if spec.mnemonic == '.orig': 
+            pc = values[idx] - origin
+        elif spec.mnemonic == '.blkw': 
+            regions.append(Region(addr, ZERO_RUN, values[idx], idx))
+            pc += values[idx]
+        else: 
+            text = store.strings[values[idx]]
+            regions.append(Region(addr, STRING_RUN, text, idx))
+            pc += len(text) + 1
+        start = idx + 1
+    return regions, pc
+
+def region_length(region) -> int: 
+    if region.kind == WORD_RUN: 
+        return len(region.data)
+    if region.kind == ZERO_RUN: 
+        return region.data
+    return len(region.data) + 1
+
+def region_words(region) -> array: 
+    if region.kind == WORD_RUN: 
+        return region.data
+    if region.kind == ZERO_RUN: 
+        return array('H', bytes(2 * region.data))
+    return string_words(region.data)
+
+# one character per word, NUL-terminated
+def string_words(text) -> array: 
+    words = array('H', [ord(c) & 0xFFFF for c in text])
+    words.append(0)
+    return words
+
+# sorts regions by address, checking that they don't overlap. A block may still run past the end
+# of memory, as one-block programs always could.
+def place_regions(regions) -> list: 
+    regions = sorted(regions, key=lambda region: region.addr)
+    end = 0
+    for region in regions: 
+        if region.addr < end: 
+            raise AssemblerError(f'x{region.addr:04X} is already taken by an earlier .orig block (up to x{end - 1:04X})')
+        end = region.addr + region_length(region)
+    return regions
+
+# the final image: [orig, words...] from the lowest region to the end of the highest, with the
+# gaps and zero runs filled in
+def materialize(regions) -> array: 
+    if not regions: 
+        return array('H')
+    start = regions[0].addr
+    image = array('H', [start])
+    for region in regions: 
+        gap = region.addr - start - (len(image) - 1)
+        if gap: 
+            image.frombytes(bytes(2 * gap))
+        if region.kind == ZERO_RUN: 
+            image.frombytes(bytes(2 * region.data))
+        else: 
+            image.extend(region_words(region))
+    return image
+
+# LC-3 object files are big-endian regardless of host
+def to_big_endian(words: array) -> array: 
+    if sys.byteorder == 'little': 
+        words = array('H', words)
+        words.byteswap()
+    return words
+
+def write_image(f, words: array): 
+    f.write(to_big_endian(words))
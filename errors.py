@@ -0,0 +1,37 @@
+class AssemblerError(Exception): 
+    def __init__(self, message, line=None, col=None, code=2): 
+        # all fields go to Exception so the error survives pickling between processes
+        super().__init__(message, line, col, code)
+        self.message = message
+        self.line = line
+        self.col = col
+        self.code = code
+
+    def __str__(self): 
+        if self.line is None: 
+            return self.message
+        if self.col is None: 
+            return f'line {self.line}: {self.message}'
+        return f'{self.line}:{self.col}: {self.message}'
+
+# problems across modules, one per line of the message
+class LinkerError(Exception): 
+    def __init__(self, message, code=4): 
+        super().__init__(message, code)
+        self.message = message
+        self.code = code
+
+    def __str__(self): 
+        return self.message
+
+class EmulatorError(Exception): 
+    def __init__(self, message, pc=None, code=3): 
+        super().__init__(message, pc, code)
+        self.message = message
+        self.pc = pc
+        self.code = code
+
+    def __str__(self): 
+        if self.pc is None: 
+            return self.message
+        return f'x{self.pc:04X}: {self.message}'
@@ -81,8 +81,15 @@ class Instruction:
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]}'
     
-    def encode(self): 
+    def spec(self): 
+        for spec in specs_by_class.get(type(self), ()): 
+            if spec.matches(self): 
+                return spec
         raise NotImplementedError
+
+    def encode(self): 
+        spec = self.spec()
+        return int_to_16_bit(spec.encode([getattr(self, field.name) for field in spec.fields]))
     
 @dataclass
 class BrInstruction(Instruction): 
@@ -94,18 +101,7 @@ class BrInstruction(Instruction):
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]}, n={self.n}, z={self.z}, p={self.p}, offset={self.offset}'
-    
-    def encode(self): 
-        first, second = 0, 0 
-        offset = twos_complement(self.offset, 9)
-        first += self.opcode << 4 
-        first += self.n << 3 
-        first += self.z << 2 
-        first += self.p << 1 
-        first += (offset >> 8) & 0x1 
-        second += offset & 0xFF 
-        return bytearray([first, second])
-    
+
 @dataclass
 class OrigInstruction(Instruction): 
     opcode: int 
@@ -117,9 +113,6 @@ class OrigInstruction(Instruction):
     def __repr__(self): 
         return f'OrigInstruction(opcode={opcode_int_to_str[self.opcode]}, addr={self.addr:#06x})'
 
-    def encode(self): 
-        return int_to_16_bit(self.addr)
-
 @dataclass
 class FillInstruction(Instruction): 
     opcode: int 
@@ -130,20 +123,36 @@ class FillInstruction(Instruction):
     
     def __repr__(self): 
         return f'FillInstruction(opcode={opcode_int_to_str[self.opcode]}, value={self.value:#06x})'
+
+@dataclass
+class BlkwInstruction(Instruction): 
+    opcode: int 
+    count: int
+
+    def __str__(self): 
+        return f'{opcode_int_to_str[self.opcode]}'
     
-    def encode(self): 
-        return int_to_16_bit(self.value)
+    def __repr__(self): 
+        return f'BlkwInstruction(opcode={opcode_int_to_str[self.opcode]}, count={self.count})'
+
+@dataclass
+class StringzInstruction(Instruction): 
+    opcode: int 
+    text: str
+
+    def __str__(self): 
+        return f'{opcode_int_to_str[self.opcode]}'
     
+    def __repr__(self): 
+        return f'StringzInstruction(opcode={opcode_int_to_str[self.opcode]}, text={self.text!r})'
+
 @dataclass
 class RtiInstruction(Instruction): 
     opcode: int 
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]}'
-    
-    def encode(self): 
-        return bytearray([self.opcode << 4, 0x00])
-    
+
 @dataclass
 class AddInstruction(Instruction): 
     dr: int 
@@ -158,19 +167,7 @@ class AddInstruction(Instruction):
         else: 
             s += f' #{self.imm}'
         return s 
-    
-    def encode(self): 
-        first = self.opcode << 4
-        first += self.dr << 1 
-        first += (self.sr1 >> 2) & 0x1
-        if self.sr2 is not None: 
-            second = ((self.sr1 & 0x3) << 6) + self.sr2
-        else: 
-            imm = twos_complement(self.imm, 5) if self.imm < 0 else self.imm
-            second = ((self.sr1 & 0x3) << 6) + (1 << 5) + imm
 
-        return bytearray([first , second]) 
-    
 @dataclass
 class AndInstruction(Instruction): 
     dr: int 
@@ -185,107 +182,46 @@ class AndInstruction(Instruction):
         else: 
             s += f' #{self.imm}'
         return s 
-    
-    def encode(self): 
-        first = self.opcode << 4
-        first += self.dr << 1 
-        first += (self.sr1 >> 2) & 0x1
-        if self.sr2 is not None: 
-            second = ((self.sr1 & 0x3) << 6) + self.sr2
-        else: 
-            imm = twos_complement(self.imm, 5) if self.imm < 0 else self.imm
-            second = ((self.sr1 & 0x3) << 6) + (1 << 5) + imm
-
-        return bytearray([first , second]) 
 
 @dataclass
 class JmpInstruction(Instruction): 
     base_reg: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.base_reg}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        first = self.opcode << 4
-        first += (self.base_reg >> 2) & 0x1
-        second += (self.base_reg & 0x3) << 6
-        return bytearray([first , second])
-    
+
 @dataclass
 class JsrInstruction(Instruction): 
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} x{self.offset:#x}'
-    
-    def encode(self): 
-        offset = twos_complement(self.offset, 11)
-        first = self.opcode << 4
-        first += 1 << 3
-        first += (offset >> 8) & 0x7
-        second = offset & 0xff
-        return bytearray([first , second]) 
-    
+
 @dataclass
 class JsrrInstruction(Instruction): 
     base_reg: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.base_reg}'
-    
-    def encode(self):
-        first, second = 0, 0
-        first = self.opcode << 4
-        first += (self.base_reg >> 2) & 0x1
-        second += (self.base_reg & 0x3) << 6
-        return bytearray([first , second])
-    
+
 @dataclass
 class LdInstruction(Instruction): 
     dr: int
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, x{self.offset:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        offset = twos_complement(self.offset, 9)
-        first = self.opcode << 4
-        first += self.dr << 1
-        first += (offset >> 8) & 0x1
-        second += offset & 0xff
-        return bytearray([first , second]) 
-    
+
 @dataclass
 class LdiInstruction(Instruction): 
     dr: int
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, x{self.offset:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        offset = twos_complement(self.offset, 9)
-        first = self.opcode << 4
-        first += self.dr << 1
-        first += (offset >> 8) & 0x1
-        second += offset & 0xff
-        return bytearray([first , second]) 
-    
+
 @dataclass
 class LeaInstruction(Instruction): 
     dr: int
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, x{self.offset:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        offset = twos_complement(self.offset, 9)
-        first = self.opcode << 4
-        first += self.dr << 1
-        first += (offset >> 8) & 0x1
-        second += offset & 0xff
-        return bytearray([first , second]) 
-   
+
 @dataclass
 class LdrInstruction(Instruction): 
     dr: int 
@@ -294,17 +230,7 @@ class LdrInstruction(Instruction):
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, R{self.base_reg}, #{self.offset}'
-    
-    def encode(self): 
-        first, second = 0, 0 
-        offset = twos_complement(self.offset, 6)
-        first += self.opcode << 4 
-        first += self.dr << 1 
-        first += (self.base_reg >> 2) & 0x1
-        second += (self.base_reg & 0x3) << 6 
-        second += offset & 0x3F
-        return bytearray([first, second])
-    
+
 @dataclass
 class NotInstruction(Instruction): 
     dr: int 
@@ -312,31 +238,13 @@ class NotInstruction(Instruction):
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, R{self.base_reg}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        first += self.opcode << 4 
-        first += self.dr << 1
-        first += (self.sr >> 2) & 0x1
-        second += (self.sr & 0x3) << 6
-        second += 0x3f
-        return bytearray([first, second])
-  
+
 @dataclass
 class StInstruction(Instruction): 
     dr: int
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, x{self.offset:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        offset = twos_complement(self.offset, 9)
-        first = self.opcode << 4
-        first += self.dr << 1
-        first += (offset >> 8) & 0x1
-        second += offset & 0xff
-        return bytearray([first , second]) 
 
 @dataclass
 class StiInstruction(Instruction): 
@@ -344,16 +252,7 @@ class StiInstruction(Instruction):
     offset: int 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, x{self.offset:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0
-        offset = twos_complement(self.offset, 9)
-        first = self.opcode << 4
-        first += self.dr << 1
-        first += (offset >> 8) & 0x1
-        second += offset & 0xff
-        return bytearray([first , second]) 
-  
+
 @dataclass
 class StrInstruction(Instruction): 
     dr: int 
@@ -362,17 +261,7 @@ class StrInstruction(Instruction):
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} R{self.dr}, R{self.base_reg}, #{self.offset}'
-    
-    def encode(self): 
-        first, second = 0, 0 
-        offset = twos_complement(self.offset, 6)
-        first += self.opcode << 4 
-        first += self.dr << 1 
-        first += (self.base_reg >> 2) & 0x1
-        second += (self.base_reg & 0x3) << 6 
-        second += offset & 0x3F
-        return bytearray([first, second])
-    
+
 @dataclass
 class TrapInstruction(Instruction): 
     vector: int
@@ -382,10 +271,127 @@ class TrapInstruction(Instruction):
 
     def __str__(self): 
         return f'{opcode_int_to_str[self.opcode]} {self.vector:#x}'
-    
-    def encode(self): 
-        first, second = 0, 0 
-        vector = twos_complement(self.vector, 8)
-        first += self.opcode << 4 
-        second += vector & 0xFF
-        return bytearray([first, second])
\ No newline at end of file
+
+class OperandKind(Enum): 
+    REGISTER = 'register'   # R0 - R7
+    IMMEDIATE = 'immediate' # signed #dec or xhex
+    OFFSET = 'offset'       # PC-relative label (or literal offset)
+    VECTOR = 'vector'       # unsigned trap vector
+    VALUE = 'value'         # full 16-bit word for directives
+    COUNT = 'count'         # unsigned word count for .blkw
+    STRING = 'string'       # quoted text for .stringz
+
+@dataclass
+class Field: 
+    name: str
+    kind: OperandKind
+    shift: int
+    bits: int
+
+    def __post_init__(self): 
+        self.mask = (1 << self.bits) - 1
+        signed = self.kind in { OperandKind.IMMEDIATE, OperandKind.OFFSET, OperandKind.VALUE }
+        self.min = -(1 << (self.bits - 1)) if signed else 0
+        # .fill/.orig accept both x8000 and #-32768
+        self.max = (1 << (self.bits - 1)) - 1 if signed and self.kind != OperandKind.VALUE else self.mask
+
+@dataclass
+class InstructionSpec: 
+    mnemonic: str
+    cls: type
+    opcode: int
+    fields: tuple = ()      # operands, in source order
+    constants: tuple = ()   # (field, value) pairs implied by the mnemonic
+    fixed: int = 0          # bits always set in the encoded word
+    size: int | None = 1    # words the line takes up; None when its operand decides
+
+    def __post_init__(self): 
+        # directives are raw words, everything else carries its opcode in the top nibble
+        word = 0 if self.mnemonic.startswith('.') else self.opcode << 12
+        for field, value in self.constants: 
+            word |= (value & field.mask) << field.shift
+        self.base = word | self.fixed
+
+    # words a line takes up, for the directives that reserve space given their first operand
+    def words(self, values) -> int: 
+        if self.size is not None: 
+            return self.size
+        return values[0] if self.mnemonic == '.blkw' else len(values[0]) + 1
+
+    def encode(self, values) -> int: 
+        word = self.base
+        for field, value in zip(self.fields, values): 
+            word |= (value & field.mask) << field.shift
+        return word
+
+    def build(self, values) -> Instruction: 
+        kwargs = { field.name: value for field, value in zip(self.fields, values) }
+        for field, value in self.constants: 
+            kwargs[field.name] = value
+        return self.cls(self.opcode, **kwargs)
+
+    def matches(self, instruction) -> bool: 
+        for field in self.fields: 
+            if getattr(instruction, field.name) is None: 
+                return False
+        for field, value in self.constants: 
+            if getattr(instruction, field.name) != value: 
+                return False
+        return True
+
+def reg(name, shift): 
+    return Field(name, OperandKind.REGISTER, shift, 3)
+
+def imm(name, bits): 
+    return Field(name, OperandKind.IMMEDIATE, 0, bits)
+
+def offset(bits): 
+    return Field('offset', OperandKind.OFFSET, 0, bits)
+
+def nzp_constants(suffix): 
+    if not suffix: 
+        suffix = 'nzp'
+    return tuple(
+        (Field(flag, OperandKind.VALUE, shift, 1), 1 if flag in suffix else 0)
+        for flag, shift in (('n', 11), ('z', 10), ('p', 9))
+    )
+
+SPECS = [
+    InstructionSpec('.orig', OrigInstruction, opcode_str_to_int['directive'], (Field('addr', OperandKind.VALUE, 0, 16),), size=0),
+    InstructionSpec('.fill', FillInstruction, opcode_str_to_int['directive'], (Field('value', OperandKind.VALUE, 0, 16),)),
+
+    InstructionSpec('add', AddInstruction, opcode_str_to_int['add'], (reg('dr', 9), reg('sr1', 6), reg('sr2', 0))),
+    InstructionSpec('add', AddInstruction, opcode_str_to_int['add'], (reg('dr', 9), reg('sr1', 6), imm('imm', 5)), fixed=0x20),
+    InstructionSpec('and', AndInstruction, opcode_str_to_int['and'], (reg('dr', 9), reg('sr1', 6), reg('sr2', 0))),
+    InstructionSpec('and', AndInstruction, opcode_str_to_int['and'], (reg('dr', 9), reg('sr1', 6), imm('imm', 5)), fixed=0x20),
+    *(
+        InstructionSpec('br' + suffix, BrInstruction, opcode_str_to_int['br'], (offset(9),), nzp_constants(suffix))
+        for suffix in ('', 'n', 'z', 'p', 'nz', 'np', 'zp', 'nzp')
+    ),
+    InstructionSpec('jmp', JmpInstruction, opcode_str_to_int['jmp'], (reg('base_reg', 6),)),
+    InstructionSpec('ret', JmpInstruction, opcode_str_to_int['jmp'], (), ((reg('base_reg', 6), 7),)),
+    InstructionSpec('jsr', JsrInstruction, opcode_str_to_int['jsr'], (offset(11),), fixed=0x800),
+    InstructionSpec('jsrr', JsrrInstruction, opcode_str_to_int['jsrr'], (reg('base_reg', 6),)),
+    InstructionSpec('ld', LdInstruction, opcode_str_to_int['ld'], (reg('dr', 9), offset(9))),
+    InstructionSpec('ldi', LdiInstruction, opcode_str_to_int['ldi'], (reg('dr', 9), offset(9))),
+    InstructionSpec('ldr', LdrInstruction, opcode_str_to_int['ldr'], (reg('dr', 9), reg('base_reg', 6), imm('offset', 6))),
+    InstructionSpec('lea', LeaInstruction, opcode_str_to_int['lea'], (reg('dr', 9), offset(9))),
+    InstructionSpec('not', NotInstruction, opcode_str_to_int['not'], (reg('dr', 9), reg('sr', 6)), fixed=0x3F),
+    InstructionSpec('rti', RtiInstruction, opcode_str_to_int['rti']),
+    InstructionSpec('st', StInstruction, opcode_str_to_int['st'], (reg('dr', 9), offset(9))),
+    InstructionSpec('sti', StiInstruction, opcode_str_to_int['sti'], (reg('dr', 9), offset(9))),
+    InstructionSpec('str', StrInstruction, opcode_str_to_int['str'], (reg('dr', 9), reg('base_reg', 6), imm('offset', 6))),
+    InstructionSpec('trap', TrapInstruction, opcode_str_to_int['trap'], (Field('vector', OperandKind.VECTOR, 0, 8),)),
+
+    # appended so the ids above stay what cached records hold
+    InstructionSpec('.blkw', BlkwInstruction, opcode_str_to_int['directive'], (Field('count', OperandKind.COUNT, 0, 16),), size=None),
+    InstructionSpec('.stringz', StringzInstruction, opcode_str_to_int['directive'], (Field('text', OperandKind.STRING, 0, 16),), size=None),
+]
+
+# mnemonic -> every form it can take, e.g. ADD with a register or an imm5 as the last operand
+spec_table = {}
+specs_by_class = {}
+for idx, spec in enumerate(SPECS): 
+    spec.id = idx
+    spec_table.setdefault(spec.mnemonic, []).append(spec)
+    specs_by_class.setdefault(spec.cls, []).append(spec)
@@ -0,0 +1,154 @@
+import struct
+from array import array
+
+from instruction import SPECS, Instruction, int_to_16_bit
+
+# most operands an instruction form can have (ADD/AND/LDR/STR)
+MAX_OPERANDS = 3
+
+class InstructionView: 
+    __slots__ = ('store', 'idx')
+
+    def __init__(self, store, idx): 
+        self.store = store
+        self.idx = idx
+
+    @property
+    def spec(self): 
+        return SPECS[self.store.spec[self.idx]]
+
+    @property
+    def values(self): 
+        return self.store.values(self.idx)
+
+    @property
+    def line(self): 
+        return self.store.line[self.idx]
+
+    @property
+    def opcode(self): 
+        return self.spec.opcode
+
+    def __getattr__(self, name): 
+        spec = self.spec
+        for field, value in zip(spec.fields, self.values): 
+            if field.name == name: 
+                return value
+        for field, value in spec.constants: 
+            if field.name == name: 
+                return value
+        raise AttributeError(name)
+
+    def instruction(self) -> Instruction: 
+        return self.spec.build(self.values)
+
+    def encode(self): 
+        return int_to_16_bit(self.spec.encode(self.values))
+
+    def __str__(self): 
+        return str(self.instruction())
+
+    def __repr__(self): 
+        return repr(self.instruction())
+
+# struct-of-arrays store for parsed instructions: one compact column per attribute instead of
+# one dataclass per line. Label operands are kept as ids into `labels` until they are resolved,
+# with bit i of `refs` marking operand i as such a reference, and .stringz text as ids into
+# `strings`, which belongs to the block (see spill()).
+class InstructionStore: 
+    def __init__(self): 
+        self.spec = array('B')
+        self.operands = [array('i') for _ in range(MAX_OPERANDS)]
+        self.refs = array('B')
+        self.line = array('I')
+        self.labels = []
+        self.label_ids = {}
+        self.strings = []
+
+    def intern(self, label): 
+        label_id = self.label_ids.get(label)
+        if label_id is None: 
+            label_id = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    # label operands flagged in `refs` may be passed by name
+    def append(self, spec, values, refs=0, line=0): 
+        if refs: 
+            values = [self.intern(value) if refs & (1 << slot) else value for slot, value in enumerate(values)]
+        if spec.mnemonic == '.stringz': 
+            self.strings.append(values[0])
+            values = [len(self.strings) - 1]
+        self.spec.append(spec.id)
+        for idx, column in enumerate(self.operands): 
+            column.append(values[idx] if idx < len(values) else 0)
+        self.refs.append(refs)
+        self.line.append(line)
+
+    def values(self, idx): 
+        spec = SPECS[self.spec[idx]]
+        if spec.mnemonic == '.stringz': 
+            return [self.strings[self.operands[0][idx]]]
+        return [self.operands[i][idx] for i in range(len(spec.fields))]
+
+    def set_operand(self, idx, slot, value): 
+        self.operands[slot][idx] = value
+        self.refs[idx] &= ~(1 << slot)
+
+    def columns(self): 
+        return [self.spec, *self.operands, self.refs, self.line]
+
+    def nbytes(self): 
+        return sum(column.itemsize * len(column) for column in self.columns())
+
+    def clear(self): 
+        for column in self.columns(): 
+            del column[:]
+        del self.strings[:]
+
+    # append the columns to a spill file as one block and empty the store. Label ids stay valid
+    # since the label table is kept; strings are written with the block that uses them.
+    def spill(self, f): 
+        f.write(struct.pack('<I', len(self)))
+        for column in self.columns(): 
+            f.write(column)
+        data = [text.encode('utf-8', 'surrogatepass') for text in self.strings]
+        f.write(struct.pack('<I', len(data)))
+        f.write(array('I', [len(text) for text in data]))
+        f.write(b''.join(data))
+        self.clear()
+
+    # replace the columns with the next block of a spill file, returning False at the end
+    def load(self, f) -> bool: 
+        header = f.read(4)
+        if not header: 
+            return False
+
+        (count,) = struct.unpack('<I', header)
+        for column in self.columns(): 
+            del column[:]
+            column.frombytes(f.read(count * column.itemsize))
+        (count,) = struct.unpack('<I', f.read(4))
+        sizes = array('I')
+        sizes.frombytes(f.read(count * sizes.itemsize))
+        data = f.read(sum(sizes))
+        self.strings[:] = []
+        start = 0
+        for size in sizes: 
+            self.strings.append(data[start:start + size].decode('utf-8', 'surrogatepass'))
+            start += size
+        return True
+
+    def __len__(self): 
+        return len(self.spec)
+
+    def __getitem__(self, idx): 
+        if idx < 0: 
+            idx += len(self)
+        if not 0 <= idx < len(self): 
+            raise IndexError(idx)
+        return InstructionView(self, idx)
+
+    def __iter__(self): 
+        for idx in range(len(self)): 
+            yield InstructionView(self, idx)
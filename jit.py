@@ -0,0 +1,431 @@
+import time
+from array import array
+
+from emulator import Emulator, Stop, Break, MAX_STEPS, MEMORY_SIZE, CC_BITS, sext
+from errors import EmulatorError
+from instruction import opcode_str_to_int
+from snapshot import PAGE_SHIFT
+
+BR, ADD, LD, ST, JSR, AND, LDR, STR = (opcode_str_to_int[name] for name in ('br', 'add', 'ld', 'st', 'jsr', 'and', 'ldr', 'str'))
+RTI, NOT, LDI, STI, JMP, LEA, TRAP = (opcode_str_to_int[name] for name in ('rti', 'not', 'ldi', 'sti', 'jmp', 'lea', 'trap'))
+RESERVED = opcode_str_to_int['directive']
+
+# opcodes that end a basic block (the reserved opcode included, since it faults)
+ENDS = bytes(1 if opcode in (BR, JMP, JSR, TRAP, RTI, RESERVED) else 0 for opcode in range(16))
+
+# branch conditions on the value the condition codes were last set from, by nzp
+CONDITIONS = [
+    None, 
+    '0 < {0} < 0x8000', 
+    'not {0}', 
+    '{0} < 0x8000', 
+    '{0} & 0x8000', 
+    '({0} & 0x8000 or 0 < {0})', 
+    'not 0 < {0} < 0x8000', 
+    None, 
+]
+
+# names generated blocks use, bound by JitEmulator.block_env()
+BLOCK_ARGS = (
+    'reg', 'memory', 'decoded', 'decode', 'dirty', 'code', 'invalidate', 
+    'flags', 'read_io', 'write_device', 'hits', 'cc_bits', 'SideExit', 
+)
+
+MAX_BLOCK = 64
+HOT_THRESHOLD = 16
+
+# raised by a block that has to stop before its end, after writing its state back: a store
+# overwrote one of its own instructions, so the rest of it runs again from memory, a store to
+# a device register may have stopped the machine, or an access hit a watchpoint
+class SideExit(Exception): 
+    def __init__(self, pc, count): 
+        super().__init__(pc, count)
+        self.pc = pc
+        self.count = count
+
+# Translates the basic block at start into the source of a Python function block(budget) that
+# runs it and returns (next pc, instructions executed). Registers live in locals for the length
+# of the block, condition codes are only written back once (as the last value that set them),
+# and a block that branches back to its own start loops inside the function, for as long as
+# budget allows. Loads and stores to pages with flags set go through read_io and write_device.
+# Blocks end before any address set in breaks, so breakpoints are only ever at block starts.
+# The function refers to the names in BLOCK_ARGS, which the caller binds.
+class BlockTranslator: 
+    def __init__(self, memory, flags, start, max_length=MAX_BLOCK, end=MEMORY_SIZE, breaks=None): 
+        self.memory = memory
+        self.flags = flags
+        self.start = start
+        self.words = []
+        addr = start
+        while len(self.words) < max_length and addr < end: 
+            if breaks is not None and addr != start and breaks[addr]: 
+                break
+            word = memory[addr]
+            self.words.append(word)
+            addr += 1
+            if ENDS[word >> 12]: 
+                break
+            # a store into this block ends it, so nothing after the store runs stale code
+            target = (addr + sext(word, 9)) & 0xFFFF
+            if word >> 12 == ST and (start <= target < start + max_length or flags[target >> PAGE_SHIFT]): 
+                break
+        self.end = addr
+        self.length = len(self.words)
+
+        last = self.words[-1]
+        self.loops = last >> 12 == BR and (last >> 9) & 7 != 0 and (self.end + sext(last, 9)) & 0xFFFF == start
+
+        self.lines = []
+        self.used = set()
+        self.written = set()
+        # a side exit in the loop of a block that loops may come after an earlier pass wrote any of
+        # the block's registers, so it writes back all of them
+        self.loop_written = set()
+        if self.loops: 
+            for word in self.words: 
+                if word >> 12 in (ADD, AND, NOT, LD, LDI, LDR, LEA): 
+                    self.loop_written.add((word >> 9) & 7)
+        self.cc = None
+        self.reads_cc = False
+        # lines after the loop of a block that loops, for when budget runs out
+        self.tail = []
+
+    def emit(self, line): 
+        self.lines.append(line)
+
+    def read(self, r): 
+        self.used.add(r)
+        return f'r{r}'
+
+    def write(self, r, sets_cc): 
+        self.used.add(r)
+        self.written.add(r)
+        if not sets_cc and self.cc == f'r{r}': 
+            self.emit(f'c = r{r}')
+            self.cc = 'c'
+        if sets_cc: 
+            self.cc = f'r{r}'
+        return f'r{r}'
+
+    def cc_value(self): 
+        if self.cc is None: 
+            self.reads_cc = True
+            return 'c'
+        return self.cc
+
+    # base register + offset6 of a LDR/STR
+    def address(self, base, word): 
+        offset = sext(word, 6) & 0xFFFF
+        if offset == 0: 
+            return self.read(base)
+        return f'({self.read(base)} + {offset}) & 0xFFFF'
+
+    def count(self, done): 
+        return f'i + {done}' if self.loops else str(done)
+
+    # in a block that loops, c carries the condition value from one pass to the next (see
+    # branch()), so it is the right value wherever this pass has not set one yet
+    def writeback(self, indent=''): 
+        lines = [f'{indent}reg[{r}] = r{r}' for r in sorted(self.written | self.loop_written)]
+        if self.cc is not None or self.loops: 
+            lines.append(f'{indent}reg[8] = {self.cc_value()}')
+        return lines
+
+    def exit(self, target): 
+        self.lines.extend(self.writeback())
+        self.emit(f'return {target}, {self.count(self.length)}')
+
+    def flagged(self, target): 
+        return self.flags[int(target, 16) >> PAGE_SHIFT]
+
+    # a load from a static address, or from t
+    def load(self, target): 
+        if target != 't': 
+            return f'read_io({target})' if self.flagged(target) else f'memory[{target}]'
+        return f'read_io(t) if flags[t >> {PAGE_SHIFT}] else memory[t]'
+
+    # leaves the block at pc if a load through read_io hit a watchpoint
+    def check_hits(self, done, pc, indent=''): 
+        self.emit(f'{indent}if hits: ')
+        self.lines.extend(self.writeback(indent + '    '))
+        self.emit(f'{indent}    raise SideExit({hex(pc)}, {self.count(done)})')
+
+    # loads from flagged pages are followed by a check for watchpoint hits, on their own path
+    # when the address is only known at run time
+    def load_register(self, dr, target, done, pc): 
+        dest = self.write(dr, True)
+        if target != 't': 
+            self.emit(f'{dest} = {self.load(target)}')
+            if self.flagged(target): 
+                self.check_hits(done, pc)
+            return
+        self.emit(f'if flags[t >> {PAGE_SHIFT}]: ')
+        self.emit(f'    {dest} = read_io(t)')
+        self.check_hits(done, pc, '    ')
+        self.emit('else: ')
+        self.emit(f'    {dest} = memory[t]')
+
+    def store(self, target, value, done, pc): 
+        if target != 't' and self.flags[int(target, 16) >> PAGE_SHIFT]: 
+            self.lines.extend(self.writeback())
+            self.emit(f'write_device({target}, {value})')
+            self.emit(f'raise SideExit({hex(pc)}, {self.count(done)})')
+            return
+        if target == 't': 
+            self.emit(f'if flags[t >> {PAGE_SHIFT}]: ')
+            self.lines.extend(self.writeback('    '))
+            self.emit(f'    write_device(t, {value})')
+            self.emit(f'    raise SideExit({hex(pc)}, {self.count(done)})')
+
+        self.emit(f'memory[{target}] = {value}')
+        self.emit(f'decoded[{target}] = None')
+        if target == 't': 
+            self.emit(f'dirty[t >> {PAGE_SHIFT}] = 1')
+        else: 
+            self.emit(f'dirty[{hex(int(target, 16) >> PAGE_SHIFT)}] = 1')
+        self.emit(f'if code[{target}]: ')
+        self.emit(f'    invalidate({target})')
+        if target == 't': 
+            self.emit(f'    if {hex(self.start)} <= {target} < {hex(self.end)}: ')
+            self.lines.extend(self.writeback('        '))
+            self.emit(f'        raise SideExit({hex(pc)}, {self.count(done)})')
+
+    def translate(self): 
+        for done, word in enumerate(self.words, 1): 
+            addr = self.start + done - 1
+            pc = (addr + 1) & 0xFFFF
+            opcode = word >> 12
+            dr, sr1 = (word >> 9) & 7, (word >> 6) & 7
+            pc_offset = (pc + sext(word, 9)) & 0xFFFF
+
+            if opcode in (ADD, AND): 
+                operand = self.read(word & 7) if not word & 0x20 else str(sext(word, 5) & 0xFFFF)
+                expr = f'({self.read(sr1)} + {operand}) & 0xFFFF' if opcode == ADD else f'{self.read(sr1)} & {operand}'
+                self.emit(f'{self.write(dr, True)} = {expr}')
+            elif opcode == NOT: 
+                self.emit(f'{self.write(dr, True)} = {self.read(sr1)} ^ 0xFFFF')
+            elif opcode == LD: 
+                self.load_register(dr, hex(pc_offset), done, pc)
+            elif opcode == LDI: 
+                self.emit(f't = {self.load(hex(pc_offset))}')
+                self.load_register(dr, 't', done, pc)
+                if self.flagged(hex(pc_offset)): 
+                    self.check_hits(done, pc)
+            elif opcode == LDR: 
+                self.emit(f't = {self.address(sr1, word)}')
+                self.load_register(dr, 't', done, pc)
+            elif opcode == LEA: 
+                self.emit(f'{self.write(dr, False)} = {hex(pc_offset)}')
+            elif opcode == ST: 
+                self.store(hex(pc_offset), self.read(dr), done, pc)
+            elif opcode == STI: 
+                self.emit(f't = {self.load(hex(pc_offset))}')
+                self.store('t', self.read(dr), done, pc)
+                if self.flagged(hex(pc_offset)): 
+                    self.check_hits(done, pc)
+            elif opcode == STR: 
+                self.emit(f't = {self.address(sr1, word)}')
+                self.store('t', self.read(dr), done, pc)
+            elif opcode == BR: 
+                self.branch(word, pc, pc_offset)
+            elif opcode == JMP: 
+                self.exit(self.read(sr1))
+            elif opcode == JSR: 
+                target = hex((pc + sext(word, 11)) & 0xFFFF) if word & 0x800 else self.read(sr1)
+                if not word & 0x800: 
+                    self.emit(f't = {target}')
+                    target = 't'
+                self.emit(f'{self.write(7, False)} = {hex(pc)}')
+                self.exit(target)
+            else: 
+                # TRAP, RTI and reserved opcodes run through the interpreter's handler
+                self.exit(f'(decoded[{hex(addr)}] or decode({hex(addr)}))()')
+
+        if not ENDS[self.words[-1] >> 12]: 
+            self.exit(hex(self.end & 0xFFFF))
+        return self.source()
+
+    def branch(self, word, pc, target): 
+        nzp = (word >> 9) & 7
+        if nzp == 0: 
+            self.exit(hex(pc))
+            return
+        if nzp == 7: 
+            if self.loops: 
+                self.carry_cc()
+                self.tail = self.writeback() + [f'return {hex(target)}, stop']
+            else: 
+                self.exit(hex(target))
+            return
+
+        condition = CONDITIONS[nzp].format(self.cc_value())
+        if self.loops: 
+            self.emit(f'if not {condition}: ')
+            self.lines.extend(self.writeback('    '))
+            self.emit(f'    return {hex(pc)}, i + {self.length}')
+            self.carry_cc()
+            self.tail = self.writeback() + [f'return {hex(target)}, stop']
+            return
+
+        self.lines.extend(self.writeback())
+        self.emit(f'return ({hex(target)}, {self.length}) if {condition} else ({hex(pc)}, {self.length})')
+
+    # at the end of a pass, when anything in the block reads c
+    def carry_cc(self): 
+        if self.reads_cc and self.cc not in (None, 'c'): 
+            self.emit(f'c = {self.cc}')
+            self.cc = 'c'
+
+    def source(self, name=None): 
+        name = name or f'block_{self.start:04x}'
+        body = [f'def {name}(budget): ']
+        registers = sorted(self.used)
+        if registers: 
+            body.append(f'    {", ".join(f"r{r}" for r in registers)}, = {", ".join(f"reg[{r}]" for r in registers)},')
+        if self.reads_cc: 
+            body.append('    c = reg[8]')
+        indent = '    '
+        if self.loops: 
+            body.append(f'    stop = budget - budget % {self.length}')
+            body.append(f'    for i in range(0, stop, {self.length}): ')
+            indent = '        '
+        body.extend(indent + line for line in self.lines)
+        body.extend('    ' + line for line in self.tail)
+        return '\n'.join(body) + '\n'
+
+# Tiered emulator: code runs in the interpreter until the block it starts at has been entered
+# HOT_THRESHOLD times, then the block is translated to Python and exec'd into a closure that
+# runs in its place. code[addr] is set for every word that belongs to a compiled block; stores
+# to such words (from the interpreter or from compiled code) drop the blocks that contain them.
+# Words with breakpoints are left to the interpreter, which decodes them into breakpoint entries.
+class JitEmulator(Emulator): 
+    def __init__(self, verbose=True, threshold=HOT_THRESHOLD, max_block=MAX_BLOCK, **options): 
+        super().__init__(verbose, **options)
+        self.threshold = threshold
+        self.max_block = max_block
+        self.blocks = [None] * MEMORY_SIZE
+        self.lengths = array('H', bytes(2 * MEMORY_SIZE))
+        self.counts = array('I', bytes(4 * MEMORY_SIZE))
+        # addr -> starts of the compiled blocks that contain it
+        self.owners = {}
+        self.compiled = 0
+
+    def bind(self, source, name): 
+        namespace = {}
+        exec(compile(source, f'<{name}>', 'exec'), namespace)
+        return namespace
+
+    # values for BLOCK_ARGS
+    def block_env(self): 
+        return (
+            self.reg, self.memory, self.decoded, self.decode, self.dirty, self.code, self.invalidate_code, 
+            self.page_flags, self.read_io, self.write_device, self.hits, CC_BITS, SideExit, 
+        )
+
+    def compile_block(self, start): 
+        if self.breakpoints[start]: 
+            return
+        translator = BlockTranslator(self.memory, self.page_flags, start, self.max_block, breaks=self.breakpoints)
+        lines = translator.translate().splitlines()
+        name = f'block_{start:04x}'
+        source = f'def make({", ".join(BLOCK_ARGS)}): \n'
+        source += ''.join(f'    {line}\n' for line in lines)
+        source += f'    return {name}\n'
+        make = self.bind(source, name)['make']
+        self.install(start, translator.end, make(*self.block_env()))
+
+    def install(self, start, end, block): 
+        self.blocks[start] = block
+        self.lengths[start] = end - start
+        for addr in range(start, end): 
+            self.owners.setdefault(addr, set()).add(start)
+            self.code[addr] = 1
+        self.compiled += 1
+
+    def invalidate_code(self, addr): 
+        for start in self.owners.pop(addr, ()): 
+            if self.blocks[start] is None: 
+                continue
+            self.blocks[start] = None
+            self.counts[start] = 0
+            for other in range(start, start + self.lengths[start]): 
+                owners = self.owners.get(other)
+                if owners is None: 
+                    continue
+                owners.discard(start)
+                if not owners: 
+                    del self.owners[other]
+                    self.code[other] = 0
+        self.code[addr] = 0
+
+    def invalidate(self, start, end): 
+        super().invalidate(start, end)
+        for addr in range(start, end): 
+            if self.code[addr]: 
+                self.invalidate_code(addr)
+
+    def run(self, max_steps=None): 
+        limit = MAX_STEPS if max_steps is None else max_steps
+        blocks, lengths, counts, threshold = self.blocks, self.lengths, self.counts, self.threshold
+        memory, decoded, decode, ends = self.memory, self.decoded, self.decode, ENDS
+        pc = self.pc
+        executed = 0
+        # instructions the call in progress is running, for counting the ones that completed
+        # when it raises
+        pending = 0
+        self.halted = False
+        self.hits.clear()
+        start = time.perf_counter()
+        try: 
+            while executed < limit: 
+                try: 
+                    while executed < limit: 
+                        block = blocks[pc]
+                        if block is None: 
+                            counts[pc] += 1
+                            if counts[pc] >= threshold: 
+                                self.compile_block(pc)
+                                block = blocks[pc]
+
+                        if block is not None and lengths[pc] <= limit - executed: 
+                            pending = lengths[pc]
+                            pc, count = block(limit - executed)
+                            executed += count
+                            continue
+
+                        pending = 1
+                        while True: 
+                            word = memory[pc]
+                            op = decoded[pc]
+                            if op is None: 
+                                op = decode(pc)
+                            pc = op()
+                            executed += 1
+                            if ends[word >> 12] or executed >= limit or blocks[pc] is not None: 
+                                break
+                except SideExit as ex: 
+                    pc = ex.pc
+                    executed += ex.count
+                    if self.halted or self.hits: 
+                        pending = 0
+                        self.pc = pc
+                        raise Stop
+        except Break: 
+            executed += pending - 1
+            pc = self.pc
+        except Stop: 
+            executed += pending
+            pc = self.pc
+        except EmulatorError as ex: 
+            # a block that hands its last instruction to the interpreter still has its own start
+            # in pc; the fault carries the address of the instruction that raised it
+            executed += pending - 1
+            if ex.pc is not None: 
+                pc = ex.pc
+            raise
+        finally: 
+            self.pc = pc
+            self.steps += executed
+            self.seconds += time.perf_counter() - start
+            self.console.flush()
+        return executed
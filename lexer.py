@@ -0,0 +1,108 @@
+import re
+from enum import Enum
+from typing import NamedTuple
+
+from errors import AssemblerError
+from instruction import opcode_str_to_int
+
+class TokenKind(str, Enum): 
+    MNEMONIC = 'mnemonic'
+    REGISTER = 'register'
+    DECIMAL = 'decimal'
+    HEX = 'hex'
+    LABEL = 'label'
+    LABEL_DEF = 'label:'
+    STRING = 'string'
+    COMMA = ','
+
+class Token(NamedTuple): 
+    kind: TokenKind
+    value: str
+    line: int
+    col: int
+
+    def __str__(self): 
+        return self.value
+
+DIRECTIVES = { '.orig', '.fill', '.blkw', '.stringz', '.external', '.end' }
+
+MNEMONICS = (set(opcode_str_to_int) - { 'br', 'directive' }) | { 'ret' } | DIRECTIVES | {
+    'br' + nzp for nzp in ('', 'n', 'z', 'p', 'nz', 'np', 'zp', 'nzp')
+}
+
+ESCAPES = { 'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '"': '"', '\\': '\\' }
+
+# order matters: numbers and registers are tried before the generic word rule so that
+# `x23`, `#-5` and `r7` are never lexed as labels
+TOKEN_RE = re.compile(r'''
+    (?P<ws>[ \t\r]+)
+  | (?P<newline>\n)
+  | (?P<comment>;[^\n]*)
+  | (?P<comma>,)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<decimal>\#-?[0-9]+)\b
+  | (?P<hex>x-?[0-9a-f]+)\b
+  | (?P<register>r[0-7])\b
+  | (?P<word>\.?[a-z_][a-z0-9_]*)(?P<colon>:)?
+  | (?P<error>.)
+''', re.VERBOSE | re.IGNORECASE)
+
+def unescape(literal: str): 
+    if '\\' not in literal: 
+        return literal
+    chars = []
+    idx = 0
+    while idx < len(literal): 
+        c = literal[idx]
+        if c == '\\' and idx + 1 < len(literal): 
+            idx += 1
+            c = ESCAPES.get(literal[idx], literal[idx])
+        chars.append(c)
+        idx += 1
+    return ''.join(chars)
+
+# yields (line number, tokens) for each line of source that has at least one token
+def tokenize(source: str, first_line=1): 
+    line = first_line
+    line_start = 0
+    tokens = []
+    for match in TOKEN_RE.finditer(source): 
+        group = match.lastgroup
+        if group == 'ws' or group == 'comment': 
+            continue
+
+        if group == 'newline': 
+            if tokens: 
+                yield line, tokens
+                tokens = []
+            line += 1
+            line_start = match.end()
+            continue
+
+        col = match.start() - line_start + 1
+        if group == 'colon': 
+            tokens.append(Token(TokenKind.LABEL_DEF, match.group('word').lower(), line, col))
+        elif group == 'word': 
+            value = match.group('word').lower()
+            kind = TokenKind.MNEMONIC if value in MNEMONICS else TokenKind.LABEL
+            tokens.append(Token(kind, value, line, col))
+        elif group == 'register': 
+            tokens.append(Token(TokenKind.REGISTER, match.group().lower(), line, col))
+        elif group == 'decimal': 
+            tokens.append(Token(TokenKind.DECIMAL, match.group(), line, col))
+        elif group == 'hex': 
+            tokens.append(Token(TokenKind.HEX, match.group().lower(), line, col))
+        elif group == 'comma': 
+            tokens.append(Token(TokenKind.COMMA, ',', line, col))
+        elif group == 'string': 
+            tokens.append(Token(TokenKind.STRING, unescape(match.group()[1:-1]), line, col))
+        else: 
+            raise AssemblerError(f'unexpected character: {match.group()!r}', line, col)
+
+    if tokens: 
+        yield line, tokens
+
+def tokenize_line(line: str, line_no=1): 
+    for _, tokens in tokenize(line, line_no): 
+        return tokens
+    return []
@@ -0,0 +1,191 @@
+import os
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from assembler import option
+from errors import LinkerError
+from objfile import ObjectModule, read_object, write_object, EXTERNAL, LINKED, ZEROS
+
+# Links modules written by `assembler.py --module` into one image. Objects are read in a thread
+# pool, every label of every module goes into one dict (the global symbol index) as its absolute
+# address, and each module's relocations are then patched in a few array operations: look up the
+# targets, subtract the addresses of the words that use them, range check and merge the offsets
+# into the words' PC-relative fields. Problems are collected across all modules and reported
+# together.
+class Linker: 
+    def __init__(self, paths, jobs=None, verbose=True): 
+        self.paths = paths
+        self.jobs = jobs
+        self.verbose = verbose
+        self.modules = []
+        self.index = {}
+        self.symbols = []
+        self.words = []
+        self.errors = []
+
+    def log(self, *args): 
+        if self.verbose: 
+            print(*args)
+
+    def link(self): 
+        self.load()
+        self.build_index()
+        self.place()
+        self.check()
+        for module, symbols in zip(self.modules, self.symbols): 
+            self.relocate(module, symbols)
+        self.check()
+        return self.emit()
+
+    def load(self): 
+        def read(path): 
+            try: 
+                return read_object(path)
+            except (OSError, ValueError) as ex: 
+                return ex
+
+        with ThreadPoolExecutor(self.jobs) as pool: 
+            loaded = list(pool.map(read, self.paths))
+        for path, module in zip(self.paths, loaded): 
+            if isinstance(module, Exception): 
+                self.errors.append(f'{path}: {module}')
+            else: 
+                self.modules.append(module)
+        self.check()
+
+    # every label is global, so labels a module keeps to itself (LOOP, DONE) may repeat across
+    # modules; a name is only a duplicate when it is defined twice and imported somewhere
+    def build_index(self): 
+        index, owners = self.index, {}
+        self.symbols = [module.symbols() for module in self.modules]
+        for module, symbols in zip(self.modules, self.symbols): 
+            for symbol in symbols: 
+                if not symbol.flags & EXTERNAL: 
+                    owners.setdefault(symbol.name, []).append(module.name)
+                    index.setdefault(symbol.name, symbol.value)
+
+        for module, symbols in zip(self.modules, self.symbols): 
+            for idx, symbol in enumerate(symbols): 
+                if not symbol.flags & EXTERNAL: 
+                    continue
+                if symbol.name not in owners: 
+                    lines = sorted({line for symbol_id, line in zip(module[b'RSYM'], module[b'RLIN']) if symbol_id == idx})
+                    self.errors.append(f'{module.name}: undefined external {symbol.name} ({"lines" if len(lines) > 1 else "line"} {", ".join(map(str, lines))})')
+                elif len(owners[symbol.name]) > 1: 
+                    self.errors.append(f'{module.name}: {symbol.name} is defined in more than one module: {", ".join(owners[symbol.name])}')
+
+    # segments sit at their own .orig; report any that overlap or run past the end of memory
+    def place(self): 
+        spans = sorted((segment.orig, segment.orig + segment.length, module.name) for module in self.modules for segment in module.segments())
+        for (start, end, name), (next_start, _, next_name) in zip(spans, spans[1:]): 
+            if end > next_start: 
+                self.errors.append(f'{name} (x{start:04X}-x{end - 1:04X}) overlaps {next_name} at x{next_start:04X}')
+        for start, end, name in spans: 
+            if end > 1 << 16: 
+                self.errors.append(f'{name} (x{start:04X}) runs past the end of memory')
+        self.spans = spans
+
+    # patched words go to self.words, the module itself may be a read-only mapping
+    def relocate(self, module, symbols): 
+        if not module.relocations(): 
+            self.words.append(module.words)
+            return
+        targets = np.array([self.index[symbol.name] if symbol.flags & EXTERNAL else symbol.value for symbol in symbols], dtype=np.int64)
+        origs = np.frombuffer(module[b'SORG'], dtype=np.uint16).astype(np.int64)
+        starts = np.frombuffer(module[b'SOFF'], dtype=np.uint32).astype(np.int64)
+        offsets = np.frombuffer(module[b'RWRD'], dtype=np.uint32).astype(np.int64)
+        bits = np.frombuffer(module[b'RBIT'], dtype=np.uint8).astype(np.int64)
+
+        segments = np.searchsorted(starts, offsets, side='right') - 1
+        addresses = origs[segments] + offsets - starts[segments]
+        values = targets[np.frombuffer(module[b'RSYM'], dtype=np.uint16)] - (addresses + 1)
+
+        limit = np.int64(1) << (bits - 1)
+        bad = np.flatnonzero((values < -limit) | (values >= limit))
+        for idx in bad.tolist(): 
+            label = symbols[module[b'RSYM'][idx]].name
+            self.errors.append(f'{module.name}: line {module[b"RLIN"][idx]}: {label} is out of range of a {module[b"RBIT"][idx]}-bit offset: {values[idx]}')
+
+        words = np.frombuffer(module.words, dtype=np.uint16).astype(np.int64)
+        mask = (np.int64(1) << bits) - 1
+        words[offsets] = (words[offsets] & ~mask) | (values & mask)
+        self.words.append(array('H', words.astype(np.uint16).tobytes()))
+
+    def check(self): 
+        if self.errors: 
+            raise LinkerError('\n'.join(self.errors))
+
+    # one image from the lowest .orig to the end of the highest segment, gaps zero-filled, as
+    # [orig, words...] like the assembler's
+    def emit(self) -> np.ndarray: 
+        start = self.spans[0][0]
+        end = max(end for _, end, _ in self.spans)
+        image = np.zeros(end - start + 1, dtype=np.uint16)
+        image[0] = start
+        for module, words in zip(self.modules, self.words): 
+            words = np.frombuffer(words, dtype=np.uint16)
+            for segment in module.segments(): 
+                if segment.kind == ZEROS: 
+                    continue
+                at = segment.orig - start + 1
+                image[at:at + segment.length] = words[segment.start:segment.start + segment.length]
+        self.image = image
+        self.log(f'[ INFO ] Linked {len(self.modules)} modules, {len(self.index)} symbols, x{start:04X}-x{end - 1:04X}')
+        return image
+
+    # a linked object keeps the modules' segments apart instead of filling the gaps between them,
+    # along with every label defined
+    def linked_object(self, name) -> ObjectModule: 
+        linked = ObjectModule(name, LINKED)
+        for module, symbols, words in zip(self.modules, self.symbols, self.words): 
+            base = len(linked[b'SORG'])
+            for segment in module.segments(): 
+                linked.add_segment(segment.orig, words[segment.start:segment.start + segment.length], segment.kind, segment.length)
+            for symbol in symbols: 
+                if not symbol.flags & EXTERNAL: 
+                    linked.add_symbol(symbol.name, symbol.value, base + symbol.segment)
+        return linked
+
+    def write(self, filename): 
+        if filename.endswith('.obj'): 
+            write_object(filename, self.linked_object(os.path.basename(filename)))
+        else: 
+            with open(filename, 'wb') as f: 
+                f.write(self.image.astype('>u2').tobytes())
+        self.log(f'Successfully wrote bytes to {filename}')
+
+def usage(): 
+    print('$ python linker.py {module.obj ...}')
+    print('  -o | --output [filename]  output image, or a linked object if it ends in .obj')
+    print('                            (default: the first module\'s name with .lc3)')
+    print('  -j | --jobs [n]           threads used to read modules')
+    print('  -h | --help')
+
+def main(): 
+    if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2: 
+        usage()
+        sys.exit(1)
+
+    args, skip = [], False
+    for arg in sys.argv[1:]: 
+        if skip: 
+            skip = False
+        elif arg in ('-o', '--output', '-j', '--jobs'): 
+            skip = True
+        else: 
+            args.append(arg)
+    output_fn = option('-o', '--output', default=os.path.splitext(args[0])[0] + '.lc3')
+
+    linker = Linker(args, jobs=int(option('-j', '--jobs', default='0')) or None)
+    try: 
+        linker.link()
+        linker.write(output_fn)
+    except LinkerError as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(ex.code)
+
+if __name__ == '__main__': 
+    main()
@@ -0,0 +1,218 @@
+import sys
+import time
+
+import numpy as np
+
+from emulator import CC_BITS, CC_VALUES, HALT_VECTOR, MEMORY_SIZE, read_image
+from errors import EmulatorError
+from instruction import opcode_str_to_int
+from objfile import is_object, read_object
+
+CC_TABLE = np.frombuffer(CC_BITS, dtype=np.uint8)
+
+def sext(words, bits): 
+    # two's complement in uint16 arithmetic, which wraps like the machine does
+    sign = np.uint16(1 << (bits - 1))
+    return (words & np.uint16((1 << bits) - 1)) - ((words & sign) << np.uint16(1))
+
+# N LC-3 machines executed in lockstep: registers (N x 8), PCs, condition codes and memories
+# (N x 64K) are NumPy arrays, and each step fetches one instruction for every active machine and
+# applies each opcode's handler to the machines whose instruction has that opcode at once.
+# Machines that halt or fault are retired from the active set with their reason, and the others
+# keep stepping.
+class LockstepEmulator: 
+    def __init__(self, n): 
+        self.n = n
+        self.memory = np.zeros((n, MEMORY_SIZE), dtype=np.uint16)
+        self.reg = np.zeros((n, 8), dtype=np.uint16)
+        self.pc = np.full(n, 0x3000, dtype=np.uint16)
+        self.cc = np.full(n, 2, dtype=np.uint8)
+        self.user = np.zeros(n, dtype=bool)
+        self.steps = np.zeros(n, dtype=np.int64)
+        self.reasons = [None] * n
+        self.active = np.arange(n)
+        self.seconds = 0.0
+
+        self.handlers = [self.reserved] * 16
+        for name, opcode in opcode_str_to_int.items(): 
+            if hasattr(self, 'exec_' + name): 
+                self.handlers[opcode] = getattr(self, 'exec_' + name)
+
+    @property
+    def mips(self): 
+        return int(self.steps.sum()) / self.seconds / 1e6 if self.seconds else 0.0
+
+    def select(self, machines): 
+        return slice(None) if machines is None else np.asarray(machines)
+
+    def load(self, words, orig, machines=None): 
+        rows = self.select(machines)
+        self.memory[rows, orig:orig + len(words)] = np.asarray(words, dtype=np.uint16)
+        self.pc[rows] = orig
+
+    def load_image(self, filename, machines=None): 
+        if is_object(filename): 
+            module = read_object(filename)
+            segments = module.segments()
+            if module.relocations() or not segments: 
+                raise EmulatorError(f'{filename} is not a linked object')
+            for segment in reversed(segments): 
+                self.load(module.segment_words(segment), segment.orig, machines)
+            return segments[0].orig
+        words = read_image(filename)
+        self.load(words[1:], words[0], machines)
+        return words[0]
+
+    # the handler still returns the retired machines' PCs: past a HALT, or at the instruction
+    # that faulted (which, as in Emulator, doesn't count as executed)
+    def retire(self, rows, reason): 
+        for row in rows.tolist(): 
+            self.reasons[row] = reason
+        if reason != 'halt': 
+            self.steps[rows] -= 1
+        self.done[rows] = True
+
+    def run(self, max_steps=None): 
+        start = time.perf_counter()
+        self.done = np.zeros(self.n, dtype=bool)
+        step = 0
+        while len(self.active) and (max_steps is None or step < max_steps): 
+            rows = self.active
+            pcs = self.pc[rows]
+            words = self.memory[rows, pcs]
+            next_pcs = pcs + np.uint16(1)
+            opcodes = words >> 12
+            self.steps[rows] += 1
+            for opcode in np.flatnonzero(np.bincount(opcodes, minlength=16)): 
+                mask = opcodes == opcode
+                self.pc[rows[mask]] = self.handlers[opcode](rows[mask], words[mask], next_pcs[mask])
+
+            if self.done[rows].any(): 
+                self.active = rows[~self.done[rows]]
+            step += 1
+
+        self.seconds += time.perf_counter() - start
+        return self.results()
+
+    def results(self): 
+        active = set(self.active.tolist())
+        return [
+            {
+                'halted': self.reasons[row] == 'halt', 
+                'reason': self.reasons[row] or ('running' if row in active else None), 
+                'pc': int(self.pc[row]), 
+                'steps': int(self.steps[row]), 
+                'registers': self.reg[row].tolist(), 
+            }
+            for row in range(self.n)
+        ]
+
+    def set_result(self, rows, dr, values, set_cc=True): 
+        self.reg[rows, dr] = values
+        if set_cc: 
+            self.cc[rows] = CC_TABLE[values]
+
+    def exec_br(self, rows, words, pcs): 
+        taken = (self.cc[rows] & ((words >> 9) & 7)) != 0
+        return np.where(taken, pcs + sext(words, 9), pcs)
+
+    def exec_add(self, rows, words, pcs): 
+        operand = np.where(words & 0x20, sext(words, 5), self.reg[rows, words & 7])
+        self.set_result(rows, (words >> 9) & 7, self.reg[rows, (words >> 6) & 7] + operand)
+        return pcs
+
+    def exec_and(self, rows, words, pcs): 
+        operand = np.where(words & 0x20, sext(words, 5), self.reg[rows, words & 7])
+        self.set_result(rows, (words >> 9) & 7, self.reg[rows, (words >> 6) & 7] & operand)
+        return pcs
+
+    def exec_not(self, rows, words, pcs): 
+        self.set_result(rows, (words >> 9) & 7, ~self.reg[rows, (words >> 6) & 7])
+        return pcs
+
+    def exec_jmp(self, rows, words, pcs): 
+        return self.reg[rows, (words >> 6) & 7]
+
+    def exec_jsr(self, rows, words, pcs): 
+        targets = np.where(words & 0x800, pcs + sext(words, 11), self.reg[rows, (words >> 6) & 7])
+        self.reg[rows, 7] = pcs
+        return targets
+
+    def exec_ld(self, rows, words, pcs): 
+        self.set_result(rows, (words >> 9) & 7, self.memory[rows, pcs + sext(words, 9)])
+        return pcs
+
+    def exec_ldi(self, rows, words, pcs): 
+        self.set_result(rows, (words >> 9) & 7, self.memory[rows, self.memory[rows, pcs + sext(words, 9)]])
+        return pcs
+
+    def exec_ldr(self, rows, words, pcs): 
+        self.set_result(rows, (words >> 9) & 7, self.memory[rows, self.reg[rows, (words >> 6) & 7] + sext(words, 6)])
+        return pcs
+
+    def exec_lea(self, rows, words, pcs): 
+        self.set_result(rows, (words >> 9) & 7, pcs + sext(words, 9), set_cc=False)
+        return pcs
+
+    def exec_st(self, rows, words, pcs): 
+        self.memory[rows, pcs + sext(words, 9)] = self.reg[rows, (words >> 9) & 7]
+        return pcs
+
+    def exec_sti(self, rows, words, pcs): 
+        self.memory[rows, self.memory[rows, pcs + sext(words, 9)]] = self.reg[rows, (words >> 9) & 7]
+        return pcs
+
+    def exec_str(self, rows, words, pcs): 
+        self.memory[rows, self.reg[rows, (words >> 6) & 7] + sext(words, 6)] = self.reg[rows, (words >> 9) & 7]
+        return pcs
+
+    def exec_rti(self, rows, words, pcs): 
+        user = self.user[rows]
+        self.retire(rows[user], 'privilege mode violation: RTI in user mode')
+        sp = self.reg[rows, 6]
+        targets = self.memory[rows, sp]
+        psr = self.memory[rows, sp + np.uint16(1)]
+        ok, psr = rows[~user], psr[~user]
+        self.user[ok] = (psr & 0x8000) != 0
+        self.cc[ok] = np.where(np.isin(psr & 7, list(CC_VALUES)), psr & 7, 2)
+        self.reg[ok, 6] = sp[~user] + np.uint16(2)
+        return np.where(user, pcs - np.uint16(1), targets)
+
+    # like Emulator: service routines come from the trap vector table, and HALT with none
+    # installed stops the machine
+    def exec_trap(self, rows, words, pcs): 
+        vectors = words & 0xFF
+        targets = self.memory[rows, vectors]
+        missing = targets == 0
+        halt = missing & (vectors == HALT_VECTOR)
+        self.retire(rows[halt], 'halt')
+        for vector in np.unique(vectors[missing & ~halt]).tolist(): 
+            fault = missing & ~halt & (vectors == vector)
+            self.retire(rows[fault], f'no service routine for TRAP x{vector:02X}')
+        self.reg[rows[~missing], 7] = pcs[~missing]
+        return np.where(missing, np.where(halt, pcs, pcs - np.uint16(1)), targets)
+
+    def reserved(self, rows, words, pcs): 
+        for word in np.unique(words).tolist(): 
+            self.retire(rows[words == word], f'illegal opcode in x{word:04X}')
+        return pcs - np.uint16(1)
+
+def main(): 
+    if len(sys.argv) < 2 or '-h' in sys.argv or '--help' in sys.argv: 
+        print('$ python lockstep.py {program.lc3} [machines] [max steps]')
+        sys.exit(1)
+
+    machines = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    emulator = LockstepEmulator(machines)
+    emulator.load_image(sys.argv[1])
+    results = emulator.run(int(sys.argv[3]) if len(sys.argv) > 3 else None)
+
+    reasons = {}
+    for result in results: 
+        reasons[result['reason']] = reasons.get(result['reason'], 0) + 1
+    print(f'[ INFO ] {machines} machines, {int(emulator.steps.sum())} instructions in {emulator.seconds:.3f}s ({emulator.mips:.2f} MIPS)')
+    for reason, count in reasons.items(): 
+        print(f'  {reason}: {count}')
+
+if __name__ == '__main__': 
+    main()
@@ -0,0 +1,229 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from encoder import region_words, WORD_RUN, ZERO_RUN
+
+MAGIC = b'APHO'
+OBJECT_VERSION = 2
+# magic, version, flags, module name (offset in the string table), section count; padded to 16
+# bytes and followed by the section table
+HEADER = struct.Struct('<4sHHII4x')
+# tag, array typecode, item size, item count, file offset. Every section is one column of a
+# table, starts on an 8-byte boundary and is little-endian, so a mapped file can be cast to
+# arrays in place.
+SECTION = struct.Struct('<4scxHII')
+ALIGN = 8
+
+# header flags: LINKED objects have no relocations left and load as they are
+LINKED = 1
+HAS_LINES = 2
+
+# segment kinds: ZEROS segments are a length with no words behind them
+WORDS = 0
+ZEROS = 1
+
+# symbol flags
+EXTERNAL = 1
+
+# columns: segments (address, kind, length in words, start in WORD), the words of every
+# segment back to back, symbols (name, address, segment, flags), relocations (index in WORD,
+# symbol, width of the PC-relative field, source line), the PC -> source line map (sorted by
+# address) and the NUL-terminated strings
+COLUMNS = {
+    b'SORG': 'H', b'SKND': 'H', b'SLEN': 'I', b'SOFF': 'I',
+    b'WORD': 'H',
+    b'YNAM': 'I', b'YVAL': 'H', b'YSEG': 'H', b'YFLG': 'B',
+    b'RWRD': 'I', b'RSYM': 'H', b'RBIT': 'B', b'RLIN': 'I',
+    b'LADR': 'H', b'LLIN': 'I',
+    b'STRS': 'B',
+}
+
+Segment = namedtuple('Segment', 'orig kind length start')
+Symbol = namedtuple('Symbol', 'name value segment flags')
+
+def align(offset, alignment=ALIGN): 
+    return (offset + alignment - 1) // alignment * alignment
+
+# images are raw words, so check the version too before taking one for an object
+def is_object(filename): 
+    with open(filename, 'rb') as f: 
+        return f.read(6) == HEADER.pack(MAGIC, OBJECT_VERSION, 0, 0, 0)[:6]
+
+# An assembled or linked module as a set of columns. Built by the assembler and linker from
+# arrays; read back by read_object() as views into the mapped file, so loading costs a header
+# parse however large the module is (on big-endian hosts the columns are swapped copies).
+class ObjectModule: 
+    def __init__(self, name, flags=0, columns=None, name_offset=0): 
+        self.flags = flags
+        self.columns = { tag: array(typecode) for tag, typecode in COLUMNS.items() }
+        self._strings = None
+        if columns is None: 
+            name_offset = self.add_string(name)
+        else: 
+            self.columns.update(columns)
+        self.name_offset = name_offset
+        self.name = self.string(name_offset)
+
+    def __getitem__(self, tag): 
+        return self.columns[tag]
+
+    @property
+    def words(self): 
+        return self.columns[b'WORD']
+
+    def segments(self): 
+        columns = self.columns
+        return [Segment(*fields) for fields in zip(columns[b'SORG'], columns[b'SKND'], columns[b'SLEN'], columns[b'SOFF'])]
+
+    # a ZEROS segment's words are made up here, so callers that can skip them should
+    def segment_words(self, segment: Segment): 
+        if segment.kind == ZEROS: 
+            return array('H', bytes(2 * segment.length))
+        return self.words[segment.start:segment.start + segment.length]
+
+    def string(self, offset): 
+        if self._strings is None: 
+            self._strings = bytes(self.columns[b'STRS'])
+        return self._strings[offset:self._strings.index(0, offset)].decode()
+
+    def symbols(self): 
+        columns = self.columns
+        names = [self.string(offset) for offset in columns[b'YNAM']]
+        return [Symbol(*fields) for fields in zip(names, columns[b'YVAL'], columns[b'YSEG'], columns[b'YFLG'])]
+
+    def relocations(self): 
+        return len(self.columns[b'RWRD'])
+
+    # source line of the word at addr, or None without a line map
+    def line_of(self, addr): 
+        addresses = self.columns[b'LADR']
+        idx = bisect_right(addresses, addr) - 1
+        if idx < 0 or addresses[idx] != addr: 
+            return None
+        return self.columns[b'LLIN'][idx]
+
+    # builders, for modules written by the assembler and linker
+    def add_string(self, text): 
+        strings = self.columns[b'STRS']
+        offset = len(strings)
+        strings.frombytes(text.encode() + b'\0')
+        self._strings = None
+        return offset
+
+    def add_segment(self, orig, words, kind=WORDS, length=None): 
+        columns = self.columns
+        columns[b'SORG'].append(orig)
+        columns[b'SKND'].append(kind)
+        columns[b'SLEN'].append(len(words) if length is None else length)
+        columns[b'SOFF'].append(len(columns[b'WORD']))
+        if kind != ZEROS: 
+            columns[b'WORD'].extend(words)
+        return len(columns[b'SORG']) - 1
+
+    def add_symbol(self, name, value, segment=0, flags=0): 
+        columns = self.columns
+        columns[b'YNAM'].append(self.add_string(name))
+        columns[b'YVAL'].append(value)
+        columns[b'YSEG'].append(segment)
+        columns[b'YFLG'].append(flags)
+        return len(columns[b'YNAM']) - 1
+
+    def add_relocation(self, word, symbol, bits, line): 
+        columns = self.columns
+        columns[b'RWRD'].append(word)
+        columns[b'RSYM'].append(symbol)
+        columns[b'RBIT'].append(bits)
+        columns[b'RLIN'].append(line)
+
+    def add_lines(self, orig, lines): 
+        self.columns[b'LADR'].extend(range(orig, orig + len(lines)))
+        self.columns[b'LLIN'].extend(lines)
+        self.flags |= HAS_LINES
+
+    # module assembled with --module from its regions (address order, see encoder.py), one
+    # segment each. Labels and the relocations' pcs ((pc, bits, label, line) for each use of an
+    # .external label) count from origin; lines are the source line of each store entry.
+    @classmethod
+    def build(cls, name, regions, origin, symbol_table, relocations, lines=None) -> 'ObjectModule': 
+        module = cls(os.path.basename(name))
+        for region in regions: 
+            if region.kind == ZERO_RUN: 
+                module.add_segment(region.addr, (), ZEROS, region.data)
+                continue
+            words = region_words(region)
+            module.add_segment(region.addr, words)
+            if lines is not None: 
+                run = lines[region.index:region.index + len(words)] if region.kind == WORD_RUN else [lines[region.index]] * len(words)
+                module.add_lines(region.addr, run)
+
+        starts = [region.addr for region in regions]
+        def locate(pc): 
+            addr = (origin + pc) & 0xFFFF
+            segment = max(bisect_right(starts, addr) - 1, 0)
+            return addr, segment
+
+        for label, pc in symbol_table.items(): 
+            addr, segment = locate(pc)
+            module.add_symbol(label, addr, segment)
+        ids = {}
+        for pc, bits, label, line in relocations: 
+            if label not in ids: 
+                ids[label] = module.add_symbol(label, 0, flags=EXTERNAL)
+            addr, segment = locate(pc)
+            word = module[b'SOFF'][segment] + addr - module[b'SORG'][segment]
+            module.add_relocation(word, ids[label], bits, line or 0)
+        if not relocations: 
+            module.flags |= LINKED
+        return module
+
+def write_object(filename, module: ObjectModule): 
+    columns = [(tag, column) for tag, column in module.columns.items() if len(column)]
+    offset = align(HEADER.size + SECTION.size * len(columns))
+    table = []
+    for tag, column in columns: 
+        table.append(SECTION.pack(tag, COLUMNS[tag].encode(), column.itemsize, len(column), offset))
+        offset = align(offset + column.itemsize * len(column))
+
+    with open(filename, 'wb') as f: 
+        f.write(HEADER.pack(MAGIC, OBJECT_VERSION, module.flags, module.name_offset, len(columns)))
+        f.write(b''.join(table))
+        for tag, column in columns: 
+            f.write(bytes(align(f.tell()) - f.tell()))
+            if sys.byteorder == 'big' and column.itemsize > 1: 
+                column = array(column.typecode, column)
+                column.byteswap()
+            f.write(column.tobytes())
+        f.write(bytes(align(f.tell()) - f.tell()))
+
+# maps the file; columns are memoryviews cast to their type, sharing the page cache
+def read_object(filename) -> ObjectModule: 
+    with open(filename, 'rb') as f: 
+        try: 
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: 
+            mapped = b''
+    view = memoryview(mapped)
+    if len(view) < HEADER.size or HEADER.unpack_from(view)[:2] != (MAGIC, OBJECT_VERSION): 
+        raise ValueError(f'{filename} is not a version {OBJECT_VERSION} Aphid object')
+    _, _, flags, name, count = HEADER.unpack_from(view)
+
+    columns = {}
+    for idx in range(count): 
+        tag, typecode, size, length, offset = SECTION.unpack_from(view, HEADER.size + idx * SECTION.size)
+        typecode = typecode.decode()
+        if COLUMNS.get(tag) != typecode or size != array(typecode).itemsize or offset % ALIGN or offset + size * length > len(view): 
+            raise ValueError(f'{filename}: bad section {tag!r}')
+        column = view[offset:offset + size * length].cast(typecode)
+        if sys.byteorder == 'big' and size > 1: 
+            column = array(typecode, column)
+            column.byteswap()
+        columns[tag] = column
+
+    module = ObjectModule(None, flags, columns, name)
+    module.mapped = mapped
+    return module
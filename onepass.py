@@ -0,0 +1,110 @@
+from array import array
+
+from encoder import encoding_cache, string_words, to_big_endian
+from errors import AssemblerError
+from stream import StreamingAssembler
+
+# Single-pass assembler: every line is encoded as soon as it is parsed. Uses of labels that are
+# not defined yet are encoded with a zero offset and recorded as fixups, which are patched (and
+# range checked) when the label is defined. Words are streamed to the output in blocks; a fixup
+# whose word was already flushed is patched in place in the output file. .orig blocks must come
+# in ascending order, since words are only ever appended.
+class OnePassAssembler(StreamingAssembler): 
+    def parse(self): 
+        pass
+
+    def encode(self): 
+        output_fn = self.filename[:-2] + '.lc3'
+        self.words = array('H')
+        self.flushed = 0
+        self.end = 0
+        # label -> [(word index, unpatched word, spec, field, pc, line)]
+        self.fixups = {}
+
+        try: 
+            with open(output_fn, 'w+b') as self.output: 
+                pc = 0
+                for spec, values, refs, line_no in self.parse_lines(self.read_tokens()): 
+                    if spec.size != 1: 
+                        pc = self.place(spec, values, pc, line_no)
+                        continue
+
+                    patches = []
+                    if refs: 
+                        for slot, field in enumerate(spec.fields): 
+                            if not refs & (1 << slot): 
+                                continue
+                            label = values[slot]
+                            if label in self.symbol_table: 
+                                values[slot] = self.resolve_label(spec, field, label, pc, line_no)
+                            else: 
+                                values[slot] = 0
+                                patches.append((label, field))
+
+                    key = (spec.id, *values)
+                    word = encoding_cache.get(key)
+                    if word is None: 
+                        word = encoding_cache[key] = spec.encode(values)
+
+                    idx = self.flushed + len(self.words)
+                    for label, field in patches: 
+                        self.fixups.setdefault(label, []).append((idx, word, spec, field, pc, line_no))
+                    self.words.append(word)
+
+                    if len(self.words) >= self.block_size: 
+                        self.flush()
+                    pc += 1
+
+                self.flush()
+                self.output.truncate(2 * self.end)
+
+            for label, pending in self.fixups.items(): 
+                _, _, spec, field, pc, line_no = pending[0]
+                self.resolve_label(spec, field, label, pc, line_no)
+        except BaseException: 
+            self.discard(output_fn)
+            raise
+
+        self.log(f'Successfully wrote bytes to {output_fn}')
+
+    # .orig, .blkw and .stringz: the words after them go to their own place in the file, which
+    # is left as a hole until then
+    def place(self, spec, values, pc, line_no): 
+        if spec.mnemonic == '.orig' and self.flushed + len(self.words) == 0: 
+            # the image's first word
+            self.words.append(values[0])
+        elif spec.mnemonic == '.stringz': 
+            self.words.extend(string_words(values[0]))
+
+        pc = self.advance(spec, values, pc)
+        idx = 1 + pc
+        end = self.flushed + len(self.words)
+        if idx != end: 
+            if idx < end: 
+                raise AssemblerError('.orig blocks must be in ascending order with --one-pass', line_no)
+            self.flush()
+            self.flushed = idx
+            self.end = max(self.end, idx)
+        return pc
+
+    def define_label(self, token, pc): 
+        super().define_label(token, pc)
+        for idx, word, spec, field, use_pc, line_no in self.fixups.pop(token.value, ()): 
+            offset = self.resolve_label(spec, field, token.value, use_pc, line_no)
+            self.patch(idx, word | ((offset & field.mask) << field.shift))
+
+    def patch(self, idx, word): 
+        if idx >= self.flushed: 
+            self.words[idx - self.flushed] = word
+            return
+
+        self.output.seek(2 * idx)
+        self.output.write(to_big_endian(array('H', [word])))
+        self.output.seek(0, 2)
+
+    def flush(self): 
+        self.output.seek(2 * self.flushed)
+        self.output.write(to_big_endian(self.words))
+        self.flushed += len(self.words)
+        self.end = max(self.end, self.flushed)
+        self.words = array('H')
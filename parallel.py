@@ -0,0 +1,76 @@
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import Assembler
+from chunks import parse_chunk, define_chunk_labels, patch_chunk
+from encoder import write_image
+from errors import AssemblerError
+
+# runs in a worker: errors are returned rather than raised so the parent can report them in
+# source order no matter which worker finished first
+def assemble_chunk(job): 
+    text, first_line = job
+    try: 
+        return True, parse_chunk(text, first_line)
+    except AssemblerError as ex: 
+        return False, ex
+
+# Assembler that tokenizes, parses and encodes chunks of the source in a process pool. Each
+# worker returns its chunk's words with label operands left as 0 plus a row per label use; the
+# parent stitches the chunks together in order, builds the symbol table from the per-chunk label
+# definitions and patches the label offsets, which is cheap next to the parsing.
+class ParallelAssembler(Assembler): 
+    def __init__(self, filename, workers=None, min_chunk_lines=1024, verbose=True): 
+        super().__init__(filename, verbose)
+        self.workers = workers or os.cpu_count()
+        self.min_chunk_lines = min_chunk_lines
+
+    def parse(self): 
+        self.first_pass()
+        self.second_pass()
+
+        if not self.verbose: 
+            return 
+
+        print('[ DEBUG ] Symbol Table after first pass: ')
+        for k, v in self.symbol_table.items(): 
+            print(k, v)
+        print()
+
+    def encode(self): 
+        output_fn = self.filename[:-2] + '.lc3'
+        with open(output_fn, 'wb') as f: 
+            write_image(f, self.image)
+
+        self.log(f'Successfully wrote bytes to {output_fn}')
+
+    def first_pass(self): 
+        lines = self.contents.split('\n')
+        # a few chunks per worker so a slow chunk doesn't leave the rest of the pool idle
+        size = max(self.min_chunk_lines, math.ceil(len(lines) / (4 * self.workers)))
+        starts = range(0, len(lines), size)
+        jobs = [('\n'.join(lines[start:start + size]), start + 1) for start in starts]
+
+        self.chunks = []
+        pc = 0
+        pool = ProcessPoolExecutor(self.workers)
+        try: 
+            for ok, result in pool.map(assemble_chunk, jobs): 
+                if not ok: 
+                    raise result
+
+                define_chunk_labels(self, result, pc)
+                self.chunks.append((result, pc))
+                pc += result[0]
+                if result[1]: 
+                    break
+        finally: 
+            pool.shutdown(cancel_futures=True)
+
+    def second_pass(self): 
+        self.image = array('H')
+        for record, base_pc in self.chunks: 
+            words, _, _ = patch_chunk(self, record, base_pc)
+            self.image.extend(words)
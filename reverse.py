@@ -0,0 +1,237 @@
+import os
+import tempfile
+from array import array
+
+from emulator import Emulator, Break, COND, sext
+from errors import EmulatorError
+from jit import ADD, AND, NOT, LD, LDI, LDR, LEA, ST, STI, STR, JSR, TRAP, RTI
+from snapshot import Snapshot
+
+# undo record per instruction: pc, kind, old destination register, old condition value, store
+# address, old memory value, and two more old values (R0 and R7 for TRAP, R6 and PSR for RTI)
+RECORD_WORDS = 8
+
+# kind: destination register in the low 4 bits (NO_DEST for none), plus
+NO_DEST = 8
+MEMORY = 0x10
+TRAP_REGS = 0x20
+RTI_REGS = 0x40
+
+def undo_kind(word): 
+    opcode = word >> 12
+    kind = NO_DEST
+    if opcode in (ADD, AND, NOT, LD, LDI, LDR, LEA): 
+        kind = (word >> 9) & 7
+    elif opcode == JSR: 
+        kind = 7
+    elif opcode == TRAP: 
+        kind |= TRAP_REGS
+    elif opcode == RTI: 
+        kind |= RTI_REGS
+    if opcode in (ST, STI, STR): 
+        kind |= MEMORY
+    return kind
+
+# A stretch of history: the state at step start (a checkpoint) and the undo records of the
+# instructions run since. Segments that were spilled keep their records and checkpoint on disk.
+class Segment: 
+    def __init__(self, start, checkpoint): 
+        self.start = start
+        self.checkpoint = checkpoint
+        self.journal = array('H')
+        self.path = None
+
+    def __len__(self): 
+        return len(self.journal) // RECORD_WORDS
+
+    # the snapshot file is mapped once reloaded, so every spill gets new files rather than
+    # overwriting ones that may still be in use
+    def spill(self, directory): 
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix=f'segment-{self.start}-')
+        with os.fdopen(fd, 'wb') as f: 
+            self.journal.tofile(f)
+        self.checkpoint.save(self.path + '.snapshot')
+        self.journal = None
+        self.checkpoint = None
+
+    def reload(self): 
+        self.journal = array('H')
+        with open(self.path, 'rb') as f: 
+            self.journal.frombytes(f.read())
+        self.checkpoint = Snapshot.load(self.path + '.snapshot')
+
+    def discard(self): 
+        if self.path is not None: 
+            for path in (self.path, self.path + '.snapshot'): 
+                try: 
+                    os.remove(path)
+                except OSError: 
+                    pass
+
+# Emulator that can run backwards. Every word is decoded into an entry that appends an undo record
+# (what the instruction is about to overwrite) to the current segment before running the word's
+# own entry; every segment_steps instructions a new segment starts with a snapshot. Stepping back
+# n instructions undoes n records, whatever the length of the run, and goto() jumps far back by
+# restoring the checkpoint before the target and replaying from there. At most memory_segments
+# segments are kept in memory: older ones are spilled to spill_dir and reloaded when history
+# reaches them or, without one, dropped. Device state and console I/O are not undone.
+class ReversibleEmulator(Emulator): 
+    def __init__(self, verbose=True, segment_steps=1 << 16, memory_segments=8, spill_dir=None, **options): 
+        super().__init__(verbose, **options)
+        self.segment_steps = segment_steps
+        self.memory_segments = memory_segments
+        self.spill_dir = spill_dir
+        if spill_dir is not None: 
+            os.makedirs(spill_dir, exist_ok=True)
+        self.segments = []
+        self.journal = None
+
+    # history starts (again) from the current state
+    def checkpoint(self): 
+        self.close()
+        self.begin_segment()
+
+    # drops history, and the files of spilled segments
+    def close(self): 
+        for segment in self.segments: 
+            segment.discard()
+        self.segments = []
+
+    # runs between instructions, possibly in the middle of run(), where steps is out of date; each
+    # instruction adds one record, so a segment starts where the last one's records end
+    def begin_segment(self): 
+        last = self.segments[-1] if self.segments else None
+        segment = Segment(self.steps if last is None else last.start + len(last), self.snapshot())
+        self.segments.append(segment)
+        self.journal = segment.journal
+        in_memory = [segment for segment in self.segments if segment.journal is not None]
+        for old in in_memory[:-self.memory_segments]: 
+            if self.spill_dir is not None: 
+                old.spill(self.spill_dir)
+            else: 
+                self.segments.remove(old)
+
+    def load_image(self, filename): 
+        orig = super().load_image(filename)
+        self.checkpoint()
+        return orig
+
+    def decode(self, addr): 
+        op = super().decode(addr)
+        op = self.decoded[addr] = self.decode_journaled(addr, op)
+        return op
+
+    def decode_journaled(self, pc, op): 
+        reg, memory = self.reg, self.memory
+        word = memory[pc]
+        kind = undo_kind(word)
+        dest = kind & 0xF if kind & 0xF != NO_DEST else COND
+        opcode = word >> 12
+        static = (pc + 1 + sext(word, 9)) & 0xFFFF
+        base, offset = (word >> 6) & 7, sext(word, 6)
+        first, second = (0, 7) if kind & TRAP_REGS else (6, 6)
+        limit = self.segment_steps * RECORD_WORDS
+
+        def journaled(): 
+            journal = self.journal
+            if len(journal) >= limit: 
+                self.pc = pc
+                self.begin_segment()
+                journal = self.journal
+            addr = 0
+            if kind & MEMORY: 
+                if opcode == ST: 
+                    addr = static
+                elif opcode == STI: 
+                    addr = memory[static]
+                else: 
+                    addr = (reg[base] + offset) & 0xFFFF
+            extra = self.psr if kind & RTI_REGS else reg[second]
+            journal.extend((pc, kind, reg[dest], reg[COND], addr, memory[addr], reg[first], extra))
+            try: 
+                return op()
+            except (Break, EmulatorError): 
+                # the instruction didn't run
+                del journal[-RECORD_WORDS:]
+                raise
+        return journaled
+
+    # steps recorded in history, oldest first
+    @property
+    def first_step(self): 
+        return self.segments[0].start if self.segments else self.steps
+
+    def undo(self): 
+        segment = self.segments[-1]
+        while len(segment) == 0: 
+            if len(self.segments) == 1: 
+                raise EmulatorError(f'no history before step {segment.start}')
+            segment.discard()
+            self.segments.pop()
+            segment = self.segments[-1]
+            if segment.journal is None: 
+                segment.reload()
+            self.journal = segment.journal
+
+        journal = segment.journal
+        pc, kind, old, cond, addr, value, first, extra = journal[-RECORD_WORDS:]
+        del journal[-RECORD_WORDS:]
+        reg = self.reg
+        if kind & MEMORY and addr not in self.bus.registers: 
+            self.store(addr, value)
+        if kind & 0xF != NO_DEST: 
+            reg[kind & 0xF] = old
+        if kind & TRAP_REGS: 
+            reg[0], reg[7] = first, extra
+        if kind & RTI_REGS: 
+            reg[6] = first
+            self.psr = extra
+        reg[COND] = cond
+        self.pc = pc
+        self.steps -= 1
+        self.halted = False
+        return kind, addr
+
+    def reverse_step(self, count=1): 
+        for done in range(count): 
+            if self.steps == self.first_step: 
+                return done
+            self.undo()
+        return count
+
+    # runs backwards until the instruction at a breakpoint (whose condition holds) or one that
+    # wrote a watched word is undone, or history runs out
+    def reverse_cont(self): 
+        breakpoints, conditions, watchpoints = self.breakpoints, self.conditions, self.watchpoints
+        done = 0
+        while self.steps > self.first_step: 
+            kind, addr = self.undo()
+            done += 1
+            if kind & MEMORY and watchpoints[addr]: 
+                break
+            if breakpoints[self.pc]: 
+                condition = conditions.get(self.pc)
+                if condition is None or condition(self.reg, self.memory): 
+                    break
+        return done
+
+    # moves to step, by undoing records when that's cheaper than replaying from the checkpoint the
+    # step's segment starts with. Replaying re-runs the instructions, console input included.
+    def goto(self, step): 
+        if not self.first_step <= step <= self.steps: 
+            raise EmulatorError(f'step {step} is not in history ({self.first_step}-{self.steps})')
+        idx = max(idx for idx, segment in enumerate(self.segments) if segment.start <= step)
+        segment = self.segments[idx]
+        if self.steps - step <= step - segment.start: 
+            return self.reverse_step(self.steps - step)
+
+        for later in self.segments[idx + 1:]: 
+            later.discard()
+        del self.segments[idx + 1:]
+        if segment.journal is None: 
+            segment.reload()
+        segment.journal = array('H')
+        self.journal = segment.journal
+        self.restore(segment.checkpoint)
+        self.steps = segment.start
+        return self.run(step - segment.start)
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from assembler import Assembler
+from encoder import materialize, to_big_endian
+from errors import AssemblerError
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f'aphid-{os.getuid()}.sock')
+
+# Long-lived assembler over a local Unix socket. Requests and responses are one JSON object per
+# line:
+#   {"op": "assemble", "source": "...", "filename": "prog.s"}  -> image (base64, big-endian), symbols
+#   {"op": "assemble", "path": "prog.s", "write": true}        -> same, also writes prog.lc3
+#   {"op": "stats"}, {"op": "ping"}, {"op": "shutdown"}
+# The interpreter, the spec/lexer tables and the encoding cache stay warm between requests, and
+# results for recently seen sources are kept in an LRU keyed by content hash.
+class AssemblerServer: 
+    def __init__(self, path=DEFAULT_SOCKET, cache_entries=256): 
+        self.path = path
+        self.cache_entries = cache_entries
+        self.results = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.stopped = None
+
+    def assemble(self, source, filename): 
+        key = hashlib.sha256(source.encode()).digest()
+        if key in self.results: 
+            self.results.move_to_end(key)
+            self.hits += 1
+            return self.results[key]
+
+        try: 
+            assembler = Assembler(filename, verbose=False, source=source)
+            assembler.parse()
+            image = to_big_endian(materialize(assembler.encode_regions())).tobytes()
+            result = {
+                'ok': True, 
+                'image': base64.b64encode(image).decode(), 
+                'words': len(image) // 2, 
+                'symbols': assembler.symbol_table, 
+                'diagnostics': [], 
+            }
+        except AssemblerError as ex: 
+            result = {
+                'ok': False, 
+                'diagnostics': [{ 'severity': 'error', 'message': ex.message, 'line': ex.line, 'col': ex.col }], 
+            }
+
+        self.results[key] = result
+        if len(self.results) > self.cache_entries: 
+            self.results.popitem(last=False)
+        return result
+
+    def dispatch(self, request): 
+        op = request.get('op')
+        if op == 'assemble': 
+            filename = request.get('filename') or request.get('path') or '<source>'
+            if 'source' in request: 
+                source = request['source']
+            else: 
+                with open(request['path'], 'r') as f: 
+                    source = f.read()
+
+            result = self.assemble(source, filename)
+            if request.get('write') and result['ok']: 
+                with open(filename[:-2] + '.lc3', 'wb') as f: 
+                    f.write(base64.b64decode(result['image']))
+            return result
+
+        if op == 'ping': 
+            return { 'ok': True }
+        if op == 'stats': 
+            return { 'ok': True, 'requests': self.requests, 'cache_hits': self.hits, 'cached': len(self.results) }
+        if op == 'shutdown': 
+            self.stopped.set()
+            return { 'ok': True }
+        return { 'ok': False, 'error': f'unknown op: {op}' }
+
+    async def handle(self, reader, writer): 
+        try: 
+            while line := await reader.readline(): 
+                start = time.perf_counter()
+                self.requests += 1
+                try: 
+                    response = self.dispatch(json.loads(line))
+                except Exception as ex: 
+                    response = { 'ok': False, 'error': f'{type(ex).__name__}: {ex}' }
+                response = { **response, 'seconds': round(time.perf_counter() - start, 6) }
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally: 
+            writer.close()
+
+    async def serve(self): 
+        self.stopped = asyncio.Event()
+        if os.path.exists(self.path): 
+            os.unlink(self.path)
+
+        server = await asyncio.start_unix_server(self.handle, path=self.path, limit=1 << 26)
+        print(f'[ INFO ] Aphid assembler listening on {self.path}')
+        try: 
+            async with server: 
+                await self.stopped.wait()
+        finally: 
+            os.unlink(self.path)
+
+# blocking client for scripts and editor integrations
+def request(message: dict, path=DEFAULT_SOCKET) -> dict: 
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock: 
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b'\n')
+        with sock.makefile('rb') as f: 
+            return json.loads(f.readline())
+
+def main(): 
+    path = DEFAULT_SOCKET
+    if '--socket' in sys.argv: 
+        path = sys.argv[sys.argv.index('--socket') + 1]
+
+    try: 
+        asyncio.run(AssemblerServer(path).serve())
+    except KeyboardInterrupt: 
+        pass
+
+if __name__ == '__main__': 
+    main()
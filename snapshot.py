@@ -0,0 +1,98 @@
+import marshal
+import mmap
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+
+# memory is tracked in pages of 256 words; stores mark their page in Emulator.dirty
+PAGE_SHIFT = 8
+PAGE_WORDS = 1 << PAGE_SHIFT
+PAGE_BYTES = 2 * PAGE_WORDS
+PAGES = (1 << 16) >> PAGE_SHIFT
+
+ZERO_PAGE = bytes(PAGE_BYTES)
+
+MAGIC = b'APHS'
+SNAPSHOT_VERSION = 1
+# magic, version, page words, pages, unique pages, R0-R7, PC, PSR, halted, device state bytes;
+# padded to 64 bytes and followed by the page table (a u16 unique page index per page), the
+# marshalled device state and, aligned to PAGE_BYTES, the unique pages. Little-endian.
+HEADER = struct.Struct('<4sHHHH8HHHB3xI24x')
+
+def share_page(view) -> bytes: 
+    data = bytes(view)
+    return ZERO_PAGE if data == ZERO_PAGE else data
+
+def align(offset, alignment): 
+    return (offset + alignment - 1) // alignment * alignment
+
+# State of an Emulator at one point. Pages are immutable buffers; a snapshot taken after another
+# one reuses the previous snapshot's buffer for every page that wasn't stored to in between, so
+# taking one costs a copy of the dirty pages only.
+@dataclass(frozen=True)
+class Snapshot: 
+    pages: tuple
+    reg: tuple
+    pc: int
+    psr: int
+    halted: bool = False
+    devices: dict = field(default_factory=dict)
+
+    def page_bytes(self, page): 
+        data = self.pages[page]
+        if sys.byteorder == 'big': 
+            words = array('H')
+            words.frombytes(data)
+            words.byteswap()
+            return words.tobytes()
+        return data
+
+    def save(self, filename): 
+        unique = {}
+        table = array('H', (unique.setdefault(bytes(page), len(unique)) for page in self.pages))
+        devices = marshal.dumps(self.devices)
+        header = HEADER.pack(MAGIC, SNAPSHOT_VERSION, PAGE_WORDS, PAGES, len(unique), *self.reg, self.pc, self.psr, self.halted, len(devices))
+        if sys.byteorder == 'big': 
+            table.byteswap()
+
+        with open(filename, 'wb') as f: 
+            f.write(header)
+            f.write(table.tobytes())
+            f.write(devices)
+            f.write(bytes(align(f.tell(), PAGE_BYTES) - f.tell()))
+            pages = [None] * len(unique)
+            for page, idx in zip(range(PAGES), table if sys.byteorder == 'little' else table.tolist()): 
+                pages[idx] = pages[idx] or self.page_bytes(page)
+            for data in pages: 
+                f.write(data)
+
+    # maps the file and uses its pages in place, so processes that load the same snapshot share
+    # its memory through the page cache instead of each parsing a copy
+    @classmethod
+    def load(cls, filename) -> 'Snapshot': 
+        with open(filename, 'rb') as f: 
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, page_words, pages, unique, *rest = HEADER.unpack_from(view)
+        if magic != MAGIC or version != SNAPSHOT_VERSION or page_words != PAGE_WORDS or pages != PAGES: 
+            raise ValueError(f'{filename} is not a version {SNAPSHOT_VERSION} Aphid snapshot')
+        reg, (pc, psr, halted, device_bytes) = rest[:8], rest[8:]
+
+        table = array('H')
+        table.frombytes(view[HEADER.size:HEADER.size + 2 * PAGES])
+        offset = HEADER.size + 2 * PAGES
+        devices = marshal.loads(view[offset:offset + device_bytes])
+        offset = align(offset + device_bytes, PAGE_BYTES)
+        data = [view[offset + idx * PAGE_BYTES:offset + (idx + 1) * PAGE_BYTES] for idx in range(unique)]
+        if sys.byteorder == 'big': 
+            table.byteswap()
+            swapped = []
+            for page in data: 
+                words = array('H')
+                words.frombytes(page)
+                words.byteswap()
+                swapped.append(words.tobytes())
+            data = swapped
+
+        return cls(tuple(data[idx] for idx in table), tuple(reg), pc, psr, bool(halted), devices)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+from array import array
+
+from assembler import Assembler
+from encoder import encode_regions, region_length, region_words, write_image, ZERO_RUN
+from errors import AssemblerError
+from ir import InstructionStore
+from lexer import tokenize
+
+# Assembler that never holds the whole program in memory: the source is read and tokenized in
+# chunks, pass 1 spills fixed-size blocks of parsed instructions to a temporary file, and pass 2
+# streams them back, resolves labels and writes the encoded words block by block. Only the label
+# table grows with the source. Each region is written at its offset from the first .orig, so
+# gaps and .blkw reservations become holes in the file rather than written zeros.
+class StreamingAssembler(Assembler): 
+    def __init__(self, filename, chunk_size=1 << 20, block_size=1 << 16, verbose=True): 
+        self.filename = filename
+        self.verbose = verbose
+        self.symbol_table = {}
+        self.module = False
+        self.externals = set()
+        self.relocations = []
+        self.origin = None
+        self.pc = 0
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+        self.spill = None
+
+        self.log(f'[ INFO ] Input file: {filename} (streaming)')
+
+    def read_tokens(self): 
+        line_no = 1
+        rest = ''
+        with open(self.filename, 'r') as f: 
+            while True: 
+                chunk = f.read(self.chunk_size)
+                if not chunk: 
+                    break
+
+                # only tokenize up to the last full line, the tail is carried into the next chunk
+                chunk = rest + chunk
+                cut = chunk.rfind('\n') + 1
+                rest = chunk[cut:]
+                yield from tokenize(chunk[:cut], line_no)
+                line_no += chunk.count('\n', 0, cut)
+
+        if rest: 
+            yield from tokenize(rest, line_no)
+
+    def parse(self): 
+        self.first_pass()
+
+        if not self.verbose: 
+            return 
+
+        print('[ DEBUG ] Symbol Table after first pass: ')
+        for k, v in self.symbol_table.items(): 
+            print(k, v)
+        print()
+
+    def first_pass(self): 
+        self.spill = tempfile.TemporaryFile()
+        store = self.instructions = InstructionStore()
+        for spec, values, refs, line_no in self.parse_lines(self.read_tokens()): 
+            store.append(spec, values, refs, line_no)
+            if len(store) >= self.block_size: 
+                store.spill(self.spill)
+        store.spill(self.spill)
+
+    # pass 2: resolve and encode one spilled block at a time, straight into the output file
+    def encode(self): 
+        output_fn = self.filename[:-2] + '.lc3'
+        store = self.instructions
+        self.pc = 0
+        self.spill.seek(0)
+        try: 
+            spans = []
+            with open(output_fn, 'wb') as f: 
+                while store.load(self.spill): 
+                    pc = self.pc
+                    self.resolve(store)
+                    if self.origin is None: 
+                        continue
+                    if not spans: 
+                        write_image(f, array('H', [self.origin]))
+                    for region in encode_regions(store, self.origin, pc)[0]: 
+                        spans.append(self.write_region(f, region))
+                if spans: 
+                    f.truncate(2 * (1 + max(end for _, end in spans) - self.origin))
+
+            spans.sort()
+            for (_, end), (start, _) in zip(spans, spans[1:]): 
+                if start < end: 
+                    raise AssemblerError(f'x{start:04X} is already taken by an earlier .orig block (up to x{end - 1:04X})')
+        except BaseException: 
+            self.discard(output_fn)
+            raise
+
+        store.clear()
+        self.spill.close()
+        self.spill = None
+        self.log(f'Successfully wrote bytes to {output_fn}')
+
+    # an image cut short by an error must not be mistaken for a good one
+    def discard(self, output_fn): 
+        try: 
+            os.remove(output_fn)
+        except OSError: 
+            pass
+
+    # returns the (start, end) addresses the region covers
+    def write_region(self, f, region): 
+        start, end = region.addr, region.addr + region_length(region)
+        if start < self.origin: 
+            raise AssemblerError(f'x{start:04X} is below the first .orig (x{self.origin:04X}); assemble without --stream')
+        f.seek(2 * (1 + start - self.origin))
+        if region.kind != ZERO_RUN: 
+            write_image(f, region_words(region))
+        return start, end
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from bench import generate
+from cache import open_cache, CachedAssembler
+from emulator import read_image
+from encoder import materialize
+from errors import AssemblerError
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def plain_image(path): 
+    assembler = Assembler(path, verbose=False)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+def cached(path, cache, chunk_lines=16): 
+    assembler = CachedAssembler(path, cache, chunk_lines, verbose=False)
+    assembler.parse()
+    assembler.encode()
+    return assembler, read_image(path[:-2] + '.lc3')
+
+def error_line(assembler): 
+    with pytest.raises(AssemblerError) as info: 
+        assembler.first_pass()
+        assembler.second_pass()
+    return info.value.line
+
+# a cold run, a whole-file hit, then edits that move every label after them and so re-encode
+# references reaching across the edit from chunks that are still hits (small chunks, so some do)
+@pytest.mark.parametrize('seed', range(2))
+def test_matches_plain(tmp_path, seed): 
+    cache = open_cache(os.path.join(tmp_path, 'cache'))
+    source = generate(2000, seed)
+    path = write_source(tmp_path, 'gen.s', source)
+    assembler, image = cached(path, cache)
+    assert image == plain_image(path)
+    assert assembler.hits == 0 and assembler.misses > 0
+
+    assembler, image = cached(path, cache)
+    assert image == plain_image(path)
+    assert assembler.hits == assembler.misses == 0
+
+    lines = source.split('\n')
+    reencoded = 0
+    for at, line in ((1000, '    .BLKW #2'), (300, '    ADD R0, R0, #1'), (1700, '    .STRINGZ "ab"')): 
+        lines.insert(at, line)
+        write_source(tmp_path, 'gen.s', '\n'.join(lines))
+        assembler, image = cached(path, cache)
+        assert image == plain_image(path)
+        assert assembler.hits > 0 and assembler.misses > 0
+        reencoded += assembler.reencoded
+    assert reencoded > 0
+
+# errors raised while parsing a chunk and while putting the chunks together both point at the
+# line the plain assembler reports
+@pytest.mark.parametrize('bad', ('    ADD R0, R0, #99', 'L0: ADD R0, R0, #1', '    BR NOWHERE'))
+def test_error_line(tmp_path, bad): 
+    lines = generate(1000, 0).split('\n')
+    lines.insert(700, bad)
+    path = write_source(tmp_path, 'bad.s', '\n'.join(lines))
+    cache = open_cache(os.path.join(tmp_path, 'cache'))
+    expected = error_line(Assembler(path, verbose=False))
+    assert expected == 701
+    assert error_line(CachedAssembler(path, cache, chunk_lines=64, verbose=False)) == expected
+
+def test_more_than_one_orig(tmp_path): 
+    path = write_source(tmp_path, 'two.s', '.ORIG x3000\n    ADD R0, R0, #1\n.ORIG x3100\n    ADD R0, R0, #2\n')
+    with pytest.raises(AssemblerError, match='more than one .orig'): 
+        cached(path, open_cache(os.path.join(tmp_path, 'cache')))
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import disassembler
+from assembler import Assembler
+from disassembler import Disassembly, disassemble
+from encoder import materialize, write_image
+
+# labels in both directions, a JSR, a .blkw and data words that decode as .fill
+PROGRAM = '''
+.ORIG x3000
+START: LEA R0, MSG
+    LD R1, COUNT
+LOOP: ADD R1, R1, #-1
+    BRp LOOP
+    JSR SUB
+    STI R1, PTR
+    BRnzp START
+SUB: AND R2, R2, #0
+    RET
+COUNT: .FILL #5
+PTR: .FILL xFE06
+    .BLKW #2
+MSG: .STRINGZ "hi"
+.END
+'''
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def assemble(source): 
+    assembler = Assembler('test.s', verbose=False, source=source)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+# the instruction text of a listing line, keeping label lines and the target comment
+def listing_source(orig, lines): 
+    return f'.ORIG x{orig:04X}\n' + '\n'.join(line if line.endswith(':') else line[14:] for line in lines) + '\n.END\n'
+
+# every 16-bit word disassembles to text that assembles back to it
+def test_every_word(): 
+    words = np.arange(1 << 16, dtype=np.uint16)
+    block = Disassembly(words)
+    source = '.ORIG x0000\n' + '\n'.join(block.text(idx) for idx in range(len(block))) + '\n.END\n'
+    assert list(assemble(source)) == [0] + words.tolist()
+
+# a listing with the module's symbols is itself a source for the same image
+def test_listing_with_symbols(tmp_path): 
+    path = write_source(tmp_path, 'prog.s', PROGRAM)
+    assembler = Assembler(path, verbose=False, module=True)
+    assembler.first_pass()
+    assembler.second_pass()
+    assembler.encode_object()
+    image = assemble(PROGRAM)
+
+    blocks = disassemble(path[:-2] + '.obj')
+    lines = [line for block in blocks for line in block.lines()]
+    assert 'loop:' in lines and 'sub:' in lines
+    assert assemble(listing_source(blocks[0].orig, lines)) == image
+
+def test_range(): 
+    image = assemble(PROGRAM)
+    block = Disassembly(image[1:], image[0])
+    lines = list(block.lines(0x3002, 0x3004))
+    assert [line[:5] for line in lines if not line.endswith(':')] == ['x3002', 'x3003']
+    assert list(block.lines(0x2000, 0x3001)) == list(block.lines(None, 0x3001))
+    assert list(block.lines(0x4000)) == []
+
+@pytest.mark.parametrize('args, expected', (
+    (['x3002', 'x3004'], ['x3002', 'x3003']),
+    (['x'], '[ ERROR ] invalid address: x'),
+    (['x3000', 'x10000'], '[ ERROR ] address out of range: x10000'),
+))
+def test_main(tmp_path, monkeypatch, capsys, args, expected): 
+    image_fn = os.path.join(tmp_path, 'prog.lc3')
+    with open(image_fn, 'wb') as f: 
+        write_image(f, assemble(PROGRAM))
+    monkeypatch.setattr(sys, 'argv', ['disassembler.py', image_fn, *args])
+    if isinstance(expected, str): 
+        with pytest.raises(SystemExit) as info: 
+            disassembler.main()
+        assert info.value.code == 1
+        assert capsys.readouterr().out.strip() == expected
+    else: 
+        disassembler.main()
+        assert [line[:5] for line in capsys.readouterr().out.splitlines()] == expected
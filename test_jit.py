@@ -0,0 +1,136 @@
+import io
+
+from assembler import Assembler
+from console import Console
+from debugger import Debugger
+from emulator import Emulator, WATCH_READ
+from errors import EmulatorError
+from encoder import materialize
+from jit import JitEmulator
+
+# ADD R0, R0, R1 twice, TRAP xFD (no service routine yet), TRAP x25
+FAULTING_TRAP = [0x1001, 0x1001, 0xF0FD, 0xF025]
+
+# sums ARR in a loop that compiles to one looping block; a read watchpoint on ARR+6 stops it
+# in the middle of a later pass
+ARRAY_SUM = '''
+.ORIG x3000
+    LEA R1, ARR
+    AND R2, R2, #0
+    LD R3, N
+LOOP: LDR R4, R1, #0
+    ADD R2, R2, R4
+    ADD R1, R1, #1
+    ADD R3, R3, #-1
+    BRp LOOP
+    TRAP x25
+N: .FILL #10
+ARR: .FILL #1
+    .FILL #2
+    .FILL #3
+    .FILL #4
+    .FILL #5
+    .FILL #6
+    .FILL #7
+    .FILL #8
+    .FILL #9
+    .FILL #10
+'''
+
+# a looping block whose STR walks up to its own first word on a later pass
+SELF_MODIFYING = '''
+.ORIG x3000
+    LD R3, N
+    LEA R1, BUF
+    LD R5, INC
+    BR LOOP
+BUF: .BLKW #3
+LOOP: ADD R2, R2, #1
+    STR R5, R1, #0
+    ADD R1, R1, #1
+    ADD R3, R3, #-1
+    BRp LOOP
+    TRAP x25
+N: .FILL #8
+INC: ADD R0, R0, #1
+'''
+
+# the same with the store first, before anything in the pass sets the condition codes
+STORE_FIRST = '''
+.ORIG x3000
+    LD R3, N
+    LEA R1, BUF
+    LD R5, INC
+    ADD R3, R3, #0
+    BR LOOP
+BUF: .BLKW #3
+LOOP: STR R5, R1, #0
+    ADD R1, R1, #1
+    ADD R2, R2, #1
+    LEA R6, BUF
+    ADD R3, R3, #-1
+    BRp LOOP
+    TRAP x25
+N: .FILL #8
+INC: ADD R0, R0, #1
+'''
+
+def assemble(source): 
+    assembler = Assembler('test.s', verbose=False, source=source)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions()), assembler.symbol_table
+
+# (pc, steps, registers, memory) at every stop until the machine halts
+def stops(emulator, source, watch=None): 
+    image, symbols = assemble(source)
+    emulator.load(image[1:], image[0])
+    emulator.pc = image[0]
+    if watch is not None: 
+        label, offset = watch
+        Debugger(emulator).watch(image[0] + symbols[label] + offset, WATCH_READ)
+    states = []
+    while not emulator.halted and len(states) < 100: 
+        emulator.run()
+        states.append((emulator.pc, emulator.steps, tuple(emulator.reg), bytes(emulator.memory)))
+    return states
+
+def console(): 
+    return Console.from_bytes(b'', output=io.BytesIO())
+
+def check(source, watch=None): 
+    expected = stops(Emulator(verbose=False, console=console()), source, watch)
+    for threshold in (1, 2, 16): 
+        assert stops(JitEmulator(verbose=False, console=console(), threshold=threshold), source, watch) == expected
+
+def test_watchpoint_in_loop(): 
+    check(ARRAY_SUM, ('arr', 6))
+
+def test_self_modifying_loop(): 
+    check(SELF_MODIFYING)
+
+def test_self_modifying_loop_before_cc(): 
+    check(STORE_FIRST)
+
+# (error, pc, steps, registers) at the faulting TRAP, then the same once a service routine
+# (a RET at x4000) is installed and the machine is resumed until it halts
+def fault_and_resume(emulator): 
+    emulator.load(FAULTING_TRAP, 0x3000)
+    emulator.pc = 0x3000
+    emulator.reg[1] = 1
+    states = []
+    try: 
+        emulator.run()
+    except EmulatorError as ex: 
+        states.append((str(ex), emulator.pc, emulator.steps, tuple(emulator.reg)))
+    emulator.load([0xC1C0], 0x4000)
+    emulator.store(0xFD, 0x4000)
+    emulator.run()
+    states.append((emulator.halted, emulator.pc, emulator.steps, tuple(emulator.reg)))
+    return states
+
+def test_faulting_trap(): 
+    expected = fault_and_resume(Emulator(verbose=False, console=console(), native_traps=False))
+    assert expected[0][1] == 0x3002
+    for threshold in (1, 2): 
+        assert fault_and_resume(JitEmulator(verbose=False, console=console(), native_traps=False, threshold=threshold)) == expected
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from emulator import read_image
+from encoder import materialize
+from errors import LinkerError
+from linker import Linker
+
+# each module uses labels from the other, both backwards and forwards in memory, with 9- and
+# 11-bit offsets; a .blkw sits between MAIN's code and its data
+MAIN = '''
+.ORIG x3000
+.EXTERNAL PRINT, TABLE, SIZE
+    LEA R0, TABLE
+    LD R1, SIZE
+    JSR PRINT
+    ST R1, COUNT
+    TRAP x25
+    .BLKW #40
+COUNT: .FILL #0
+MSG: .STRINGZ "main"
+.END
+'''
+
+LIB = '''
+.ORIG x3080
+.EXTERNAL COUNT, MSG
+PRINT: LD R2, COUNT
+    LEA R0, MSG
+    BRz DONE
+    ADD R1, R1, #-1
+DONE: RET
+SIZE: .FILL #4
+TABLE: .FILL x0001
+    .FILL x0002
+    .BLKW #2
+.END
+'''
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def plain_image(path): 
+    assembler = Assembler(path, verbose=False)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+def assemble_module(tmp_path, name, source): 
+    path = write_source(tmp_path, name, source)
+    assembler = Assembler(path, verbose=False, module=True)
+    assembler.first_pass()
+    assembler.second_pass()
+    assembler.encode_object()
+    return path[:-2] + '.obj'
+
+def link(paths, output_fn): 
+    linker = Linker(paths, verbose=False)
+    linker.link()
+    linker.write(output_fn)
+    return read_image(output_fn)
+
+# the same program as one source with two .orig blocks and no .external lines
+def combined(tmp_path): 
+    strip = lambda source: '\n'.join(line for line in source.split('\n') if not line.startswith(('.EXTERNAL', '.END')))
+    return write_source(tmp_path, 'all.s', strip(MAIN) + strip(LIB) + '.END\n')
+
+@pytest.mark.parametrize('order', ((MAIN, LIB), (LIB, MAIN)))
+def test_matches_plain(tmp_path, order): 
+    paths = [assemble_module(tmp_path, f'm{idx}.s', source) for idx, source in enumerate(order)]
+    assert link(paths, os.path.join(tmp_path, 'out.lc3')) == plain_image(combined(tmp_path))
+
+def test_undefined_external(tmp_path): 
+    paths = [assemble_module(tmp_path, 'main.s', MAIN)]
+    with pytest.raises(LinkerError, match=r'undefined external print \(line 6\)'): 
+        link(paths, os.path.join(tmp_path, 'out.lc3'))
+
+def test_overlap(tmp_path): 
+    paths = [assemble_module(tmp_path, 'main.s', MAIN), assemble_module(tmp_path, 'lib.s', LIB.replace('x3080', 'x3010'))]
+    with pytest.raises(LinkerError, match='overlaps'): 
+        link(paths, os.path.join(tmp_path, 'out.lc3'))
+
+def test_out_of_range(tmp_path): 
+    paths = [assemble_module(tmp_path, 'main.s', MAIN), assemble_module(tmp_path, 'lib.s', LIB.replace('x3080', 'x3400'))]
+    with pytest.raises(LinkerError, match='out of range of a 9-bit offset'): 
+        link(paths, os.path.join(tmp_path, 'out.lc3'))
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from emulator import Emulator
+from encoder import materialize, write_image, region_words, ZERO_RUN
+from errors import EmulatorError
+from objfile import is_object, read_object, write_object, LINKED, HAS_LINES, ZEROS
+
+# two .orig blocks, .blkw runs that become ZEROS segments and a .stringz
+SOURCE = '''
+.ORIG x3000
+    LEA R0, MSG
+    LD R1, DATA
+    ADD R1, R1, #-1
+    BRp #-2
+    TRAP x25
+    .BLKW #30
+MSG: .STRINGZ "object"
+.ORIG x3080
+DATA: .FILL #3
+    .BLKW #5
+    .FILL x00FF
+.END
+'''
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def assemble(path, module=False): 
+    assembler = Assembler(path, verbose=False, module=module)
+    assembler.first_pass()
+    assembler.second_pass()
+    return assembler
+
+def assemble_object(tmp_path, source): 
+    assembler = assemble(write_source(tmp_path, 'prog.s', source), module=True)
+    assembler.encode_object()
+    return assembler, os.path.join(tmp_path, 'prog.obj')
+
+# segments, words, symbols and the line map read back from the mapped file are the assembler's
+def test_round_trip(tmp_path): 
+    assembler, path = assemble_object(tmp_path, SOURCE)
+    module = read_object(path)
+    assert is_object(path)
+    assert module.name == 'prog.s'
+    assert module.flags == LINKED | HAS_LINES
+
+    regions = assembler.encode_regions()
+    segments = module.segments()
+    assert [(segment.orig, segment.kind == ZEROS) for segment in segments] == [(region.addr, region.kind == ZERO_RUN) for region in regions]
+    for segment, region in zip(segments, regions): 
+        if region.kind == ZERO_RUN: 
+            assert segment.length == region.data
+        else: 
+            assert list(module.segment_words(segment)) == list(region_words(region))
+    assert {symbol.name: symbol.value for symbol in module.symbols()} == {label: assembler.origin + pc for label, pc in assembler.symbol_table.items()}
+    assert module.line_of(0x3000) == 3 and module.line_of(0x3080) == 11 and module.line_of(0x2FFF) is None
+
+    # columns read from the mapping write back out unchanged
+    copy = os.path.join(tmp_path, 'copy.obj')
+    write_object(copy, module)
+    with open(path, 'rb') as a, open(copy, 'rb') as b: 
+        assert a.read() == b.read()
+
+def test_loads_like_image(tmp_path): 
+    _, path = assemble_object(tmp_path, SOURCE)
+    image_fn = os.path.join(tmp_path, 'prog.lc3')
+    with open(image_fn, 'wb') as f: 
+        write_image(f, materialize(assemble(os.path.join(tmp_path, 'prog.s')).encode_regions()))
+    assert not is_object(image_fn)
+
+    expected, loaded = Emulator(verbose=False), Emulator(verbose=False)
+    expected.load_image(image_fn)
+    loaded.load_image(path)
+    assert loaded.pc == expected.pc == 0x3000
+    assert loaded.memory == expected.memory
+
+def test_unresolved_externals(tmp_path): 
+    _, path = assemble_object(tmp_path, '.ORIG x3000\n.EXTERNAL FAR\n    JSR FAR\n.END\n')
+    assert read_object(path).relocations() == 1
+    with pytest.raises(EmulatorError, match='link it first'): 
+        Emulator(verbose=False).load_image(path)
+
+def test_truncated(tmp_path): 
+    _, path = assemble_object(tmp_path, SOURCE)
+    with open(path, 'rb') as f: 
+        data = f.read()
+    with open(path, 'wb') as f: 
+        f.write(data[:len(data) // 2])
+    with pytest.raises(ValueError, match='bad section'): 
+        read_object(path)
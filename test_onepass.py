@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from bench import generate
+from emulator import read_image
+from encoder import materialize
+from errors import AssemblerError
+from onepass import OnePassAssembler
+
+# ascending blocks with a gap, .blkw reservations and strings, and forward references that are
+# patched after their words were flushed
+SPARSE = '''
+.ORIG x3000
+    LEA R0, MSG2
+    LD R1, COUNT
+LOOP: ADD R1, R1, #-1
+    BRp LOOP
+    LD R2, DATA
+    JSR SUB
+    TRAP x25
+COUNT: .FILL #5
+MSG2: .STRINGZ "bye"
+    .BLKW #3
+SUB: RET
+.ORIG x3100
+DATA: .FILL x1234
+    .BLKW #20
+MSG: .STRINGZ "hello, world"
+    .FILL #-1
+.END
+'''
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def plain_image(path): 
+    assembler = Assembler(path, verbose=False)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+def one_pass_image(path, **options): 
+    assembler = OnePassAssembler(path, verbose=False, **options)
+    assembler.parse()
+    assembler.encode()
+    return read_image(path[:-2] + '.lc3')
+
+# small blocks so most fixups land in words already written to the file
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_plain(tmp_path, seed): 
+    path = write_source(tmp_path, 'gen.s', generate(3000, seed))
+    assert one_pass_image(path, chunk_size=4096, block_size=13) == plain_image(path)
+
+@pytest.mark.parametrize('block_size', (1, 4, 1 << 16))
+def test_sparse_blocks(tmp_path, block_size): 
+    path = write_source(tmp_path, 'sparse.s', SPARSE)
+    assert one_pass_image(path, chunk_size=64, block_size=block_size) == plain_image(path)
+
+def test_descending_blocks(tmp_path): 
+    path = write_source(tmp_path, 'down.s', '.ORIG x3100\n    ADD R0, R0, #1\n.ORIG x3000\n    ADD R0, R0, #2\n')
+    with pytest.raises(AssemblerError, match='ascending'): 
+        one_pass_image(path)
+
+@pytest.mark.parametrize('source', (
+    '.ORIG x3000\n    ADD R0, R0, #1\n    BR NOWHERE\n',
+    '.ORIG x3000\n    BR FAR\n    .BLKW #300\nFAR: ADD R0, R0, #1\n',
+))
+def test_error_removes_output(tmp_path, source): 
+    path = write_source(tmp_path, 'bad.s', source)
+    with pytest.raises(AssemblerError): 
+        one_pass_image(path, block_size=1)
+    assert not os.path.exists(path[:-2] + '.lc3')
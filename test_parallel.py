@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from bench import generate
+from emulator import read_image
+from encoder import materialize
+from errors import AssemblerError
+from parallel import ParallelAssembler
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def plain_image(path): 
+    assembler = Assembler(path, verbose=False)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+# small chunks so label uses and definitions land in different workers
+def parallel_assembler(path): 
+    return ParallelAssembler(path, 2, min_chunk_lines=64, verbose=False)
+
+def error_line(assembler): 
+    with pytest.raises(AssemblerError) as info: 
+        assembler.first_pass()
+        assembler.second_pass()
+    return info.value.line
+
+@pytest.mark.parametrize('seed', range(2))
+def test_matches_plain(tmp_path, seed): 
+    path = write_source(tmp_path, 'gen.s', generate(2000, seed))
+    assembler = parallel_assembler(path)
+    assembler.parse()
+    assembler.encode()
+    assert read_image(path[:-2] + '.lc3') == plain_image(path)
+
+# errors from a worker, from stitching the labels together and from patching offsets
+@pytest.mark.parametrize('bad', ('    ADD R0, R0, #99', 'L0: ADD R0, R0, #1', '    BR NOWHERE'))
+def test_error_line(tmp_path, bad): 
+    lines = generate(1000, 0).split('\n')
+    lines.insert(700, bad)
+    path = write_source(tmp_path, 'bad.s', '\n'.join(lines))
+    expected = error_line(Assembler(path, verbose=False))
+    assert expected == 701
+    assert error_line(parallel_assembler(path)) == expected
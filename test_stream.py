@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from assembler import Assembler
+from bench import generate
+from emulator import read_image
+from encoder import materialize
+from errors import AssemblerError
+from stream import StreamingAssembler
+
+# two blocks with a gap between them, .blkw reservations and strings
+SPARSE = '''
+.ORIG x3000
+    LEA R0, MSG2
+    LD R1, COUNT
+LOOP: ADD R1, R1, #-1
+    BRp LOOP
+    LD R2, DATA
+    TRAP x25
+COUNT: .FILL #5
+MSG2: .STRINGZ "bye"
+    .BLKW #3
+.ORIG x3100
+DATA: .FILL x1234
+    .BLKW #20
+MSG: .STRINGZ "hello, world"
+    .FILL #-1
+.END
+'''
+
+def write_source(tmp_path, name, source): 
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as f: 
+        f.write(source)
+    return path
+
+def plain_image(path): 
+    assembler = Assembler(path, verbose=False)
+    assembler.first_pass()
+    assembler.second_pass()
+    return materialize(assembler.encode_regions())
+
+def stream_image(path, **options): 
+    assembler = StreamingAssembler(path, verbose=False, **options)
+    assembler.parse()
+    assembler.encode()
+    return read_image(path[:-2] + '.lc3')
+
+# small chunks and blocks so lines and spilled blocks both straddle boundaries
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_plain(tmp_path, seed): 
+    path = write_source(tmp_path, 'gen.s', generate(3000, seed))
+    assert stream_image(path, chunk_size=4096, block_size=97) == plain_image(path)
+
+@pytest.mark.parametrize('block_size', (1, 5, 1 << 16))
+def test_sparse_blocks(tmp_path, block_size): 
+    path = write_source(tmp_path, 'sparse.s', SPARSE)
+    assert stream_image(path, chunk_size=64, block_size=block_size) == plain_image(path)
+
+# streaming writes the image from the first .orig on
+def test_block_below_first_orig(tmp_path): 
+    path = write_source(tmp_path, 'below.s', '.ORIG x3100\n    ADD R0, R0, #1\n.ORIG x3000\n    ADD R0, R0, #2\n')
+    with pytest.raises(AssemblerError, match='below the first .orig'): 
+        stream_image(path)
+
+def test_error_removes_output(tmp_path): 
+    path = write_source(tmp_path, 'bad.s', '.ORIG x3010\n    ADD R0, R0, #1\n    BR NOWHERE\n')
+    with pytest.raises(AssemblerError): 
+        stream_image(path, block_size=1)
+    assert not os.path.exists(path[:-2] + '.lc3')
@@ -0,0 +1,272 @@
+import mmap
+import struct
+import sys
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from emulator import Emulator, Stop, Break, MAX_STEPS, MEMORY_SIZE, CC_BITS, COND, sext
+from errors import EmulatorError
+from jit import ADD, AND, NOT, LD, LDI, LDR, LEA, ST, STI, STR, JSR, TRAP
+
+MAGIC = b'APHT'
+TRACE_VERSION = 1
+# magic, version, record size, flags; padded to 16 bytes and followed by the records
+HEADER = struct.Struct('<4sHHI4x')
+# step (mod 2**32), pc, instruction word, destination register value, memory address, memory
+# value, flags. Little-endian, 16 bytes.
+RECORD = struct.Struct('<IHHHHHH')
+
+# record flags, besides the nzp condition codes after the instruction in the low 3 bits
+HAS_VALUE = 0x08
+LOAD = 0x10
+STORE = 0x20
+
+# header flag for traces where record n isn't step first + n: filtered or wrapped ones
+SPARSE = 1
+
+Record = namedtuple('Record', 'step pc word value addr data flags')
+
+# destination register for each opcode, or None
+DESTINATIONS = [None] * 16
+for opcode in (ADD, AND, NOT, LD, LDI, LDR, LEA): 
+    DESTINATIONS[opcode] = 'dr'
+for opcode in (JSR, TRAP): 
+    DESTINATIONS[opcode] = 7
+
+# 'x3000-x30FF,x4000' -> [(0x3000, 0x3100), (0x4000, 0x4001)]
+def parse_ranges(text): 
+    ranges = []
+    for part in text.split(','): 
+        first, _, last = part.partition('-')
+        start = int(first.lstrip('xX'), 16)
+        end = int(last.lstrip('xX'), 16) if last else start
+        ranges.append((start, end + 1))
+    return ranges
+
+# Appends fixed-width records to a preallocated buffer. With a path, a full buffer is written to
+# the file in one block; without one, the buffer is a ring that keeps the latest capacity records
+# (save() writes them out, oldest first). ranges limits recording to instructions whose address
+# is in one of the (start, end) ranges.
+class TraceRecorder: 
+    def __init__(self, path=None, capacity=1 << 16, ranges=None): 
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.count = 0
+        self.wrapped = False
+        self.written = 0
+        self.traced = bytearray(b'\1' * MEMORY_SIZE) if ranges is None else bytearray(MEMORY_SIZE)
+        for start, end in ranges or (): 
+            self.traced[start:end] = b'\1' * (end - start)
+        self.flags = 0 if ranges is None else SPARSE
+        self.file = None
+        if path is not None: 
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, TRACE_VERSION, RECORD.size, self.flags))
+
+    def __len__(self): 
+        return self.written + (self.capacity if self.wrapped else self.count)
+
+    def record(self, step, pc, word, value, addr, data, flags): 
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, step & 0xFFFFFFFF, pc, word, value, addr, data, flags)
+        self.count += 1
+        if self.count == self.capacity: 
+            self.advance()
+
+    # called when the buffer is full
+    def advance(self): 
+        if self.file is not None: 
+            self.flush()
+        else: 
+            self.count = 0
+            self.wrapped = True
+
+    def flush(self): 
+        if self.file is None: 
+            return
+        self.file.write(memoryview(self.buffer)[:self.count * RECORD.size])
+        self.file.flush()
+        self.written += self.count
+        self.count = 0
+
+    def close(self): 
+        if self.file is not None: 
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    # the buffered records, oldest first
+    def data(self) -> bytes: 
+        end = self.count * RECORD.size
+        if not self.wrapped: 
+            return bytes(self.buffer[:end])
+        return bytes(self.buffer[end:]) + bytes(self.buffer[:end])
+
+    def save(self, path): 
+        with open(path, 'wb') as f: 
+            f.write(HEADER.pack(MAGIC, TRACE_VERSION, RECORD.size, self.flags | (SPARSE if self.wrapped else 0)))
+            f.write(self.data())
+
+# Maps a trace file and reads records in place. Record n is at a fixed offset, so in a trace that
+# recorded every instruction the record for a step is found directly, and in a sparse one by
+# binary search over the records' steps.
+class TraceReader: 
+    def __init__(self, path): 
+        with open(path, 'rb') as f: 
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mapped)
+        magic, version, size, self.flags = HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != TRACE_VERSION or size != RECORD.size: 
+            raise ValueError(f'{path} is not a version {TRACE_VERSION} Aphid trace')
+        self.count = (len(self.view) - HEADER.size) // RECORD.size
+
+    def __len__(self): 
+        return self.count
+
+    def __getitem__(self, n) -> Record: 
+        if n < 0: 
+            n += self.count
+        if not 0 <= n < self.count: 
+            raise IndexError(f'record {n} out of range')
+        return Record(*RECORD.unpack_from(self.view, HEADER.size + n * RECORD.size))
+
+    def __iter__(self): 
+        for fields in RECORD.iter_unpack(self.view[HEADER.size:HEADER.size + self.count * RECORD.size]): 
+            yield Record(*fields)
+
+    def step(self, n): 
+        return RECORD.unpack_from(self.view, HEADER.size + n * RECORD.size)[0]
+
+    # index of the first record at or after step
+    def index(self, step): 
+        if self.count == 0: 
+            return 0
+        if not self.flags & SPARSE: 
+            return min(max(step - self.step(0), 0), self.count)
+        return bisect_left(range(self.count), step & 0xFFFFFFFF, key=self.step)
+
+    def seek(self, step) -> Record: 
+        return self[self.index(step)]
+
+    # records for instructions in [start, end)
+    def select(self, start, end): 
+        return (record for record in self if start <= record.pc < end)
+
+    def close(self): 
+        self.view.release()
+        self.mapped.close()
+
+# Emulator that records an entry in trace for every instruction it runs at a traced address.
+# Traced words are decoded into an entry that wraps the instruction's own entry and takes the
+# step number, with its destination register, memory access and flags worked out at decode time.
+# The memory address of a load or store is computed before the instruction runs and the values
+# after; an instruction that halts or hits a watchpoint is recorded, one stopped at a breakpoint
+# (which hasn't run) or that faulted isn't.
+class TracingEmulator(Emulator): 
+    def __init__(self, verbose=True, trace=None, **options): 
+        super().__init__(verbose, **options)
+        self.trace = TraceRecorder() if trace is None else trace
+
+    def decode(self, addr): 
+        op = super().decode(addr)
+        if self.trace.traced[addr]: 
+            op = self.decoded[addr] = self.decode_traced(addr, op)
+        return op
+
+    def decode_traced(self, pc, op): 
+        reg, memory, trace, cc_bits = self.reg, self.memory, self.trace, CC_BITS
+        pack, size = RECORD.pack_into, RECORD.size
+        word = memory[pc]
+        opcode = word >> 12
+        dest = DESTINATIONS[opcode]
+        if dest == 'dr': 
+            dest = (word >> 9) & 7
+        sr, base, offset = (word >> 9) & 7, (word >> 6) & 7, sext(word, 6)
+        static = (pc + 1 + sext(word, 9)) & 0xFFFF
+        load, store = opcode in (LD, LDI, LDR), opcode in (ST, STI, STR)
+        access = 'static' if opcode in (LD, ST) else 'pointer' if opcode in (LDI, STI) else 'base' if opcode in (LDR, STR) else None
+        flags = (HAS_VALUE if dest is not None else 0) | (LOAD if load else 0) | (STORE if store else 0)
+
+        def record(step, addr): 
+            value = 0 if dest is None else reg[dest]
+            data = value if load else reg[sr] if store else 0
+            pack(trace.buffer, trace.count * size, step & 0xFFFFFFFF, pc, word, value, addr, data, flags | cc_bits[reg[COND]])
+            trace.count += 1
+            if trace.count == trace.capacity: 
+                trace.advance()
+
+        def traced(step): 
+            addr = 0
+            if access == 'static': 
+                addr = static
+            elif access == 'pointer': 
+                addr = memory[static]
+            elif access == 'base': 
+                addr = (reg[base] + offset) & 0xFFFF
+            try: 
+                next_pc = op()
+            except Break: 
+                raise
+            except Stop: 
+                record(step, addr)
+                raise
+            record(step, addr)
+            return next_pc
+        return traced
+
+    def run(self, max_steps=None): 
+        limit = MAX_STEPS if max_steps is None else max_steps
+        decoded, decode, traced = self.decoded, self.decode, self.trace.traced
+        base = self.steps - 1
+        pc = self.pc
+        executed = 0
+        self.halted = False
+        self.hits.clear()
+        start = time.perf_counter()
+        try: 
+            for executed in range(1, limit + 1): 
+                op = decoded[pc]
+                if op is None: 
+                    op = decode(pc)
+                pc = op(base + executed) if traced[pc] else op()
+        except Break: 
+            executed -= 1
+            pc = self.pc
+        except Stop: 
+            pc = self.pc
+        except EmulatorError: 
+            executed -= 1
+            raise
+        finally: 
+            self.pc = pc
+            self.steps += executed
+            self.seconds += time.perf_counter() - start
+            self.console.flush()
+        return executed
+
+def main(): 
+    if len(sys.argv) < 2 or '-h' in sys.argv or '--help' in sys.argv: 
+        print('$ python tracer.py {trace file} [first step] [count]')
+        sys.exit(1)
+
+    try: 
+        reader = TraceReader(sys.argv[1])
+    except (OSError, ValueError) as ex: 
+        print(f'[ ERROR ] {ex}')
+        sys.exit(1)
+
+    first = reader.index(int(sys.argv[2])) if len(sys.argv) > 2 else 0
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    for n in range(first, min(first + count, len(reader))): 
+        record = reader[n]
+        cc = { 4: 'n', 2: 'z', 1: 'p' }.get(record.flags & 7, '-')
+        line = f'{record.step:>10} x{record.pc:04X} x{record.word:04X} {cc}'
+        if record.flags & HAS_VALUE: 
+            line += f' value=x{record.value:04X}'
+        if record.flags & (LOAD | STORE): 
+            line += f' {"load" if record.flags & LOAD else "store"} x{record.addr:04X}=x{record.data:04X}'
+        print(line)
+    print(f'[ INFO ] {len(reader)} records')
+
+if __name__ == '__main__': 
+    main()